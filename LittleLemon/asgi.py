@@ -2,15 +2,101 @@
 ASGI config for LittleLemon project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests are routed with asgi_urls.py, which serves the API's read endpoints with
+async views; run it with an ASGI server, e.g. ``uvicorn LittleLemon.asgi:application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
+import itertools
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-from django.core.asgi import get_asgi_application
+import django
+from asgiref.sync import SyncToAsync, ThreadSensitiveContext
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LittleLemon.settings')
 
+
+class SyncThread(ThreadPoolExecutor):
+    """
+    One of the ASGI_SYNC_THREADS: the single-thread executor that asgiref runs the sync calls
+    of `context` on, counting the calls queued or running on it.
+    """
+
+    def __init__(self, name):
+        super().__init__(max_workers=1, thread_name_prefix=name)
+        self.context = ThreadSensitiveContext()
+        self.pending = 0
+        self._pending_lock = threading.Lock()
+        # Used by sync_to_async() for every call made while self.context is current
+        SyncToAsync.context_to_thread_executor[self.context] = self
+
+    def submit(self, fn, /, *args, **kwargs):
+        with self._pending_lock:
+            self.pending += 1
+        future = super().submit(fn, *args, **kwargs)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._pending_lock:
+            self.pending -= 1
+
+
+class LittleLemonASGIHandler(ASGIHandler):
+    """
+    Django's ASGIHandler with two changes:
+
+    - requests resolve against asgi_urls.py, so the WSGI application keeps ROOT_URLCONF;
+    - thread-sensitive sync code (the ORM, sync middleware and views) runs on a fixed set of
+      ASGI_SYNC_THREADS threads. The stock handler starts a thread, and so a database
+      connection, for every request in flight; at a thousand slow clients that is a thousand
+      threads contending for the GIL.
+
+    A request keeps the thread it is given, which holds its database connection and
+    transactions. It is given the thread with the fewest sync calls queued or running, so a
+    slow export, import or checkout waiting on the write lock keeps its thread to itself while
+    other requests go to the idle ones; threads equally busy take turns.
+    """
+    urlconf = 'LittleLemon.asgi_urls'
+
+    def __init__(self):
+        super().__init__()
+        threads = getattr(settings, 'ASGI_SYNC_THREADS', 4)
+        self.sync_threads = [SyncThread(f'asgi-sync-{i}') for i in range(threads)]
+        self._turns = itertools.count()
+
+    def sync_thread(self):
+        """The least busy of the sync threads, starting the search one further each time."""
+        start = next(self._turns) % len(self.sync_threads)
+        candidates = self.sync_threads[start:] + self.sync_threads[:start]
+        return min(candidates, key=lambda thread: thread.pending)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            raise ValueError(f"Django can only handle ASGI/HTTP connections, not {scope['type']}.")
+        token = SyncToAsync.thread_sensitive_context.set(self.sync_thread().context)
+        try:
+            await self.handle(scope, receive, send)
+        finally:
+            SyncToAsync.thread_sensitive_context.reset(token)
+
+    def create_request(self, scope, body_file):
+        request, error_response = super().create_request(scope, body_file)
+        if request is not None:
+            request.urlconf = self.urlconf  # Resolved per request
+        return request, error_response
+
+
+def get_asgi_application():
+    # django.core.asgi.get_asgi_application() with the handler above
+    django.setup(set_prefix=False)
+    return LittleLemonASGIHandler()
+
+
 application = get_asgi_application()
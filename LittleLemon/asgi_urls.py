@@ -0,0 +1,13 @@
+"""
+URL configuration of the ASGI application (asgi.py).
+
+The API's read endpoints resolve to the async views of LittleLemonAPI/async_urls.py first;
+everything else, and the WSGI application, use urls.py unchanged.
+"""
+from django.urls import include, path
+
+from . import urls
+
+urlpatterns = [
+    path('api/', include('LittleLemonAPI.async_urls')),
+] + urls.urlpatterns
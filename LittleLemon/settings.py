@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'LittleLemonAPI.metrics.RequestMetricsMiddleware',  # First, so its timings cover the whole stack
+    'LittleLemonAPI.routers.ReadReplicaMiddleware',  # Before anything that reads the database
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -72,6 +75,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'LittleLemon.wsgi.application'
 
+# Runs the tests with the throttle store in a temporary directory (LittleLemonAPI/testing.py)
+TEST_RUNNER = 'LittleLemonAPI.testing.TestRunner'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -80,7 +86,46 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        # Write transactions take the lock at BEGIN, where the busy timeout applies (LittleLemonAPI/sqlite.py)
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+        # Keep connections, and their page cache and memory map, across requests
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        # A file-backed test database, so threaded tests wait on locks instead of failing like the shared in-memory one
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    },
+    # Local read replica: a copy of db.sqlite3 refreshed by `python manage.py sync_replica --every 2`.
+    # In production, point it (or more aliases) at real replicas of the primary.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'replica.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+# Safe requests read from these aliases (LittleLemonAPI/routers.py); writes and everything else use
+# 'default'. After a write, a client reads from 'default' for PIN_SECONDS, longer than replicas lag.
+# The pins live in CACHE_ALIAS, which every worker must share (the file-based 'default' below is).
+# Off unless LITTLELEMON_READ_REPLICA is set, since replica.sqlite3 only exists once sync_replica ran.
+DATABASE_ROUTERS = ['LittleLemonAPI.routers.ReadReplicaRouter']
+READ_REPLICAS = {
+    'ALIASES': ['replica'] if os.environ.get('LITTLELEMON_READ_REPLICA') else [],
+    'PIN_SECONDS': 5,
+    'CACHE_ALIAS': 'default',
+}
+
+# Set on every new SQLite connection (LittleLemonAPI/sqlite.py). WAL, which lets reads run while a
+# checkout writes, is stored in the database file instead: switch to it once per deploy with
+# `python manage.py enable_wal`. synchronous=NORMAL is safe with WAL (a power cut can lose the last
+# commits, never corrupt).
+SQLITE_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # ms a writer waits for the lock before "database is locked"
+    'cache_size': -64000,  # KiB of page cache per connection
+    'mmap_size': 256 * 1024 * 1024,  # Read pages through a memory map instead of read() calls
+    'temp_store': 'MEMORY',
 }
 
 
@@ -125,12 +170,33 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# The default cache holds state every worker must agree on: cached roles (invalidated when group
+# membership changes), the catalog version and read-your-writes pins. A file cache is shared by
+# every worker on this host; with several hosts point it at Redis or Memcached instead.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'default',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Token -> user identities for CachedTokenAuthentication, bounded in size and age. Shared like the
+    # default cache, so logging out or deleting a token revokes it on every worker at once.
+    'tokens': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'tokens',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+TOKEN_CACHE_ALIAS = 'tokens'
+
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 5,
 
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'LittleLemonAPI.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -140,16 +206,60 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        'LittleLemonAPI.throttles.SharedAnonRateThrottle',
+        'LittleLemonAPI.throttles.SharedUserRateThrottle',
 ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '2/minute',
         'user': '10/minute',
-        'ten': '10/minuite',
+        'ten': '10/minute',
+}
 }
+
+
+# Read-through cache for menu and category responses (LittleLemonAPI/catalog.py)
+CATALOG_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': 60 * 60,
+    'MAX_BYTES': 8 * 1024 * 1024,
 }
 
+# Shared request counters for the throttles (LittleLemonAPI/throttles.py). The SQLite file is shared by
+# every worker on this host; with several hosts use CacheThrottleStore on a Redis cache alias instead.
+THROTTLE_STORE = {
+    'BACKEND': 'LittleLemonAPI.throttles.SQLiteThrottleStore',
+    'OPTIONS': {'path': BASE_DIR / 'throttle.sqlite3'},
+}
+
+# Broker behind the order event streams (LittleLemonAPI/events.py). LocalBroker reaches streams served by
+# the same process; with several ASGI workers use SQLiteBroker, e.g. {'path': BASE_DIR / 'events.sqlite3'}.
+ORDER_EVENTS = {
+    'BACKEND': 'LittleLemonAPI.events.LocalBroker',
+    'OPTIONS': {},
+}
+
+# Background tasks (LittleLemonAPI/tasks.py), run by `python manage.py run_worker`. Checkout leaves the
+# sales rollups to them, so keep a worker running next to the web server.
+TASKS = {
+    'MAX_ATTEMPTS': 5,
+    'BACKOFF_SECONDS': 2,
+    'MAX_BACKOFF_SECONDS': 600,
+    'LEASE_SECONDS': 300,
+}
+
+# Give each new order to the delivery crew member with the fewest undelivered orders (a background task)
+AUTO_ASSIGN_DELIVERY_CREW = False
+
+# Render menu, cart and order lists from values() rows with compiled serializers (LittleLemonAPI/compiled.py).
+# Output is byte-identical to the regular serializers.
+FAST_SERIALIZERS = False
+
+# Per-view request metrics served at /api/metrics/ (LittleLemonAPI/metrics.py). BUFFER_SIZE is the
+# number of requests kept between two scrapes.
+METRICS = {
+    'ENABLED': True,
+    'BUFFER_SIZE': 8192,
+}
 
 
 DJOSER = {
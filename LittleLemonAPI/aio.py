@@ -0,0 +1,28 @@
+"""
+Helpers for code that runs on the event loop (async_views.py and the async halves of
+authentication.py, roles.py, catalog.py and pagination.py).
+"""
+from asgiref.sync import sync_to_async
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+# Caches that live in the process: a get or set costs microseconds and never waits on I/O
+IN_PROCESS_CACHES = (LocMemCache, DummyCache)
+
+
+async def cache_call(cache, func, *args, **kwargs):
+    """
+    Runs `func`, which reads or writes `cache`, without blocking the event loop.
+
+    In-process caches are called directly: handing a microsecond lookup to a thread would cost
+    more than the lookup. File, database and network caches run in a worker thread.
+    """
+    if isinstance(cache, IN_PROCESS_CACHES):
+        return func(*args, **kwargs)
+    return await sync_to_async(func)(*args, **kwargs)
+
+
+async def alist(queryset):
+    """list(queryset) on the async ORM; prefetch_related() lookups are loaded as well."""
+    return [obj async for obj in queryset]
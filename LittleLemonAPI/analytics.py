@@ -0,0 +1,174 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Sum, When
+from django.db.models.functions import TruncWeek
+
+from .models import Category, DailyCategorySales, DailyItemSales, DailySales, Order, OrderItem, Task
+
+
+def record_order(order, order_items):
+    """Adds a new order to the daily rollups. `order_items` need their menuitem loaded."""
+    _apply(order.date, order.total, order_lines(order_items), sign=1)
+
+
+def record_sales(day, total, lines):
+    """record_order() from an order's figures, for when the order itself may be gone (see tasks.py)."""
+    _apply(day, total, lines, sign=1)
+
+
+def forget_order(order):
+    """Takes a deleted order back out of the daily rollups."""
+    _apply(order.date, order.total, order_lines(order.orderitem_set.select_related('menuitem')), sign=-1)
+
+
+def order_figures(order):
+    """What the rollups count an order under: compare it before and after an edit with update_order()."""
+    return order.date, order.total
+
+
+def update_order(order, before):
+    """
+    Moves an edited order from the figures it was loaded with (`before`, from order_figures())
+    to its current date and total. Its lines need their menuitem loaded.
+    """
+    day, total = before
+    if (day, total) == order_figures(order):
+        return
+    lines = order_lines(order.orderitem_set.all())
+    with transaction.atomic():
+        _apply(day, total, lines, sign=-1)
+        _apply(order.date, order.total, lines, sign=1)
+
+
+def order_lines(order_items):
+    """(menuitem_id, category_id, quantity, price) for each line; `order_items` need their menuitem loaded."""
+    return [(item.menuitem_id, item.menuitem.category_id, item.quantity, item.price) for item in order_items]
+
+
+def _apply(day, total, lines, sign):
+    """
+    Increments the rollups for one order with a fixed number of statements, whatever its size.
+
+    Missing rows are created with zero values first (ignore_conflicts keeps concurrent
+    checkouts from colliding), then every counter is bumped in place with F() expressions.
+    """
+    items = defaultdict(lambda: [0, Decimal(0), None])  # menuitem_id -> [quantity, revenue, category_id]
+    categories = defaultdict(Decimal)  # category_id -> revenue
+    for menuitem_id, category_id, quantity, price in lines:
+        line = items[menuitem_id]
+        line[0] += quantity
+        line[1] += price
+        line[2] = category_id
+        if category_id is not None:
+            categories[category_id] += price
+
+    with transaction.atomic():
+        DailySales.objects.bulk_create([DailySales(date=day)], ignore_conflicts=True)
+        DailySales.objects.filter(date=day).update(
+            revenue=F('revenue') + sign * total,
+            order_count=F('order_count') + sign,
+        )
+
+        if items:
+            DailyItemSales.objects.bulk_create([
+                DailyItemSales(date=day, menuitem_id=menuitem_id, category_id=category_id)
+                for menuitem_id, (_, _, category_id) in items.items()
+            ], ignore_conflicts=True)
+            DailyItemSales.objects.filter(date=day, menuitem_id__in=items).update(
+                quantity=Case(*[When(menuitem_id=menuitem_id, then=F('quantity') + sign * quantity)
+                                for menuitem_id, (quantity, _, _) in items.items()]),
+                revenue=Case(*[When(menuitem_id=menuitem_id, then=F('revenue') + sign * revenue)
+                               for menuitem_id, (_, revenue, _) in items.items()]),
+            )
+
+        if categories:
+            DailyCategorySales.objects.bulk_create([
+                DailyCategorySales(date=day, category_id=category_id) for category_id in categories
+            ], ignore_conflicts=True)
+            DailyCategorySales.objects.filter(date=day, category_id__in=categories).update(
+                revenue=Case(*[When(category_id=category_id, then=F('revenue') + sign * revenue)
+                               for category_id, revenue in categories.items()]),
+                order_count=F('order_count') + sign,
+            )
+
+
+def rebuild(batch_size=5000):
+    """
+    Recomputes every rollup from Order and OrderItem in bulk. The orders still waiting for their
+    record-order-sales task (tasks.py) are counted here, so those tasks are dropped in the same
+    transaction instead of adding the orders a second time.
+    """
+    with transaction.atomic():
+        Task.objects.filter(name='record-order-sales').delete()
+        DailySales.objects.all().delete()
+        DailyItemSales.objects.all().delete()
+        DailyCategorySales.objects.all().delete()
+
+        DailySales.objects.bulk_create(
+            (DailySales(date=row['date'], revenue=row['sales'], order_count=row['orders'])
+             for row in Order.objects.values('date').annotate(sales=Sum('total'), orders=Count('id')).order_by()),
+            batch_size=batch_size,
+        )
+        DailyItemSales.objects.bulk_create(
+            (DailyItemSales(date=row['order__date'], menuitem_id=row['menuitem'], category_id=row['menuitem__category'],
+                            quantity=row['units'], revenue=row['sales'])
+             for row in OrderItem.objects.values('order__date', 'menuitem', 'menuitem__category')
+                                         .annotate(units=Sum('quantity'), sales=Sum('price')).order_by()),
+            batch_size=batch_size,
+        )
+        DailyCategorySales.objects.bulk_create(
+            (DailyCategorySales(date=row['order__date'], category_id=row['menuitem__category'],
+                                revenue=row['sales'], order_count=row['orders'])
+             for row in OrderItem.objects.filter(menuitem__category__isnull=False)
+                                         .values('order__date', 'menuitem__category')
+                                         .annotate(sales=Sum('price'), orders=Count('order', distinct=True)).order_by()),
+            batch_size=batch_size,
+        )
+
+
+def sales_report(group_by, start=None, end=None, top=3):
+    """
+    Revenue, order count and best-selling menu items per day, week or category, read only
+    from the rollup tables. `start` and `end` are inclusive dates.
+    """
+    def in_range(queryset):
+        if start:
+            queryset = queryset.filter(date__gte=start)
+        if end:
+            queryset = queryset.filter(date__lte=end)
+        return queryset
+
+    if group_by == 'category':
+        totals = (in_range(DailyCategorySales.objects).values('category')
+                  .annotate(sales=Sum('revenue'), orders=Sum('order_count')).order_by('-sales'))
+        items = in_range(DailyItemSales.objects.filter(category__isnull=False)).values('category', 'menuitem', 'menuitem__title')
+        bucket = 'category'
+    else:
+        daily = in_range(DailySales.objects)
+        items = in_range(DailyItemSales.objects)
+        if group_by == 'week':
+            daily = daily.annotate(week=TruncWeek('date'))
+            items = items.annotate(week=TruncWeek('date'))
+        bucket = 'week' if group_by == 'week' else 'date'
+        totals = daily.values(bucket).annotate(sales=Sum('revenue'), orders=Sum('order_count')).order_by(bucket)
+        items = items.values(bucket, 'menuitem', 'menuitem__title')
+
+    best = defaultdict(list)
+    rows = items.annotate(units=Sum('quantity'), sales=Sum('revenue')).order_by('-units', '-sales', 'menuitem')
+    for row in rows:
+        if len(best[row[bucket]]) < top:
+            best[row[bucket]].append({
+                'menuitem': row['menuitem'], 'title': row['menuitem__title'],
+                'quantity': row['units'], 'revenue': row['sales'],
+            })
+
+    titles = dict(Category.objects.values_list('id', 'title')) if group_by == 'category' else {}
+    report = []
+    for row in totals:
+        key = row[bucket]
+        entry = {'category': key, 'title': titles.get(key)} if group_by == 'category' else {group_by: key}
+        entry.update({'revenue': row['sales'], 'orders': row['orders'], 'top_items': best[key]})
+        report.append(entry)
+    return report
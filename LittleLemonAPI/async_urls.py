@@ -0,0 +1,13 @@
+from django.urls import path
+from . import async_views
+
+# Read endpoints served by async views under ASGI (see LittleLemon/asgi_urls.py); other methods reach the views in urls.py
+urlpatterns = [
+    path('menu-items/', async_views.MenuItemsView.as_view()),
+    path('menu-items/<int:pk>/', async_views.SingleItemView.as_view()),
+    path('categories/', async_views.CategoryListView.as_view()),
+    path('cart/menu-items/', async_views.CartView.as_view(), name='cart-menu-items'),
+    path('orders/', async_views.OrderListView.as_view(), name='order-list'),
+    path('orders/events/', async_views.OrderEventsView.as_view(), name='order-events'),
+    path('orders/<int:pk>/', async_views.OrderDetailView.as_view(), name='order-detail'),
+]
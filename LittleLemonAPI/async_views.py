@@ -0,0 +1,241 @@
+"""
+Async twins of the API's read endpoints, served when the project runs under ASGI (LittleLemon/asgi.py).
+
+A DRF view is synchronous, so under ASGI every request hops into a thread and holds it for the
+whole view. These views answer JSON GETs on the event loop instead: the token lookup, roles and
+queries use the async ORM, which borrows a thread only while a query runs, and in-process cache
+hits (the usual case for tokens, roles and catalog pages) never leave the loop. A worker can keep
+thousands of slow clients waiting without a thread each. Response bodies and headers are those of
+the DRF views in views.py, which still handle every other method and the browsable API.
+"""
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Max
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.response import Response
+
+from . import events, views
+from .aio import alist, cache_call
+from .catalog import async_cache_catalog_response, async_catalog_validators, catalog_cache
+from .compiled import compile_serializer, fast_serializers_enabled
+from .conditional import async_conditional_get
+from .models import Cart, Category
+from .pagination import KeysetPagination, apaginate_queryset
+from .roles import aget_roles, is_manager
+from .serializers import CartSerializer, CategorySerializer, OrderSerializer
+
+
+class AsyncReadView(View):
+    """
+    Serves GET requests for `sync_view`, a DRF view, with an async `get()`.
+
+    The request goes through the DRF view's own content negotiation, authenticators, permission
+    classes, throttles and exception handling, so errors look exactly alike. Other methods, and GETs
+    that DRF would answer with a renderer outside `formats` or with an authenticator that has no
+    `aauthenticate()`, are handed to the DRF view in a thread.
+    """
+    sync_view = None
+    formats = ('json',)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.sync_handler = staticmethod(sync_to_async(cls.sync_view.as_view()))
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        # Writes are delegated to the DRF view, which does its own CSRF checks for session logins
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method != 'GET':
+            return await self.sync_handler(request, *args, **kwargs)
+
+        # Set up the DRF view as APIView.dispatch() would, without running its handler
+        view = self.drf_view = self.sync_view()
+        view.setup(request, *args, **kwargs)
+        drf_request = view.initialize_request(request, *args, **kwargs)
+        view.request = drf_request
+        view.headers = view.default_response_headers
+        view.format_kwarg = view.get_format_suffix(**kwargs)
+        authenticators = drf_request.authenticators
+        try:
+            renderer, media_type = view.perform_content_negotiation(drf_request)
+        except exceptions.NotAcceptable:
+            renderer = None
+        if renderer is None or renderer.format not in self.formats or not all(hasattr(a, 'aauthenticate') for a in authenticators):
+            return await self.sync_handler(request, *args, **kwargs)
+        drf_request.accepted_renderer, drf_request.accepted_media_type = renderer, media_type
+        drf_request.version, drf_request.versioning_scheme = view.determine_version(drf_request, *args, **kwargs)
+
+        try:
+            await self.authenticate(drf_request)
+            await aget_roles(drf_request.user)  # Permission classes then check roles without querying
+            view.check_permissions(drf_request)
+            await sync_to_async(view.check_throttles, thread_sensitive=False)(drf_request)
+            response = await self.get(drf_request, *args, **kwargs)
+        except Exception as exc:
+            response = view.handle_exception(exc)
+        return rendered(view.finalize_response(drf_request, response, *args, **kwargs))
+
+    async def authenticate(self, request):
+        # Request._authenticate() with awaited authenticators; sets what DRF's lazy request.user would
+        for authenticator in request.authenticators:
+            try:
+                user_auth = await authenticator.aauthenticate(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+            if user_auth is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth
+                return
+        request._not_authenticated()
+
+    async def get(self, request, *args, **kwargs):
+        raise NotImplementedError
+
+
+def rendered(response):
+    # Django renders a returned DRF Response in a thread; rendering it here keeps the request on the event loop
+    if not isinstance(response, Response):
+        return response
+    plain = HttpResponse(response.rendered_content, status=response.status_code)
+    for header, value in response.items():
+        plain[header] = value
+    return plain
+
+
+class MenuItemsView(AsyncReadView):
+    sync_view = views.MenuItemsView
+
+    @async_conditional_get(async_catalog_validators)
+    @async_cache_catalog_response
+    async def get(self, request):
+        view = self.drf_view
+        queryset = view.filter_queryset(view.get_queryset())
+        if fast_serializers_enabled():
+            compiled = compile_serializer(view.get_serializer_class())
+            page = await apaginate_queryset(view.paginator, compiled.rows(queryset), request, view)
+            return view.get_paginated_response(await compiled.aserialize(page))
+        page = await apaginate_queryset(view.paginator, queryset, request, view)
+        return view.get_paginated_response(view.get_serializer(page, many=True).data)
+
+
+class SingleItemView(AsyncReadView):
+    sync_view = views.SingleItemView
+
+    @async_conditional_get(async_catalog_validators)
+    @async_cache_catalog_response
+    async def get(self, request, pk):
+        view = self.drf_view
+        queryset = view.filter_queryset(view.get_queryset())
+        try:
+            item = await queryset.aget(pk=pk)
+        except queryset.model.DoesNotExist:
+            raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+        view.check_object_permissions(request, item)
+        return Response(view.get_serializer(item).data)
+
+
+class CategoryListView(AsyncReadView):
+    sync_view = views.CategoryListView
+
+    @async_conditional_get(async_catalog_validators)
+    @async_cache_catalog_response
+    async def get(self, request):
+        categories = await alist(CategorySerializer.setup_eager_loading(Category.objects.all()))
+        if not categories:
+            return Response({"detail": "No categories found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(CategorySerializer(categories, many=True).data)
+
+
+class CartView(AsyncReadView):
+    sync_view = views.CartView
+
+    async def get(self, request):
+        cart_items = CartSerializer.setup_eager_loading(Cart.objects.filter(user=request.user))
+        if fast_serializers_enabled():
+            compiled = compile_serializer(CartSerializer)
+            return Response(await compiled.aserialize(await alist(compiled.rows(cart_items))))
+        return Response(CartSerializer(await alist(cart_items), many=True).data)
+
+
+async def order_list_validators(view, request, *args, **kwargs):
+    # views.order_list_validators() with the aggregate awaited
+    stats = await view.drf_view.get_orders(request.user).aaggregate(count=Count('id'), modified=Max('updated_at'))
+    return await cache_call(catalog_cache.backend, views.order_list_stamp, request, stats)
+
+
+class OrderListView(AsyncReadView):
+    sync_view = views.OrderListView
+
+    @async_conditional_get(order_list_validators)
+    async def get(self, request):
+        orders = self.drf_view.get_orders(request.user)
+        if fast_serializers_enabled():
+            compiled = compile_serializer(OrderSerializer)
+            orders, serialize = compiled.rows(orders), compiled.aserialize
+        else:
+            orders = OrderSerializer.setup_eager_loading(orders)
+
+            async def serialize(objects):
+                return OrderSerializer(objects, many=True).data
+
+        if KeysetPagination.is_requested(request):
+            paginator = KeysetPagination(ordering=('-date', '-id'))
+            page = await paginator.apaginate_queryset(orders, request, view=self.drf_view)
+            return paginator.get_paginated_response(await serialize(page))
+        return Response(await serialize(await alist(orders)))
+
+
+class OrderDetailView(AsyncReadView):
+    sync_view = views.OrderDetailView
+
+    async def get(self, request, pk):
+        data = views.order_detail_from_rows(await alist(views.order_detail_rows(pk)))
+        if data is None:
+            return Response({"detail": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
+        if not views.can_view_order(request.user, data):
+            return Response({"detail": "You do not have permission to view this order."}, status=status.HTTP_403_FORBIDDEN)
+        return Response(data)
+
+
+class OrderEventsView(AsyncReadView):
+    """
+    The current user's order events as text/event-stream (see events.py): their own orders, the
+    orders assigned to them as delivery crew and, for managers, every order. The stream opens
+    with a `retry` hint and sends a comment every `keepalive` seconds so proxies keep it open.
+    Clients should refetch /api/orders/ whenever they (re)connect: events published while they
+    were away are not replayed.
+    """
+    sync_view = views.OrderEventsView
+    formats = ('json', 'event-stream')
+    keepalive = 15
+    retry_ms = 3000
+
+    async def get(self, request):
+        channels = [events.user_channel(request.user.pk)]
+        if is_manager(request.user):
+            channels.append(events.MANAGERS_CHANNEL)
+        response = StreamingHttpResponse(self.stream(channels), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # nginx would otherwise buffer the stream
+        return response
+
+    async def stream(self, channels):
+        # Subscribes once the response starts; Django cancels the iteration when the client disconnects
+        subscription = events.event_broker().subscribe(channels)
+        try:
+            yield f'retry: {self.retry_ms}\n\n'
+            while True:
+                try:
+                    event = await subscription.get(timeout=self.keepalive)
+                except TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield event.encode()
+        finally:
+            subscription.close()
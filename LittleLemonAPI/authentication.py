@@ -0,0 +1,100 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+
+from .aio import cache_call
+
+
+# The user fields kept per token: enough for authentication and the permission checks, and no
+# credentials (token key, password hash). The user's other fields load on first access.
+IDENTITY_FIELDS = ('id', 'is_active', 'is_staff', 'is_superuser')
+
+
+def token_cache():
+    return caches[getattr(settings, 'TOKEN_CACHE_ALIAS', 'default')]
+
+
+def token_cache_key(key):
+    # Tokens are credentials, so only a digest of them ends up in cache keys
+    return 'authtoken:identity:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def forget_tokens(keys):
+    token_cache().delete_many([token_cache_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Drop-in replacement for TokenAuthentication that keeps token -> user in a cache.
+
+    The Token + User join runs once per token; later requests are served from the cache
+    configured by TOKEN_CACHE_ALIAS, whose TIMEOUT and MAX_ENTRIES bound how long and how
+    many identities are kept. Only the IDENTITY_FIELDS of the user are cached, since the
+    cache may live on disk. Deleting a token (djoser's token/logout does) or saving or
+    deleting its user evicts the entry, see signals.py. The eviction only reaches other
+    workers if they share that cache: with a local-memory cache they keep accepting a
+    revoked token until their entry expires.
+    """
+
+    def authenticate_credentials(self, key):
+        cache = token_cache()
+        cache_key = token_cache_key(key)
+        identity = cache.get(cache_key)
+        if identity is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(cache_key, self.identity(user))
+            return user, token
+        return self.from_identity(key, identity)
+
+    def identity(self, user):
+        return tuple(getattr(user, field) for field in IDENTITY_FIELDS)
+
+    def from_identity(self, key, identity):
+        """The user and token of a cached identity, built without a query."""
+        token_model = self.get_model()
+        user_model = token_model._meta.get_field('user').related_model
+        fields = dict(zip(IDENTITY_FIELDS, identity))
+        names = [field.attname for field in user_model._meta.concrete_fields if field.attname in fields]  # from_db() order
+        user = user_model.from_db(DEFAULT_DB_ALIAS, names, [fields[name] for name in names])
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        token = token_model.from_db(DEFAULT_DB_ALIAS, ('key', 'user_id'), (key, user.pk))
+        token.user = user
+        return user, token
+
+    async def aauthenticate(self, request):
+        """authenticate() for the async views: the same header checks and errors, awaiting the lookup."""
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+
+        if len(auth) == 1:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. No credentials provided.'))
+        elif len(auth) > 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain spaces.'))
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain invalid characters.'))
+        return await self.aauthenticate_credentials(key)
+
+    async def aauthenticate_credentials(self, key):
+        cache = token_cache()
+        cache_key = token_cache_key(key)
+        identity = await cache_call(cache, cache.get, cache_key)
+        if identity is None:
+            model = self.get_model()
+            try:
+                token = await model.objects.select_related('user').aget(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            if not token.user.is_active:
+                raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+            await cache_call(cache, cache.set, cache_key, self.identity(token.user))
+            return token.user, token
+        return self.from_identity(key, identity)
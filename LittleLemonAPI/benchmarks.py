@@ -0,0 +1,661 @@
+"""
+Benchmarks run with `python manage.py benchmark [name ...]`.
+
+Each benchmark seeds a throwaway test database (the command creates and destroys it) and
+returns rows of timings from `measure()`. Register new ones with `@register(name, description)`.
+"""
+import random
+import threading
+import time
+import tracemalloc
+from contextlib import closing
+
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from .catalog import catalog_cache
+from .models import Category, MenuItem, Order, OrderItem
+
+
+REGISTRY = {}
+
+
+def register(name, description):
+    def decorator(func):
+        REGISTRY[name] = (func, description)
+        return func
+    return decorator
+
+
+def percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def measure(func, repeat=20, warmup=2, setup=None):
+    """
+    Calls `func` `repeat` times after `warmup` untimed calls and returns latency percentiles in
+    milliseconds plus the number of queries one call makes. `setup` runs untimed before each call.
+    """
+    def call():
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        return (time.perf_counter() - start) * 1000
+
+    for _ in range(warmup):
+        call()
+    with CaptureQueriesContext(connection) as ctx:
+        call()
+    timings = sorted(call() for _ in range(repeat))
+    return {
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'max_ms': round(timings[-1], 3),
+        'queries': len(ctx.captured_queries),
+    }
+
+
+MENU_WORDS = [
+    'grilled', 'chicken', 'lemon', 'pasta', 'salad', 'greek', 'lamb', 'souvlaki', 'feta', 'olive',
+    'bruschetta', 'tart', 'honey', 'yogurt', 'spicy', 'roasted', 'garlic', 'bread', 'fish', 'tacos',
+    'mushroom', 'risotto', 'orange', 'cake', 'baklava', 'pita', 'hummus', 'falafel', 'tomato', 'soup',
+]
+
+
+def seed_menu(items, categories=20, seed=0):
+    rng = random.Random(seed)
+    cats = Category.objects.bulk_create([Category(slug=f'category-{i}', title=f'Category {i}') for i in range(categories)])
+    MenuItem.objects.bulk_create((
+        MenuItem(
+            title=' '.join(rng.sample(MENU_WORDS, 3)).title() + f' {i}',
+            price=f'{rng.randint(200, 4000) / 100:.2f}',
+            featured=rng.random() < 0.1,
+            category=rng.choice(cats),
+        ) for i in range(items)
+    ), batch_size=5000)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+@register('menu', 'Filtering, search and ordering on /api/menu-items/ over a 100k-item catalog')
+def menu_benchmark(scale=1.0, repeat=20):
+    from .views import MenuItemsView
+
+    seed_menu(int(100_000 * scale))
+    view = MenuItemsView.as_view(throttle_classes=[])
+    factory = APIRequestFactory()
+
+    def get(query):
+        response = view(factory.get(f'/api/menu-items/?{query}', HTTP_ACCEPT='application/json'))
+        assert response.status_code == 200, response.status_code
+
+    # Every call misses the catalog cache, so the rows time the database and serializer path
+    scenarios = [
+        ('first page', ''),
+        ('category', 'category=category-7'),
+        ('category + featured, by price', 'category=category-7&featured=true&ordering=price'),
+        ('price range, by price', 'price_min=10&price_max=12&ordering=price'),
+        ('price range, cursor pages', 'price_min=10&price_max=12&ordering=price&pagination=cursor'),
+        ('search', 'search=chicken'),
+        ('search, two prefixes', 'search=lem tar'),
+        ('search + category', 'search=risotto&category=category-3'),
+    ]
+    rows = [(label, measure(lambda query=query: get(query), repeat, setup=catalog_cache.bump)) for label, query in scenarios]
+
+    # The count and first page the view would run with LIKE scans instead of the search index
+    def like_search():
+        matches = MenuItem.objects.filter(Q(title__icontains='chicken') | Q(category__title__icontains='chicken'))
+        matches.count()
+        list(matches.order_by('id')[:5])
+    rows.append(('search via LIKE, for comparison', measure(like_search, repeat)))
+    return rows
+
+
+@register('order-detail', 'Order detail: single-query fast path against OrderSerializer, 1-500 lines')
+def order_detail_benchmark(scale=1.0, repeat=20):
+    from .serializers import OrderSerializer
+    from .views import order_detail_data
+
+    user = User.objects.create_user(username='customer')
+    items = MenuItem.objects.bulk_create([MenuItem(title=f'Item {i}', price='4.50', featured=False) for i in range(500)])
+    rows = []
+    for lines in (1, 10, 100, 500):
+        order = Order.objects.create(user=user, total=lines * 9, date='2024-01-01')
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, menuitem=item, quantity=2, unit_price='4.50', price='9.00') for item in items[:lines]
+        ])
+        # Both paths load and render to JSON bytes; only the loading and the serializer differ
+        def serializer_path(pk=order.pk):
+            JSONRenderer().render(OrderSerializer(OrderSerializer.setup_eager_loading(Order.objects.all()).get(pk=pk)).data)
+
+        def fast_path(pk=order.pk):
+            JSONRenderer().render(order_detail_data(pk))
+
+        rows.append((f'{lines} lines, OrderSerializer', measure(serializer_path, repeat)))
+        rows.append((f'{lines} lines, fast path', measure(fast_path, repeat)))
+    return rows
+
+
+@register('serializers', 'Objects/s of the regular and compiled menu, cart and order serializers')
+def serializer_benchmark(scale=1.0, repeat=20):
+    from .compiled import compile_serializer
+    from .models import Cart
+    from .serializers import CartSerializer, MenuItemSerializer, OrderSerializer
+
+    count = int(1000 * scale)
+    users = User.objects.bulk_create([User(username=f'user{i}') for i in range(count)])
+    items = MenuItem.objects.bulk_create([MenuItem(title=f'Item {i}', price='4.50', featured=i % 5 == 0) for i in range(count)])
+    Cart.objects.bulk_create([Cart(user=user, menuitem=item, quantity=1, unit_price='4.50', price='4.50')
+                              for user, item in zip(users, items)])
+    orders = Order.objects.bulk_create([Order(user=users[i], total='18.00', date='2024-01-01') for i in range(count)])
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, menuitem=items[(i + line) % count], quantity=2, unit_price='4.50', price='9.00')
+        for i, order in enumerate(orders) for line in range(4)  # Four lines per order
+    ], batch_size=5000)
+
+    rows = []
+    for serializer_class, queryset in ((MenuItemSerializer, MenuItem.objects.order_by('id')),
+                                       (CartSerializer, Cart.objects.all()),
+                                       (OrderSerializer, Order.objects.order_by('-date', '-id'))):
+        compiled = compile_serializer(serializer_class)
+
+        def regular(serializer_class=serializer_class, queryset=queryset):
+            JSONRenderer().render(serializer_class(serializer_class.setup_eager_loading(queryset.all()), many=True).data)
+
+        def fast(compiled=compiled, queryset=queryset):
+            JSONRenderer().render(compiled.serialize(compiled.rows(queryset)))
+
+        for mode, func in (('serializer', regular), ('compiled', fast)):
+            stats = measure(func, repeat)
+            stats['objects_per_s'] = round(count / stats['p50_ms'] * 1000)
+            rows.append((f'{serializer_class.__name__}, {mode}', stats))
+    return rows
+
+
+@register('export', 'Streaming order export: time and peak memory as the order history grows')
+def export_benchmark(scale=1.0, repeat=3):
+    from . import exports
+
+    user = User.objects.create_user(username='customer')
+    items = MenuItem.objects.bulk_create([MenuItem(title=f'Item {i}', price='4.50', featured=False) for i in range(50)])
+    rows, seeded = [], 0
+    for orders in (int(5_000 * scale), int(20_000 * scale), int(50_000 * scale)):
+        created = Order.objects.bulk_create([Order(user=user, total='27.00', date='2024-01-01') for _ in range(orders - seeded)],
+                                            batch_size=5000)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, menuitem=items[(order.pk + line) % 50], quantity=2, unit_price='4.50', price='9.00')
+            for order in created for line in range(3)
+        ], batch_size=5000)
+        seeded = orders
+
+        for output in ('ndjson', 'csv'):
+            def run(output=output):
+                for _ in exports.export_lines(output, exports.iter_orders(exports.orders_for_export())):
+                    pass
+
+            stats = measure(run, repeat=repeat, warmup=0)
+            tracemalloc.start()
+            run()
+            stats['peak_kib'] = round(tracemalloc.get_traced_memory()[1] / 1024)
+            tracemalloc.stop()
+            stats['orders_per_s'] = round(orders / stats['p50_ms'] * 1000)
+            rows.append((f'{orders} orders, {output}', stats))
+    return rows
+
+
+@register('throttle', 'Per-request overhead of the stock DRF throttle and the sliding-window stores')
+def throttle_benchmark(scale=1.0, repeat=20):
+    import tempfile
+
+    from django.test import override_settings
+    from rest_framework.request import Request
+    from rest_framework.throttling import UserRateThrottle
+
+    from .throttles import SharedUserRateThrottle, throttle_store
+
+    checks = int(500 * scale)
+    request = Request(APIRequestFactory().get('/'))
+    request.user = User(pk=1, username='customer')
+
+    class StockThrottle(UserRateThrottle):
+        rate = '1000000/hour'  # High enough that every check is allowed and the history keeps growing
+
+    class SlidingThrottle(SharedUserRateThrottle):
+        rate = '1000000/hour'
+
+    def run(throttle_class):
+        throttle = throttle_class()
+        for _ in range(checks):
+            throttle.allow_request(request, None)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        stores = [
+            ('sliding window, locmem cache store', {'BACKEND': 'LittleLemonAPI.throttles.CacheThrottleStore'}),
+            ('sliding window, SQLite file store', {'BACKEND': 'LittleLemonAPI.throttles.SQLiteThrottleStore',
+                                                   'OPTIONS': {'path': f'{directory}/throttle.sqlite3'}}),
+        ]
+        cases = [('DRF UserRateThrottle (timestamp list)', StockThrottle, None)]
+        cases += [(label, SlidingThrottle, store) for label, store in stores]
+        for label, throttle_class, store in cases:
+            with override_settings(**({'THROTTLE_STORE': store} if store else {})):
+                throttle_store().clear()
+                stats = measure(lambda: run(throttle_class), repeat)
+            stats['us_per_check'] = round(stats['p50_ms'] * 1000 / checks, 1)
+            rows.append((label, stats))
+    return rows
+
+
+@register('metrics', 'Overhead of the request metrics middleware per request, per recorded sample and per scrape')
+def metrics_benchmark(scale=1.0, repeat=50):
+    from django.conf import settings
+    from django.contrib.auth.models import Group
+    from django.test import override_settings
+    from rest_framework.test import APIClient
+
+    from . import metrics
+    from .roles import MANAGERS
+    from .throttles import throttle_store
+
+    manager = User.objects.create_user(username='manager')
+    manager.groups.add(Group.objects.create(name=MANAGERS))
+    items = MenuItem.objects.bulk_create([MenuItem(title=f'Item {i}', price='4.50', featured=False) for i in range(50)])
+    orders = Order.objects.bulk_create([Order(user=manager, total='9.00', date='2024-01-01') for _ in range(int(200 * scale))])
+    OrderItem.objects.bulk_create([OrderItem(order=order, menuitem=items[order.pk % 50], quantity=2, unit_price='4.50',
+                                             price='9.00') for order in orders])
+
+    def setup():
+        catalog_cache.bump()
+        throttle_store().clear()
+
+    without = [name for name in settings.MIDDLEWARE if name != 'LittleLemonAPI.metrics.RequestMetricsMiddleware']
+    rows = []
+    for label, url in (('menu page', '/api/menu-items/'), (f'{len(orders)} orders', '/api/orders/')):
+        for mode, middleware in (('without metrics', without), ('with metrics', settings.MIDDLEWARE)):
+            with override_settings(MIDDLEWARE=middleware):
+                client = APIClient()
+                client.force_authenticate(manager)
+
+                def get(client=client, url=url):
+                    assert client.get(url).status_code == 200
+                rows.append((f'{label}, {mode}', measure(get, repeat, setup=setup)))
+
+    # The recording and scraping costs alone, with the buffer full of distinct routes
+    registry = metrics.MetricsRegistry(size=8192)
+    samples = int(8192 * scale)
+
+    def record():
+        for i in range(samples):
+            registry.record(f'/api/route-{i % 20}/', 'GET', 200, 0.01, 4, 0.001, 0.002, 1000)
+    stats = measure(record, repeat=5)
+    stats['us_per_sample'] = round(stats['p50_ms'] * 1000 / samples, 2)
+    rows.append((f'record {samples} samples', stats))
+
+    def scrape():
+        record()
+        registry.render()
+    rows.append((f'record {samples} samples + scrape', measure(scrape, repeat=5)))
+    return rows
+
+
+def serve_wsgi(app, connections, threads, client_delay):
+    """
+    Serves `connections` (lists of WSGI environs, sent one after another) with a pool of `threads`
+    workers, as a threaded WSGI server would. A worker stays busy while it writes the response to
+    the client, modelled by sleeping `client_delay` seconds. Returns per-request latencies in ms
+    and the number of responses that were not 200 OK.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    latencies = []
+    errors = []
+    remaining = [sum(map(len, connections))]
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def handle(environ):
+        status = []
+        body = app(environ, lambda code, headers, exc_info=None: status.append(code))
+        try:
+            b''.join(body)
+        finally:
+            body.close()
+        time.sleep(client_delay)
+        return status[0]
+
+    with ThreadPoolExecutor(threads) as pool:
+        def submit(requests, index):
+            start = time.perf_counter()
+
+            def finished(future):
+                latencies.append((time.perf_counter() - start) * 1000)
+                if future.exception() or not future.result().startswith('200'):
+                    errors.append(future.exception() or future.result())
+                if index + 1 < len(requests):
+                    submit(requests, index + 1)
+                with lock:
+                    remaining[0] -= 1
+                    if not remaining[0]:
+                        done.set()
+            pool.submit(handle, requests[index]).add_done_callback(finished)
+
+        for requests in connections:
+            submit(requests, 0)
+        done.wait()
+    return latencies, len(errors)
+
+
+def serve_asgi(app, connections, client_delay, per_connection=False):
+    """
+    Serves `connections` (lists of ASGI scopes) concurrently on one event loop, as an ASGI server
+    would: a slow client only delays its own send. Returns per-request latencies in ms, in one
+    list per connection with `per_connection`, and the number of responses that were not 2xx.
+    """
+    import asyncio
+
+    latencies = [[] for _ in connections]
+    errors = []
+
+    async def call(scope):
+        messages = iter([{'type': 'http.request', 'body': b'', 'more_body': False}])
+        status = []
+
+        async def receive():
+            try:
+                return next(messages)
+            except StopIteration:
+                await asyncio.Future()  # The client stays connected; the server cancels this wait
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif not message.get('more_body'):
+                await asyncio.sleep(client_delay)
+        await app(scope, receive, send)
+        if len(status) != 1 or not 200 <= status[0] < 300:
+            errors.append(status)
+
+    async def client(requests, timings):
+        for scope in requests:
+            start = time.perf_counter()
+            await call(scope)
+            timings.append((time.perf_counter() - start) * 1000)
+
+    async def main():
+        await asyncio.gather(*(client(requests, timings) for requests, timings in zip(connections, latencies)))
+
+    asyncio.run(main())
+    if not per_connection:
+        latencies = [latency for timings in latencies for latency in timings]
+    return latencies, len(errors)
+
+
+def asgi_scope(token, path, method='GET'):
+    """The ASGI HTTP scope of a request to `path` (with its query string) authenticated by `token`."""
+    path, _, query = path.partition('?')
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'testserver'), (b'authorization', f'Token {token}'.encode())],
+        'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+    }
+
+
+@register('asgi', 'Read endpoints for 1k concurrent clients taking 500 ms to read each response: WSGI vs ASGI')
+def asgi_benchmark(scale=1.0, repeat=20, connections=1000, threads=32, client_delay=0.5):
+    from django.core.handlers.asgi import ASGIHandler
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.test import RequestFactory
+
+    from LittleLemon.asgi import LittleLemonASGIHandler
+    from . import loadtest
+
+    loadtest.seed(scale)
+    fixture = loadtest.Fixture()
+    rng = random.Random(0)
+    orders = dict(Order.objects.filter(user__in=fixture.customers).values_list('user', 'pk'))
+
+    def paths(customer):
+        return [
+            f'/api/menu-items/?page={rng.randint(1, 20)}',
+            '/api/categories/',
+            '/api/cart/menu-items/',
+            '/api/orders/?pagination=cursor',
+            f'/api/orders/{orders[customer]}/' if customer in orders else '/api/orders/',
+        ]
+
+    # Each connection sends a few requests in a row, as one customer's token
+    requests_per_connection = max(1, repeat // 10)
+    plans = []
+    for _ in range(connections):
+        customer = rng.choice(fixture.customers)
+        plans.append((fixture.tokens[customer], rng.sample(paths(customer), requests_per_connection)))
+
+    factory = RequestFactory()
+
+    def environ(token, path):
+        return factory.get(path, headers={'Authorization': f'Token {token}'}).environ
+
+    servers = (
+        (f'WSGI, {threads} threads', lambda: serve_wsgi(
+            WSGIHandler(), [[environ(token, path) for path in paths_] for token, paths_ in plans], threads, client_delay)),
+        ('ASGI, stock handler, DRF views', lambda: serve_asgi(
+            ASGIHandler(), [[asgi_scope(token, path) for path in paths_] for token, paths_ in plans], client_delay)),
+        ('ASGI, asgi.py with async views', lambda: serve_asgi(
+            LittleLemonASGIHandler(), [[asgi_scope(token, path) for path in paths_] for token, paths_ in plans], client_delay)),
+    )
+    rows = []
+    with loadtest.unthrottled():
+        for label, serve in servers:
+            catalog_cache.bump()
+            peak = [threading.active_count()]
+            running = threading.Event()
+
+            def watch():
+                while not running.wait(0.005):
+                    peak[0] = max(peak[0], threading.active_count())
+            watcher = threading.Thread(target=watch)
+            watcher.start()
+            start = time.perf_counter()
+            try:
+                latencies, errors = serve()
+            finally:
+                running.set()
+                watcher.join()
+            seconds = time.perf_counter() - start
+            latencies.sort()
+            rows.append((label, {
+                'p50_ms': round(percentile(latencies, 50), 3),
+                'p95_ms': round(percentile(latencies, 95), 3),
+                'p99_ms': round(percentile(latencies, 99), 3),
+                'max_ms': round(latencies[-1], 3),
+                'queries': None,
+                'req_per_s': round(len(latencies) / seconds),
+                'peak_threads': peak[0] - 1,  # Without the watcher itself
+                'errors': errors,
+            }))
+    return rows
+
+
+@register('asgi-slow-writer', 'Reads from 40 clients while 2 checkouts wait 1 s for the SQLite write lock: ASGI sync threads')
+def asgi_slow_writer_benchmark(scale=1.0, repeat=20, connections=40, writers=2, hold=1.0, client_delay=0.05):
+    # Another process holds the write lock for `hold` seconds, so each checkout blocks its sync thread
+    # that long on the busy timeout, like a slow export or import would
+    import sqlite3
+
+    from django.core.handlers.asgi import ASGIHandler
+
+    from LittleLemon.asgi import LittleLemonASGIHandler
+    from . import loadtest
+    from .models import Cart
+
+    class RoundRobinHandler(LittleLemonASGIHandler):
+        # Requests take the sync threads in turn, busy or not
+        def sync_thread(self):
+            return self.sync_threads[next(self._turns) % len(self.sync_threads)]
+
+    loadtest.seed(scale)
+    fixture = loadtest.Fixture()
+    rng = random.Random(0)
+    paths = ['/api/menu-items/', '/api/categories/', '/api/cart/menu-items/', '/api/orders/?pagination=cursor']
+    requests_per_connection = max(1, repeat // 2)
+    readers = [[asgi_scope(fixture.tokens[customer], rng.choice(paths)) for _ in range(requests_per_connection)]
+               for customer in rng.choices(fixture.customers, k=connections)]
+    servers = (
+        ('ASGI, stock handler', ASGIHandler),
+        ('ASGI, sync threads in turn', RoundRobinHandler),
+        ('ASGI, least busy sync thread', LittleLemonASGIHandler),
+    )
+    # Every run checks out carts of its own
+    shoppers = rng.sample(sorted(set(Cart.objects.filter(user__in=fixture.tokens).values_list('user', flat=True))),
+                          writers * len(servers))
+
+    def hold_write_lock(ready):
+        with closing(sqlite3.connect(connection.settings_dict['NAME'], isolation_level=None)) as db:
+            db.execute('BEGIN IMMEDIATE')
+            ready.set()
+            time.sleep(hold)
+            db.execute('ROLLBACK')
+
+    rows = []
+    with loadtest.unthrottled():
+        for run, (label, handler) in enumerate(servers):
+            catalog_cache.bump()
+            checkouts = [[asgi_scope(fixture.tokens[user], '/api/orders/', 'POST')]
+                         for user in shoppers[run * writers:(run + 1) * writers]]
+            peak = [threading.active_count()]
+            running = threading.Event()
+
+            def watch():
+                while not running.wait(0.005):
+                    peak[0] = max(peak[0], threading.active_count())
+            watcher = threading.Thread(target=watch)
+            watcher.start()
+            ready = threading.Event()
+            holder = threading.Thread(target=hold_write_lock, args=(ready,))
+            holder.start()
+            ready.wait()
+            start = time.perf_counter()
+            try:
+                latencies, errors = serve_asgi(handler(), checkouts + readers, client_delay, per_connection=True)
+            finally:
+                running.set()
+                watcher.join()
+                holder.join()
+            seconds = time.perf_counter() - start
+            reads = sorted(latency for timings in latencies[writers:] for latency in timings)
+            rows.append((label, {
+                'p50_ms': round(percentile(reads, 50), 3),
+                'p95_ms': round(percentile(reads, 95), 3),
+                'p99_ms': round(percentile(reads, 99), 3),
+                'max_ms': round(reads[-1], 3),
+                'queries': None,
+                'checkout_ms': round(max(latency for timings in latencies[:writers] for latency in timings)),
+                'req_per_s': round(len(reads) / seconds),
+                'peak_threads': peak[0] - 2,  # Without the watcher and the lock holder
+                'errors': errors,
+            }))
+    return rows
+
+
+def checkout_worker(user_id, items, checkouts):
+    """
+    One process of the sqlite-writes benchmark: `checkouts` times, adds a menu item to the cart
+    and checks out through OrderListView.post, each pair as one request (request_started and
+    request_finished, which close connections past CONN_MAX_AGE). Returns the latencies of the
+    successful pairs in ms and the number that failed with "database is locked".
+    """
+    from django.core.signals import request_finished, request_started
+    from django.db import OperationalError
+    from rest_framework.test import force_authenticate
+
+    from .models import Cart
+    from .views import OrderListView
+
+    view = OrderListView.as_view()
+    factory = APIRequestFactory()
+    user = User.objects.get(pk=user_id)
+    latencies, errors = [], 0
+    for i in range(checkouts):
+        menuitem_id, price = items[i % len(items)]
+        request_started.send(sender=None)
+        start = time.perf_counter()
+        try:
+            Cart.objects.get_or_create(user_id=user_id, menuitem_id=menuitem_id,
+                                       defaults={'quantity': 1, 'unit_price': price, 'price': price})
+            request = factory.post('/api/orders/')
+            force_authenticate(request, user)
+            failed = view(request).status_code != 201
+        except OperationalError:
+            failed = True
+        finally:
+            request_finished.send(sender=None)
+        if failed:
+            errors += 1
+        else:
+            latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, errors
+
+
+@register('sqlite-writes', 'Checkouts from 8 processes at once: stock SQLite vs WAL, BEGIN IMMEDIATE and pragmas')
+def sqlite_writes_benchmark(scale=1.0, repeat=20, processes=8):
+    # Stock: rollback journal, deferred BEGIN, Python's 5 s busy timeout, a new connection per request.
+    # Profile: DATABASES and SQLITE_PRAGMAS as configured in settings.py.
+    import multiprocessing
+    import sqlite3
+
+    from django.conf import settings
+    from django.db import connections
+    from django.test import override_settings
+
+    from . import loadtest
+
+    users = User.objects.bulk_create([User(username=f'writer-{i}') for i in range(processes)])
+    seed_menu(50)
+    items = list(MenuItem.objects.values_list('pk', 'price')[:50])
+    checkouts = max(1, int(repeat * 5 * scale))
+
+    settings_dict = connection.settings_dict
+    profiles = (
+        ('stock settings', 'DELETE', {},
+         {'OPTIONS': {}, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}),
+        ('production profile', 'WAL', settings.SQLITE_PRAGMAS,
+         {key: settings_dict[key] for key in ('OPTIONS', 'CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}),
+    )
+    saved = {key: settings_dict[key] for key in ('OPTIONS', 'CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+    rows = []
+    try:
+        for label, journal_mode, pragmas, database in profiles:
+            # The journal mode is stored in the file, so set it while nothing else has the database open
+            connections.close_all()
+            with sqlite3.connect(settings_dict['NAME']) as raw:
+                raw.execute(f'PRAGMA journal_mode = {journal_mode}')
+            raw.close()
+            settings_dict.update(database)
+            # Forked workers inherit these settings and open their own connections
+            with override_settings(SQLITE_PRAGMAS=pragmas), loadtest.unthrottled():
+                with multiprocessing.get_context('fork').Pool(processes) as pool:
+                    start = time.perf_counter()
+                    results = pool.starmap(checkout_worker, [(user.pk, items, checkouts) for user in users])
+                    seconds = time.perf_counter() - start
+            latencies = sorted(latency for worker_latencies, _ in results for latency in worker_latencies) or [0]
+            rows.append((f'{processes} processes, {label}', {
+                'p50_ms': round(percentile(latencies, 50), 3),
+                'p95_ms': round(percentile(latencies, 95), 3),
+                'p99_ms': round(percentile(latencies, 99), 3),
+                'max_ms': round(latencies[-1], 3),
+                'queries': None,
+                'checkouts_per_s': round(sum(len(worker_latencies) for worker_latencies, _ in results) / seconds),
+                'errors': sum(errors for _, errors in results),
+            }))
+    finally:
+        connections.close_all()
+        settings_dict.update(saved)
+    return rows
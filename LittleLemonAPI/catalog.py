@@ -0,0 +1,178 @@
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .aio import cache_call
+
+
+DEFAULTS = {
+    'ALIAS': 'default',  # Django cache holding the shared copies, e.g. local-memory or file-based
+    'TIMEOUT': 60 * 60,  # Seconds a rendered response lives in the shared cache
+    'MAX_BYTES': 8 * 1024 * 1024,  # Size cap of the in-process LRU in front of it
+}
+
+VERSION_KEY = 'catalog:version'
+MODIFIED_KEY = 'catalog:modified'
+
+
+class CatalogCache:
+    """
+    Read-through cache of rendered catalog JSON, keyed by a catalog version number.
+
+    Any committed save or delete of a MenuItem or Category bumps the version (see signals.py), which
+    makes every previously cached response unreachable at once instead of tracking keys.
+    Rendered bytes live in an in-process LRU bounded by MAX_BYTES and in the configured
+    Django cache, so other workers (and restarts, with the file backend) share them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        self._local_version = None
+
+    @property
+    def options(self):
+        return {**DEFAULTS, **getattr(settings, 'CATALOG_CACHE', {})}
+
+    @property
+    def backend(self):
+        return caches[self.options['ALIAS']]
+
+    def version(self):
+        version = self.backend.get(VERSION_KEY)
+        if version is None:
+            self._start_version()
+            version = self.backend.get(VERSION_KEY)
+        return version
+
+    def bump(self):
+        try:
+            version = self.backend.incr(VERSION_KEY)
+        except ValueError:  # Not set yet (or evicted); start a fresh version line
+            self._start_version()
+            version = self.backend.incr(VERSION_KEY)
+        self.backend.set(MODIFIED_KEY, timezone.now(), timeout=None)
+        self.clear_local()
+        return version
+
+    def last_modified(self):
+        return self.backend.get(MODIFIED_KEY)
+
+    def _start_version(self):
+        # Seeded from the clock so an evicted or cleared version never reuses keys of older entries
+        self.backend.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+
+    def key_for(self, request):
+        # Host is part of the key because pagination links in the body are absolute URLs
+        raw = f'{request.get_host()}{request.get_full_path()}'
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def get(self, key):
+        return self.lookup(key)[0]
+
+    def lookup(self, key):
+        """
+        The cached body for `key` (None on a miss) and the catalog version it was looked up under.
+        Store what is rendered after a miss under that version: a change committed while rendering
+        bumps the version, and the rows read before it must not be served under the new one.
+        """
+        version = self.version()
+        with self._lock:
+            if self._local_version != version:
+                self._drop_local()
+                self._local_version = version
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                return body, version
+        body = self.backend.get(f'catalog:{version}:{key}')
+        if body is not None:
+            self._remember(key, body, version)
+        return body, version
+
+    def set(self, key, body, version=None):
+        if version is None:
+            version = self.version()
+        self.backend.set(f'catalog:{version}:{key}', body, self.options['TIMEOUT'])
+        self._remember(key, body, version)
+
+    def clear_local(self):
+        with self._lock:
+            self._drop_local()
+
+    def _remember(self, key, body, version):
+        max_bytes = self.options['MAX_BYTES']
+        if len(body) > max_bytes:
+            return
+        with self._lock:
+            if self._local_version != version:
+                return
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+            self._entries[key] = body
+            self._size += len(body)
+            while self._size > max_bytes:  # Evict least recently used responses until under the cap
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _drop_local(self):
+        self._entries.clear()
+        self._size = 0
+
+
+catalog_cache = CatalogCache()
+
+
+def cache_catalog_response(handler):
+    """Serves a catalog GET handler from catalog_cache, rendering and storing its JSON on a miss."""
+    @functools.wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        # Only JSON responses are cached; the browsable API always renders fresh
+        if request.accepted_renderer.format != 'json':
+            return handler(view, request, *args, **kwargs)
+
+        key = catalog_cache.key_for(request)
+        body, version = catalog_cache.lookup(key)
+        if body is None:
+            response = handler(view, request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            body = JSONRenderer().render(response.data)
+            catalog_cache.set(key, body, version)
+        return HttpResponse(body, content_type='application/json')
+    return wrapper
+
+
+def async_cache_catalog_response(handler):
+    """cache_catalog_response() for the async views, which only ever render JSON."""
+    @functools.wraps(handler)
+    async def wrapper(view, request, *args, **kwargs):
+        key = catalog_cache.key_for(request)
+        body, version = await cache_call(catalog_cache.backend, catalog_cache.lookup, key)
+        if body is None:
+            response = await handler(view, request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            body = JSONRenderer().render(response.data)
+            await cache_call(catalog_cache.backend, catalog_cache.set, key, body, version)
+        return HttpResponse(body, content_type='application/json')
+    return wrapper
+
+
+def catalog_validators(view, request, *args, **kwargs):
+    # Conditional GET validators for catalog views: the catalog version costs a cache read, not a query
+    etag = f'catalog-{catalog_cache.version()}-{request.accepted_renderer.format}'
+    return etag, catalog_cache.last_modified()
+
+
+async def async_catalog_validators(view, request, *args, **kwargs):
+    return await cache_call(catalog_cache.backend, catalog_validators, view, request, *args, **kwargs)
@@ -0,0 +1,127 @@
+import functools
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import serializers
+from rest_framework.settings import ISO_8601, api_settings
+
+from .aio import alist
+from .metrics import timed_serialization
+
+
+def fast_serializers_enabled():
+    # Opt-in with FAST_SERIALIZERS = True in settings; off by default
+    return getattr(settings, 'FAST_SERIALIZERS', False)
+
+
+@functools.cache
+def compile_serializer(serializer_class):
+    """Returns the CompiledSerializer for `serializer_class`, built once per process."""
+    return CompiledSerializer(serializer_class)
+
+
+def _converter(field):
+    # Plain Python equivalent of field.to_representation() for the field types these serializers use
+    if isinstance(field, serializers.DecimalField):
+        coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+        if coerce_to_string and not field.localize and not field.normalize_output and field.decimal_places is not None:
+            template = f'{{:.{field.decimal_places}f}}'
+            return template.format
+    elif isinstance(field, serializers.BooleanField):
+        return bool
+    elif isinstance(field, (serializers.IntegerField, serializers.CharField)):
+        return None  # values() already returns the right type
+    elif isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+        return None  # values('fk') returns the primary key itself
+    elif isinstance(field, serializers.DateField) and not isinstance(field, serializers.DateTimeField):
+        if getattr(field, 'format', api_settings.DATE_FORMAT) == ISO_8601:
+            return lambda value: value.isoformat()
+    return field.to_representation
+
+
+class CompiledSerializer:
+    """
+    Read-only twin of a ModelSerializer that renders `values()` rows instead of model instances.
+
+    The serializer's fields are introspected once: every scalar field becomes a column of the
+    values() query plus a converter, nested serializers become joined columns (`menuitem__title`),
+    and nested `many=True` serializers are loaded with one extra query per page of rows. The
+    resulting dicts render to the same JSON bytes as the serializer's `.data`.
+    """
+
+    def __init__(self, serializer_class):
+        serializer = serializer_class()
+        self.model = serializer.Meta.model
+        self.columns = []
+        self.children = []  # (field name, CompiledSerializer, foreign key attname on the child model)
+        self.build = self._compile(serializer, prefix='')
+        if self.children:
+            self.columns.append('pk')
+
+    def _compile(self, serializer, prefix):
+        steps = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if field.source == '*' or isinstance(field, serializers.SerializerMethodField):
+                raise ImproperlyConfigured(f'{type(serializer).__name__}.{name} cannot be compiled')
+            source = prefix + field.source.replace('.', '__')
+
+            if isinstance(field, serializers.ListSerializer):
+                if prefix:
+                    raise ImproperlyConfigured(f'{type(serializer).__name__}.{name}: only top-level many=True nesting is supported')
+                relation = getattr(self.model, field.source).rel
+                self.children.append((name, CompiledSerializer(type(field.child)), relation.field.attname))
+                steps.append((name, None))
+            elif isinstance(field, serializers.BaseSerializer):
+                steps.append((name, self._nested(field, source)))
+            else:
+                self.columns.append(source)
+                steps.append((name, self._scalar(source, _converter(field))))
+
+        def build(row):
+            return {name: step(row) if step else None for name, step in steps}
+        return build
+
+    def _nested(self, field, source):
+        build = self._compile(field, prefix=source + '__')
+        # A nullable relation renders as null, like DRF does for a missing related object
+        self.columns.append(source)
+        return lambda row: None if row[source] is None else build(row)
+
+    @staticmethod
+    def _scalar(column, convert):
+        if convert is None:
+            return lambda row: row[column]
+        return lambda row: None if row[column] is None else convert(row[column])
+
+    def rows(self, queryset):
+        """The values() queryset to paginate or evaluate; keeps the queryset's filters and ordering."""
+        return queryset.values(*self.columns)
+
+    def serialize(self, rows):
+        rows = list(rows)
+        return self.assemble(rows, [list(query) for query in self.nested_queries(rows)])
+
+    async def aserialize(self, rows):
+        """serialize() for the async views: takes a list of rows and loads nested rows on the async ORM."""
+        return self.assemble(rows, [await alist(query) for query in self.nested_queries(rows)])
+
+    def nested_queries(self, rows):
+        # One query per nested serializer for the nested rows of every row on the page
+        return [
+            child.model.objects.filter(**{f'{foreign_key}__in': [row['pk'] for row in rows]}).values(foreign_key, *child.columns)
+            for _, child, foreign_key in self.children
+        ]
+
+    @timed_serialization
+    def assemble(self, rows, nested_rows):
+        data = [self.build(row) for row in rows]
+        for (name, child, foreign_key), nested in zip(self.children, nested_rows):
+            grouped = defaultdict(list)  # Nested rows grouped back by parent
+            for child_row, child_item in zip(nested, child.assemble(nested, [])):
+                grouped[child_row[foreign_key]].append(child_item)
+            for row, item in zip(rows, data):
+                item[name] = grouped[row['pk']]
+        return data
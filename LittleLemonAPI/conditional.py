@@ -0,0 +1,50 @@
+import functools
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def conditional_get(validators):
+    """
+    Answers If-None-Match / If-Modified-Since on a GET handler before it queries or serializes.
+
+    `validators(view, request, *args, **kwargs)` must return `(etag, last_modified)` from
+    something cheap, such as a version number or a single aggregate; either may be None.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            etag, timestamp, not_modified = _check(request, *validators(view, request, *args, **kwargs))
+            if not_modified is not None:
+                return not_modified
+            return _stamp(handler(view, request, *args, **kwargs), etag, timestamp)
+        return wrapper
+    return decorator
+
+
+def async_conditional_get(validators):
+    """conditional_get() for async handlers; `validators` is a coroutine function here."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(view, request, *args, **kwargs):
+            etag, timestamp, not_modified = _check(request, *await validators(view, request, *args, **kwargs))
+            if not_modified is not None:
+                return not_modified
+            return _stamp(await handler(view, request, *args, **kwargs), etag, timestamp)
+        return wrapper
+    return decorator
+
+
+def _check(request, etag, last_modified):
+    etag = quote_etag(etag) if etag else None
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return etag, timestamp, get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def _stamp(response, etag, timestamp):
+    if response.status_code == 200:
+        if etag and not response.has_header('ETag'):
+            response.headers['ETag'] = etag
+        if timestamp and not response.has_header('Last-Modified'):
+            response.headers['Last-Modified'] = http_date(timestamp)
+    return response
@@ -0,0 +1,294 @@
+"""
+Order events pushed to clients over server-sent events (/api/orders/events/ under ASGI).
+
+Customers, delivery crew and managers keep one stream open instead of re-polling /api/orders/.
+The order views publish order-created, crew-assigned and status-changed events once their
+transaction commits; the broker configured by ORDER_EVENTS fans them out to the subscriptions
+of the users they concern. A subscription is an asyncio queue, so an idle stream waits on the
+event loop without a thread and without touching the database.
+
+LocalBroker only reaches streams served by the same process. With several workers, use
+SQLiteBroker (every worker on the host) or another backend with the same interface.
+"""
+import asyncio
+import functools
+import itertools
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.renderers import BaseRenderer
+
+
+ORDER_CREATED = 'order-created'
+CREW_ASSIGNED = 'crew-assigned'
+STATUS_CHANGED = 'status-changed'
+
+MANAGERS_CHANNEL = 'managers'  # Managers see every order, so they get every event
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def encode_event(name, data, event_id=None):
+    """One SSE message; `data` is sent as a single line of JSON."""
+    message = f'id: {event_id}\n' if event_id is not None else ''
+    return f'{message}event: {name}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'
+
+
+class Event:
+    __slots__ = ('id', 'name', 'channels', 'data')
+
+    def __init__(self, id, name, channels, data):
+        self.id = id
+        self.name = name
+        self.channels = channels
+        self.data = data
+
+    def encode(self):
+        return encode_event(self.name, self.data, self.id)
+
+
+class Subscription:
+    """
+    Events for a set of channels, queued on the event loop that subscribed.
+
+    A client that stops reading loses its oldest events rather than growing the queue without
+    bound; `dropped` counts them. Clients refetch /api/orders/ whenever they (re)connect anyway.
+    """
+
+    def __init__(self, broker, channels, queue_size):
+        self.broker = broker
+        self.channels = frozenset(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(queue_size)
+        self.dropped = 0
+
+    def push(self, event):
+        # Called from whichever thread published
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:  # The loop has closed; the stream is gone
+            pass
+
+    def _put(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        """The next event; raises TimeoutError after `timeout` seconds without one."""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class EventBroker:
+    """
+    Publishes events and hands them to the subscriptions of their channels.
+
+    `publish` may be called from any thread; `subscribe` from a coroutine, whose loop receives
+    the events.
+    """
+
+    def publish(self, name, channels, data):
+        raise NotImplementedError
+
+    def subscribe(self, channels):
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+
+class LocalBroker(EventBroker):
+    """Fan-out within this process: a dict of channel -> subscriptions."""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+        self._ids = itertools.count(1)
+
+    def publish(self, name, channels, data):
+        self.deliver(Event(next(self._ids), name, list(channels), data))
+
+    def deliver(self, event):
+        with self._lock:
+            # A subscriber on two of the event's channels (a manager's own order) gets it once
+            targets = {subscription for channel in event.channels for subscription in self._subscriptions.get(channel, ())}
+        for subscription in targets:
+            subscription.push(event)
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, channels, self.queue_size)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscriptions.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[channel]
+
+    def subscriber_count(self):
+        with self._lock:
+            return len({subscription for subscribers in self._subscriptions.values() for subscription in subscribers})
+
+
+class SQLiteBroker(LocalBroker):
+    """
+    Events go through a table in a small SQLite file that every worker on the host opens, like
+    SQLiteThrottleStore. Publishing is one INSERT; each worker tails the table from a single
+    thread every `poll_interval` seconds, while it has subscribers, and fans new rows out
+    locally. Idle streams cost nothing per connection, and the main database is never queried.
+    Rows older than `retention` seconds are purged now and then.
+    """
+    purge_probability = 0.01
+
+    def __init__(self, path, poll_interval=0.25, retention=300, queue_size=100, timeout=5):
+        super().__init__(queue_size=queue_size)
+        self.path = str(path)
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.timeout = timeout
+        self._local = threading.local()
+        self._poller = None
+        self._wakeup = threading.Event()
+
+    def connection(self):
+        # One connection per thread and process; a forked worker never reuses its parent's
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            local.connection.execute('PRAGMA journal_mode=WAL')
+            local.connection.execute('PRAGMA synchronous=NORMAL')
+            local.connection.execute(
+                'CREATE TABLE IF NOT EXISTS order_event ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, channels TEXT NOT NULL,'
+                ' data TEXT NOT NULL, created REAL NOT NULL)'
+            )
+            local.pid = os.getpid()
+        return local.connection
+
+    def publish(self, name, channels, data):
+        connection = self.connection()
+        now = time.time()
+        if random.random() < self.purge_probability:
+            connection.execute('DELETE FROM order_event WHERE created < ?', (now - self.retention,))
+        connection.execute(
+            'INSERT INTO order_event (name, channels, data, created) VALUES (?, ?, ?, ?)',
+            (name, json.dumps(list(channels)), json.dumps(data, cls=DjangoJSONEncoder), now),
+        )
+
+    def subscribe(self, channels):
+        subscription = super().subscribe(channels)
+        with self._lock:
+            if self._poller is None or not self._poller.is_alive():  # Threads do not survive a fork
+                self._poller = threading.Thread(target=self.poll, name='order-events', daemon=True)
+                self._poller.start()
+        self._wakeup.set()
+        return subscription
+
+    def poll(self):
+        connection = self.connection()
+        last, = connection.execute('SELECT COALESCE(MAX(id), 0) FROM order_event').fetchone()
+        while True:
+            if not self.subscriber_count():
+                # Nobody listening: sleep until a subscription arrives, then skip what was missed
+                self._wakeup.clear()
+                if not self.subscriber_count():
+                    self._wakeup.wait()
+                last, = connection.execute('SELECT COALESCE(MAX(id), 0) FROM order_event').fetchone()
+            rows = connection.execute(
+                'SELECT id, name, channels, data FROM order_event WHERE id > ? ORDER BY id', (last,)
+            ).fetchall()
+            for event_id, name, channels, data in rows:
+                self.deliver(Event(event_id, name, json.loads(channels), json.loads(data)))
+                last = event_id
+            time.sleep(self.poll_interval)
+
+    def clear(self):
+        self.connection().execute('DELETE FROM order_event')
+
+
+@functools.cache
+def event_broker():
+    """The broker configured by ORDER_EVENTS = {'BACKEND': dotted path, 'OPTIONS': {...}}."""
+    config = getattr(settings, 'ORDER_EVENTS', {'BACKEND': 'LittleLemonAPI.events.LocalBroker'})
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+
+
+@receiver(setting_changed)
+def reset_event_broker(setting, **kwargs):
+    if setting == 'ORDER_EVENTS':
+        event_broker.cache_clear()
+
+
+def order_state(order):
+    """What the events report on: compare it before and after a change with publish_order_changes()."""
+    return order.delivery_crew_id, order.status
+
+
+def publish_order_changes(order, before=None):
+    """
+    Publishes, once the current transaction commits, order-created if `before` is None and
+    otherwise crew-assigned and/or status-changed for whatever differs from `before`, the
+    order_state() it was loaded with. Events go to the customer, the assigned crew member (and
+    one being taken off the order) and managers. Nothing is sent for an unchanged order.
+    """
+    if before is None:
+        names = [ORDER_CREATED]
+        previous_crew = None
+    else:
+        previous_crew, previous_status = before
+        names = []
+        if previous_crew != order.delivery_crew_id:
+            names.append(CREW_ASSIGNED)
+        if previous_status != order.status:
+            names.append(STATUS_CHANGED)
+        if not names:
+            return
+
+    channels = [MANAGERS_CHANNEL, user_channel(order.user_id)]
+    for crew_id in {order.delivery_crew_id, previous_crew} - {None}:
+        channels.append(user_channel(crew_id))
+    data = {'order': order.pk, 'user': order.user_id, 'delivery_crew': order.delivery_crew_id, 'status': order.status}
+
+    def publish():
+        broker = event_broker()
+        for name in names:
+            broker.publish(name, channels, data)
+
+    # A lost event only delays a client until its next refetch, so a broker error never fails the request
+    transaction.on_commit(publish, robust=True)
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets clients ask for text/event-stream. Only errors raised before a stream starts are
+    rendered with it, as a single `error` event.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return encode_event('error', data).encode()
@@ -0,0 +1,95 @@
+import csv
+import itertools
+
+from asgiref.sync import sync_to_async
+from rest_framework.renderers import JSONRenderer
+
+from .compiled import compile_serializer
+from .models import Order
+from .serializers import OrderSerializer
+
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+# One CSV row per order line; orders without lines get one row with the line columns empty
+CSV_HEADER = [
+    'order_id', 'date', 'user', 'delivery_crew', 'status', 'total',
+    'menuitem_id', 'menuitem_title', 'quantity', 'unit_price', 'price',
+]
+
+
+def orders_for_export(start=None, end=None, status=None):
+    """Orders in date order, optionally limited to an inclusive date range and a status."""
+    orders = Order.objects.order_by('date', 'id')
+    if start:
+        orders = orders.filter(date__gte=start)
+    if end:
+        orders = orders.filter(date__lte=end)
+    if status is not None:
+        orders = orders.filter(status=status)
+    return orders
+
+
+def iter_orders(queryset, chunk_size=2000):
+    """
+    Yields the orders of `queryset` as OrderSerializer would render them, without ever holding
+    more than `chunk_size` orders and their lines in memory.
+
+    Orders are read from one chunked iterator() cursor; the lines of each chunk are loaded
+    with a single query when the chunk is full.
+    """
+    compiled = compile_serializer(OrderSerializer)
+    batch = []
+    for row in compiled.rows(queryset).iterator(chunk_size=chunk_size):
+        batch.append(row)
+        if len(batch) == chunk_size:
+            yield from compiled.serialize(batch)
+            batch = []
+    if batch:
+        yield from compiled.serialize(batch)
+
+
+def ndjson_lines(orders):
+    renderer = JSONRenderer()
+    for order in orders:
+        yield renderer.render(order).decode() + '\n'
+
+
+class Echo:
+    # Pseudo-buffer for csv.writer: hands each written row straight back instead of storing it
+    def write(self, value):
+        return value
+
+
+def csv_lines(orders):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for order in orders:
+        head = [order['id'], order['date'], order['user'], order['delivery_crew'], int(order['status']), order['total']]
+        if not order['orderitem_set']:
+            yield writer.writerow(head + [''] * 5)
+        for line in order['orderitem_set']:
+            menuitem = line['menuitem']
+            yield writer.writerow(head + [menuitem['id'], menuitem['title'], line['quantity'], line['unit_price'], line['price']])
+
+
+def export_lines(output, orders):
+    """Text chunks of the export in `output` format ('ndjson' or 'csv'), one line each."""
+    return ndjson_lines(orders) if output == 'ndjson' else csv_lines(orders)
+
+
+async def aiter_lines(lines, batch_size=500):
+    """
+    The chunks of `lines` as an async iterator, for exports served by the ASGI application.
+
+    Django reads a sync iterator in an ASGI response with sync_to_async(list), holding the whole
+    export in memory before the first byte goes out. Here `batch_size` lines at a time are
+    pulled on the request's thread-sensitive thread, where the export's database cursor lives.
+    """
+    lines = iter(lines)
+    pull = sync_to_async(lambda: ''.join(itertools.islice(lines, batch_size)))
+    while chunk := await pull():
+        yield chunk
@@ -0,0 +1,48 @@
+import re
+
+import django_filters
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import MenuItem
+from .search import SEARCH_TABLE
+
+
+def fts_query(text):
+    # Each word becomes a quoted prefix term, so user input can never be read as FTS5 syntax
+    words = re.findall(r'\w+', text)
+    return ' '.join('"{}"*'.format(word.replace('"', '""')) for word in words)
+
+
+class MenuItemFilter(django_filters.FilterSet):
+    """
+    Filters for /api/menu-items/: ?category=<slug>&featured=true&price_min=&price_max=&search=.
+
+    On SQLite `search` matches titles and category titles through the FTS5 index built in
+    migration 0017; other databases fall back to case-insensitive containment lookups.
+    """
+    category = django_filters.CharFilter(field_name='category__slug')
+    featured = django_filters.BooleanFilter(method='filter_featured')
+    price_min = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
+    price_max = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
+    search = django_filters.CharFilter(method='filter_search')
+
+    class Meta:
+        model = MenuItem
+        fields = ['category', 'featured', 'price_min', 'price_max', 'search']
+
+    def filter_featured(self, queryset, name, value):
+        return queryset.featured_is(value)
+
+    def filter_search(self, queryset, name, value):
+        if connection.vendor == 'sqlite':
+            match = fts_query(value)
+            if not match:
+                return queryset
+            return queryset.filter(id__in=RawSQL(f'SELECT rowid FROM "{SEARCH_TABLE}" WHERE "{SEARCH_TABLE}" MATCH %s', [match]))
+
+        condition = Q()
+        for word in value.split():
+            condition &= Q(title__icontains=word) | Q(category__title__icontains=word)
+        return queryset.filter(condition)
@@ -0,0 +1,87 @@
+import csv
+import io
+
+from django.db import connections, router, transaction
+
+from .catalog import catalog_cache
+from .models import Category, MenuItem
+from .serializers import CategoryImportSerializer, MenuItemImportSerializer
+
+
+def read_csv(source):
+    """Rows of a CSV file (text, bytes or a file object) as dicts, with blank cells left out."""
+    if hasattr(source, 'read'):
+        source = source.read()
+    if isinstance(source, bytes):
+        source = source.decode('utf-8-sig')
+    return [{key: value for key, value in row.items() if key and value not in ('', None)}
+            for row in csv.DictReader(io.StringIO(source))]
+
+
+def validate_rows(section, rows, serializer_class, errors):
+    # Valid rows come back as (row number, data); duplicated slugs keep their first occurrence
+    valid, seen = [], set()
+    for number, row in enumerate(rows, start=1):
+        serializer = serializer_class(data=row)
+        if not serializer.is_valid():
+            errors.append({'section': section, 'row': number, 'errors': serializer.errors})
+        elif serializer.validated_data['slug'] in seen:
+            errors.append({'section': section, 'row': number, 'errors': {'slug': ['Duplicate slug in this import.']}})
+        else:
+            seen.add(serializer.validated_data['slug'])
+            valid.append((number, serializer.validated_data))
+    return valid
+
+
+def upsert(model, objects, update_fields, batch_size):
+    """Inserts or updates `objects` by slug, up to `batch_size` rows per statement; returns (created, updated)."""
+    created = updated = 0
+    # Never more rows than the backend takes in one INSERT, so each chunk is exactly one statement
+    connection = connections[router.db_for_write(model)]
+    batch_size = max(1, min(batch_size, connection.ops.bulk_batch_size(model._meta.concrete_fields, objects)))
+    for start in range(0, len(objects), batch_size):
+        chunk = objects[start:start + batch_size]
+        existing = model.objects.filter(slug__in=[obj.slug for obj in chunk]).count()
+        model.objects.bulk_create(chunk, update_conflicts=True, unique_fields=['slug'], update_fields=update_fields)
+        created += len(chunk) - existing
+        updated += existing
+    return created, updated
+
+
+def import_menu(categories=(), menu_items=(), batch_size=500, dry_run=False):
+    """
+    Creates or updates categories and menu items, matched on their slugs, from row dicts as
+    read from JSON or CSV. Invalid rows are skipped and reported with their 1-based row number;
+    everything else is written in one transaction, so the catalog cache is bumped exactly once.
+    """
+    errors = []
+    category_rows = validate_rows('categories', categories, CategoryImportSerializer, errors)
+    item_rows = validate_rows('menu_items', menu_items, MenuItemImportSerializer, errors)
+    report = {'dry_run': dry_run, 'categories': {'created': 0, 'updated': 0}, 'menu_items': {'created': 0, 'updated': 0}}
+
+    with transaction.atomic():
+        report['categories']['created'], report['categories']['updated'] = upsert(
+            Category, [Category(**data) for _, data in category_rows], ['title', 'updated_at'], batch_size)
+
+        # Every category slug the menu items name, resolved with one query
+        wanted = {data['category'] for _, data in item_rows if data.get('category')}
+        category_ids = dict(Category.objects.filter(slug__in=wanted).values_list('slug', 'id'))
+
+        items = []
+        for number, data in item_rows:
+            slug = data.pop('category', None)
+            if slug and slug not in category_ids:
+                errors.append({'section': 'menu_items', 'row': number, 'errors': {'category': [f'Unknown category "{slug}".']}})
+                continue
+            items.append(MenuItem(category_id=category_ids.get(slug), **data))
+        report['menu_items']['created'], report['menu_items']['updated'] = upsert(
+            MenuItem, items, ['title', 'price', 'featured', 'category', 'updated_at'], batch_size)
+
+        if dry_run:
+            transaction.set_rollback(True)
+        elif category_rows or items:
+            # bulk_create sends no save signals, so the catalog is invalidated here, once
+            transaction.on_commit(catalog_cache.bump)
+
+    report['errors'] = sorted(errors, key=lambda error: (error['section'] != 'categories', error['row']))
+    return report
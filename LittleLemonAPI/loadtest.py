@@ -0,0 +1,390 @@
+"""
+Scripted load tests of the whole API, run with `python manage.py loadtest`.
+
+Scenarios replay what customers, managers and delivery crew do (browse the menu, build a cart,
+check out, list orders, update deliveries) either in-process through the test client, against a
+seeded throwaway database, or over HTTP against a running server. Every request is timed per
+endpoint; `run()` returns a JSON-serializable report that `compare()` diffs against a baseline.
+"""
+import http.client
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import Group, User
+from django.db import connection, connections, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.settings import api_settings
+from rest_framework.test import APIClient
+
+from .benchmarks import MENU_WORDS, percentile, seed_menu
+from .models import Cart, Category, MenuItem, Order, OrderItem
+from .roles import DELIVERY_CREW, MANAGERS
+
+
+SCENARIOS = {}
+
+
+def scenario(name, role, description):
+    def decorator(func):
+        SCENARIOS[name] = (func, role, description)
+        return func
+    return decorator
+
+
+def unthrottled():
+    """Settings override that lifts every throttle rate, so in-process runs measure the views."""
+    rates = {scope: None for scope in api_settings.DEFAULT_THROTTLE_RATES}
+    return override_settings(REST_FRAMEWORK={**api_settings.user_settings, 'DEFAULT_THROTTLE_RATES': rates})
+
+
+USERNAME_PREFIX = 'loadtest-'
+
+
+@transaction.atomic
+def seed(scale=1.0, seed=0):
+    """
+    Users in every role, a menu, some open carts and an order history with lines, sized by
+    `scale` and reproducible from `seed`. Usernames start with USERNAME_PREFIX.
+    """
+    rng = random.Random(seed)
+    managers_group, _ = Group.objects.get_or_create(name=MANAGERS)
+    crew_group, _ = Group.objects.get_or_create(name=DELIVERY_CREW)
+
+    def users(role, count):
+        return User.objects.bulk_create([User(username=f'{USERNAME_PREFIX}{role}-{i}', password='!') for i in range(count)])
+    customers = users('customer', max(10, int(200 * scale)))
+    managers = users('manager', 2)
+    crew = users('crew', max(2, int(10 * scale)))
+    memberships = User.groups.through
+    memberships.objects.bulk_create([memberships(user=user, group=managers_group) for user in managers]
+                                    + [memberships(user=user, group=crew_group) for user in crew])
+
+    seed_menu(max(50, int(2000 * scale)), seed=seed)
+    items = list(MenuItem.objects.values_list('pk', 'price'))
+
+    Cart.objects.bulk_create([
+        Cart(user=user, menuitem_id=pk, quantity=1, unit_price=price, price=price)
+        for user in customers[::2] for pk, price in rng.sample(items, rng.randint(1, 4))
+    ])
+
+    orders, lines = [], []
+    for _ in range(max(100, int(5000 * scale))):
+        picked = [(pk, price, rng.randint(1, 3)) for pk, price in rng.sample(items, rng.randint(1, 4))]
+        orders.append(Order(
+            user=rng.choice(customers),
+            delivery_crew=rng.choice(crew) if rng.random() < 0.6 else None,
+            status=rng.random() < 0.5,
+            total=sum(price * quantity for _, price, quantity in picked),
+            date=f'2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+        ))
+        lines.append(picked)
+    Order.objects.bulk_create(orders, batch_size=5000)
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, menuitem_id=pk, quantity=quantity, unit_price=price, price=price * quantity)
+        for order, picked in zip(orders, lines) for pk, price, quantity in picked
+    ], batch_size=5000)
+
+
+class Fixture:
+    """
+    The users, tokens and ids scenarios pick from, read from whatever database is configured.
+    Users without a token get one for the run; close() deletes those tokens again.
+    """
+    sample_size = 1000
+
+    def __init__(self):
+        self.created_tokens = []
+        self.customers = list(User.objects.filter(groups=None, is_superuser=False).values_list('pk', flat=True)[:self.sample_size])
+        self.managers = list(User.objects.filter(groups__name=MANAGERS).values_list('pk', flat=True)[:self.sample_size])
+        self.crew = list(User.objects.filter(groups__name=DELIVERY_CREW).values_list('pk', flat=True)[:self.sample_size])
+        self.tokens = self.load_tokens(self.customers + self.managers + self.crew)
+        self.menu_items = list(MenuItem.objects.values_list('pk', flat=True)[:10 * self.sample_size])
+        self.categories = list(Category.objects.values_list('slug', flat=True))
+        self.crew_orders = defaultdict(list)
+        for crew_id, pk in Order.objects.filter(delivery_crew__in=self.crew).values_list('delivery_crew', 'pk')[:10 * self.sample_size]:
+            self.crew_orders[crew_id].append(pk)
+
+    def load_tokens(self, user_ids):
+        tokens = dict(Token.objects.filter(user__in=user_ids).values_list('user_id', 'key'))
+        missing = [Token(user_id=pk, key=Token.generate_key()) for pk in user_ids if pk not in tokens]
+        Token.objects.bulk_create(missing)
+        self.created_tokens = [token.key for token in missing]
+        tokens.update((token.user_id, token.key) for token in missing)
+        return tokens
+
+    def close(self):
+        """Deletes the tokens created for the run, so a live database keeps only its users' own."""
+        Token.objects.filter(key__in=self.created_tokens).delete()
+        self.created_tokens = []
+
+    def missing(self):
+        """What the scenarios need but the database lacks."""
+        needs = {'customers': self.customers, 'managers': self.managers, 'delivery crew': self.crew, 'menu items': self.menu_items}
+        return [name for name, values in needs.items() if not values]
+
+
+class InProcessTransport:
+    """Requests through the Django test client, in this process, with the queries each one ran."""
+
+    def __init__(self):
+        self.client = APIClient()
+
+    def request(self, method, path, token, body=None):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        with CaptureQueriesContext(connection) as queries:
+            if body is None:
+                response = self.client.generic(method, path)
+            else:
+                response = self.client.generic(method, path, json.dumps(body), content_type='application/json')
+            status = response.status_code
+            content = response.content
+        return status, content, len(queries)
+
+    def close(self):
+        pass
+
+
+class HttpTransport:
+    """Requests over one keep-alive HTTP connection to a running server; query counts are unknown."""
+
+    def __init__(self, base_url):
+        url = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(url.netloc, timeout=30)
+        self.prefix = url.path.rstrip('/')
+
+    def request(self, method, path, token, body=None):
+        headers = {'Authorization': f'Token {token}', 'Accept': 'application/json'}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        for attempt in (1, 2):
+            try:
+                self.connection.request(method, self.prefix + path, body=payload, headers=headers)
+                response = self.connection.getresponse()
+                return response.status, response.read(), None
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # The server closed an idle keep-alive connection; reconnect once
+                self.connection.close()
+                if attempt == 2:
+                    raise
+
+    def close(self):
+        self.connection.close()
+
+
+class Recorder:
+    """Latencies, statuses and query counts per endpoint and per scenario, for one worker."""
+
+    def __init__(self):
+        self.endpoints = defaultdict(lambda: {'seconds': [], 'queries': [], 'errors': 0, 'throttled': 0})
+        self.scenarios = defaultdict(list)
+
+    def add(self, endpoint, seconds, status, queries):
+        entry = self.endpoints[endpoint]
+        entry['seconds'].append(seconds)
+        if queries is not None:
+            entry['queries'].append(queries)
+        if status == 429:
+            entry['throttled'] += 1
+        elif status >= 400:
+            entry['errors'] += 1
+
+    def merge(self, other):
+        for endpoint, entry in other.endpoints.items():
+            mine = self.endpoints[endpoint]
+            mine['seconds'] += entry['seconds']
+            mine['queries'] += entry['queries']
+            mine['errors'] += entry['errors']
+            mine['throttled'] += entry['throttled']
+        for name, seconds in other.scenarios.items():
+            self.scenarios[name] += seconds
+
+
+class Api:
+    """What scenarios call: one user's requests, labelled by endpoint template and recorded."""
+
+    def __init__(self, transport, recorder, user_id, token):
+        self.transport = transport
+        self.recorder = recorder
+        self.user_id = user_id
+        self.token = token
+
+    def call(self, method, endpoint, query='', body=None, **params):
+        # `endpoint` is the label ('/api/orders/{id}/'); params fill it in to give the path
+        path = endpoint.format(**params) + (f'?{query}' if query else '')
+        start = time.perf_counter()
+        status, content, queries = self.transport.request(method, path, self.token, body)
+        self.recorder.add(f'{method} {endpoint}', time.perf_counter() - start, status, queries)
+        if status >= 400 or not content:
+            return None
+        return json.loads(content)
+
+    def get(self, endpoint, query='', **params):
+        return self.call('GET', endpoint, query, **params)
+
+    def post(self, endpoint, body, **params):
+        return self.call('POST', endpoint, body=body, **params)
+
+    def patch(self, endpoint, body, **params):
+        return self.call('PATCH', endpoint, body=body, **params)
+
+
+def cart_lines(fixture, rng):
+    return [{'op': 'set', 'menuitem': pk, 'quantity': rng.randint(1, 3)}
+            for pk in rng.sample(fixture.menu_items, min(len(fixture.menu_items), rng.randint(1, 4)))]
+
+
+@scenario('menu-browse', 'customers', 'Menu pages, a category, a search, cursor pages by price, an item and the categories')
+def menu_browse(api, fixture, rng):
+    api.get('/api/menu-items/')
+    api.get('/api/menu-items/', f'page={rng.randint(2, 5)}')
+    if fixture.categories:
+        api.get('/api/menu-items/', f'category={rng.choice(fixture.categories)}')
+    api.get('/api/menu-items/', f'search={rng.choice(MENU_WORDS)}')
+    api.get('/api/menu-items/', 'ordering=price&pagination=cursor')
+    api.get('/api/menu-items/{id}/', id=rng.choice(fixture.menu_items))
+    api.get('/api/categories/')
+
+
+@scenario('cart-build', 'customers', 'A batch of cart lines, one more item, then the cart')
+def cart_build(api, fixture, rng):
+    api.post('/api/cart/menu-items/', cart_lines(fixture, rng))
+    api.post('/api/cart/menu-items/', {'menuitem': rng.choice(fixture.menu_items), 'quantity': 1})
+    api.get('/api/cart/menu-items/')
+
+
+@scenario('checkout', 'customers', 'Fill the cart, place the order and read it back')
+def checkout(api, fixture, rng):
+    api.post('/api/cart/menu-items/', cart_lines(fixture, rng))
+    placed = api.post('/api/orders/', {})
+    if placed:
+        api.get('/api/orders/{id}/', id=placed['order_id'])
+
+
+@scenario('manager-orders', 'managers', 'Two cursor pages of all orders, one order and the daily sales report')
+def manager_orders(api, fixture, rng):
+    page = api.get('/api/orders/', 'pagination=cursor&page_size=50')
+    if page and page['next']:
+        api.get('/api/orders/', urlsplit(page['next']).query)
+    if page and page['results']:
+        api.get('/api/orders/{id}/', id=rng.choice(page['results'])['id'])
+    api.get('/api/analytics/sales/', 'group_by=day')
+
+
+@scenario('crew-updates', 'crew', 'Assigned orders, then a status update on one of them')
+def crew_updates(api, fixture, rng):
+    api.get('/api/orders/', 'pagination=cursor&page_size=20')
+    assigned = fixture.crew_orders.get(api.user_id)
+    if assigned:
+        api.patch('/api/orders/{id}/', {'status': rng.randint(0, 1)}, id=rng.choice(assigned))
+
+
+def _worker(transport_factory, fixture, names, iterations, rng, recorder):
+    transport = transport_factory()
+    users = {'customers': fixture.customers, 'managers': fixture.managers, 'crew': fixture.crew}
+    try:
+        for _ in range(iterations):
+            for name in names:
+                func, role, _ = SCENARIOS[name]
+                user_id = rng.choice(users[role])
+                api = Api(transport, recorder, user_id, fixture.tokens[user_id])
+                start = time.perf_counter()
+                func(api, fixture, rng)
+                recorder.scenarios[name].append(time.perf_counter() - start)
+    finally:
+        transport.close()
+
+
+def _threaded_worker(*args):
+    try:
+        _worker(*args)
+    finally:
+        connections.close_all()  # This thread's database connections, for in-process runs
+
+
+def run(transport_factory, fixture, names=None, iterations=20, concurrency=1, seed=0):
+    """
+    Runs every scenario in `names` `iterations` times on each of `concurrency` workers, each
+    with its own transport from `transport_factory`, and returns the report.
+    """
+    names = list(names or SCENARIOS)
+    recorders = [Recorder() for _ in range(concurrency)]
+    args = [(transport_factory, fixture, names, iterations, random.Random(seed + worker), recorders[worker])
+            for worker in range(concurrency)]
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        # Inline, so an in-process run shares the caller's database connection and transaction
+        _worker(*args[0])
+    else:
+        threads = [threading.Thread(target=_threaded_worker, args=worker_args) for worker_args in args]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    wall = time.perf_counter() - start
+
+    total = recorders[0]
+    for recorder in recorders[1:]:
+        total.merge(recorder)
+    requests = sum(len(entry['seconds']) for entry in total.endpoints.values())
+    return {
+        'iterations': iterations,
+        'concurrency': concurrency,
+        'seconds': round(wall, 3),
+        'requests': requests,
+        'rps': round(requests / wall, 1) if wall else None,
+        'endpoints': {endpoint: summarize(entry) for endpoint, entry in sorted(total.endpoints.items())},
+        'scenarios': {name: latencies(seconds) for name, seconds in sorted(total.scenarios.items())},
+    }
+
+
+def latencies(seconds):
+    timings = sorted(value * 1000 for value in seconds)
+    return {
+        'count': len(timings),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'max_ms': round(timings[-1], 3),
+    }
+
+
+def summarize(entry):
+    stats = latencies(entry['seconds'])
+    stats['errors'] = entry['errors']
+    stats['throttled'] = entry['throttled']
+    stats['rps'] = round(len(entry['seconds']) / sum(entry['seconds']), 1)  # One connection, back to back
+    stats['queries'] = max(entry['queries']) if entry['queries'] else None
+    return stats
+
+
+LATENCY_METRICS = ('p50_ms', 'p95_ms', 'p99_ms')
+
+
+def compare(report, baseline, tolerance=0.2, min_delta_ms=1.0):
+    """
+    Rows of (endpoint, metric, baseline value, current value, regressed) for every endpoint in
+    both reports. A latency regresses when it grows by more than `tolerance` (a fraction) and by
+    more than `min_delta_ms`, which keeps sub-millisecond jitter quiet; query counts regress on
+    any increase.
+    """
+    rows = []
+    for endpoint, current in report['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(endpoint)
+        if before is None:
+            continue
+        for metric in LATENCY_METRICS:
+            old, new = before[metric], current[metric]
+            rows.append((endpoint, metric, old, new, new > old * (1 + tolerance) and new - old > min_delta_ms))
+        if before.get('queries') is not None and current['queries'] is not None:
+            rows.append((endpoint, 'queries', before['queries'], current['queries'], current['queries'] > before['queries']))
+    return rows
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from LittleLemonAPI.benchmarks import REGISTRY
+from LittleLemonAPI.sqlite import enable_wal
+from LittleLemonAPI.testing import isolated_state
+
+
+COLUMNS = ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'queries')
+
+
+class Command(BaseCommand):
+    help = 'Runs the registered benchmarks against a throwaway test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='Benchmarks to run (default: all)')
+        parser.add_argument('--list', action='store_true', help='List the benchmarks and exit')
+        parser.add_argument('--scale', type=float, default=1.0, help='Multiplier for the seeded data size')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed calls per scenario')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for name, (_, description) in REGISTRY.items():
+                self.stdout.write(f'{name:<16}{description}')
+            return
+
+        names = options['names'] or list(REGISTRY)
+        unknown = [name for name in names if name not in REGISTRY]
+        if unknown:
+            raise CommandError(f"Unknown benchmark(s): {', '.join(unknown)}")
+
+        # Same environment as the test runner: test client host allowed, locmem email, and caches and throttle
+        # counters in a temporary directory, so benchmarks never clear the ones a running server uses
+        setup_test_environment()
+        try:
+            with isolated_state():
+                for name in names:
+                    self.run_benchmark(name, options)
+        finally:
+            teardown_test_environment()
+
+    def run_benchmark(self, name, options):
+        func, description = REGISTRY[name]
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{name}: {description}'))
+        # A fresh test database per benchmark, so seeded data never touches the real one
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        enable_wal(connection)  # As deployed
+        try:
+            rows = func(scale=options['scale'], repeat=options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        self.stdout.write(f"  {'scenario':<40}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'queries':>9}")
+        for label, stats in rows:
+            # Benchmark-specific figures (objects/s, ...) follow the common columns
+            extra = '  '.join(f'{key}={value}' for key, value in stats.items() if key not in COLUMNS)
+            queries = '-' if stats['queries'] is None else stats['queries']  # None: not counted, e.g. across threads
+            self.stdout.write(f"  {label:<40}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['max_ms']:>10}{queries:>9}  {extra}".rstrip())
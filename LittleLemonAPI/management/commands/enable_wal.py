@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from LittleLemonAPI.sqlite import enable_wal
+
+
+class Command(BaseCommand):
+    help = ('Switches a SQLite database to WAL mode, which is stored in the database file: run it once '
+            'when deploying, not on every connection')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Alias in DATABASES (default: default)')
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if alias not in connections:
+            raise CommandError(f"'{alias}' is not an alias in DATABASES")
+        connection = connections[alias]
+        if connection.vendor != 'sqlite':
+            raise CommandError('enable_wal only applies to SQLite databases')
+        mode = enable_wal(connection)
+        if mode != 'wal':
+            raise CommandError(f"{connection.settings_dict['NAME']} stayed in {mode} mode; is another process using it?")
+        if options['verbosity'] > 0:
+            self.stdout.write(f"{connection.settings_dict['NAME']} is in WAL mode")
@@ -0,0 +1,29 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from LittleLemonAPI import exports
+
+
+class Command(BaseCommand):
+    help = 'Streams orders and their lines as NDJSON or CSV, to a file or stdout'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(exports.CONTENT_TYPES), default='ndjson', dest='output')
+        parser.add_argument('--start', type=date.fromisoformat, help='First order date to include (YYYY-MM-DD)')
+        parser.add_argument('--end', type=date.fromisoformat, help='Last order date to include (YYYY-MM-DD)')
+        parser.add_argument('--status', type=int, choices=[0, 1], help='Only orders with this status')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Orders held in memory at a time')
+        parser.add_argument('-o', '--output-file', help='Write here instead of stdout')
+
+    def handle(self, *args, **options):
+        status = None if options['status'] is None else bool(options['status'])
+        orders = exports.orders_for_export(start=options['start'], end=options['end'], status=status)
+        lines = exports.export_lines(options['output'], exports.iter_orders(orders, chunk_size=options['chunk_size']))
+
+        if options['output_file']:
+            with open(options['output_file'], 'w', encoding='utf-8', newline='') as out:
+                out.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from LittleLemonAPI import imports
+
+
+class Command(BaseCommand):
+    help = 'Creates or updates categories and menu items, matched on slug, from JSON or CSV files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('json_file', nargs='?', help='JSON file with "categories" and/or "menu_items" lists')
+        parser.add_argument('--categories', help='CSV file with slug,title columns')
+        parser.add_argument('--menu-items', help='CSV file with slug,title,price,featured,category columns')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per upsert statement')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and report without saving')
+
+    def handle(self, *args, **options):
+        sections = {'categories': [], 'menu_items': []}
+        if options['json_file']:
+            with open(options['json_file'], encoding='utf-8') as source:
+                data = json.load(source)
+            sections.update({key: data.get(key, []) for key in sections})
+        for section in sections:
+            if options[section]:  # --categories / --menu-items override the JSON file's section
+                with open(options[section], encoding='utf-8-sig', newline='') as source:
+                    sections[section] = imports.read_csv(source)
+
+        report = imports.import_menu(**sections, batch_size=options['batch_size'], dry_run=options['dry_run'])
+        for error in report['errors']:
+            self.stderr.write(f"{error['section']} row {error['row']}: {json.dumps(error['errors'])}")
+        summary = ', '.join(f"{section}: {counts['created']} created, {counts['updated']} updated"
+                            for section, counts in report.items() if section in sections)
+        self.stdout.write(self.style.SUCCESS(('Dry run, nothing saved. ' if options['dry_run'] else '') + summary))
+        if report['errors']:
+            raise CommandError(f"{len(report['errors'])} row(s) were rejected")
@@ -0,0 +1,118 @@
+import json
+from contextlib import nullcontext
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from LittleLemonAPI import loadtest
+from LittleLemonAPI.sqlite import enable_wal
+from LittleLemonAPI.testing import isolated_state
+
+
+class Command(BaseCommand):
+    help = 'Runs scripted API scenarios in-process against a seeded test database, or against a running server with --url'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help='Scenarios to run (default: all)')
+        parser.add_argument('--list', action='store_true', help='List the scenarios and exit')
+        parser.add_argument('--url', help='Base URL of a running server, e.g. http://127.0.0.1:8000 (default: in-process)')
+        parser.add_argument('--seed-data', action='store_true',
+                            help='With --url, seed the configured database first (the server must use the same one)')
+        parser.add_argument('--scale', type=float, default=1.0, help='Multiplier for the seeded data size')
+        parser.add_argument('--iterations', type=int, default=20, help='Runs of each scenario per worker')
+        parser.add_argument('--concurrency', type=int, default=1, help='Workers sending requests in parallel')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the data and the scenarios')
+        parser.add_argument('--throttle', action='store_true', help='Keep the configured throttle rates in-process')
+        parser.add_argument('-o', '--output', help='Write the JSON report to this file')
+        parser.add_argument('--baseline', help='JSON report to compare against')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed latency growth over the baseline, as a fraction')
+        parser.add_argument('--fail-on-regression', action='store_true', help='Exit with an error when the comparison finds regressions')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for name, (_, role, description) in loadtest.SCENARIOS.items():
+                self.stdout.write(f'{name:<16}{role:<11}{description}')
+            return
+
+        names = options['scenarios'] or list(loadtest.SCENARIOS)
+        unknown = [name for name in names if name not in loadtest.SCENARIOS]
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(unknown)}")
+
+        report = self.run_live(names, options) if options['url'] else self.run_in_process(names, options)
+        report = {'target': options['url'] or 'in-process', 'scale': options['scale'], **report}
+        self.print_report(report)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+                output.write('\n')
+        if options['baseline']:
+            with open(options['baseline']) as baseline:
+                rows = loadtest.compare(report, json.load(baseline), tolerance=options['tolerance'])
+            regressions = self.print_comparison(rows)
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'{regressions} regression(s) against {options["baseline"]}')
+
+    def run_in_process(self, names, options):
+        # Same environment as the test runner, and a fresh test database so seeded data never touches the real one.
+        # Caches and throttle counters go to a temporary directory too: roles cached for the seeded users'
+        # ids would otherwise apply to the real users with the same ids.
+        setup_test_environment()
+        try:
+            with isolated_state():
+                old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+                enable_wal(connection)  # As deployed
+                try:
+                    loadtest.seed(options['scale'], options['seed'])
+                    with nullcontext() if options['throttle'] else loadtest.unthrottled():
+                        return loadtest.run(loadtest.InProcessTransport, loadtest.Fixture(), names, options['iterations'],
+                                            options['concurrency'], options['seed'])
+                finally:
+                    connection.creation.destroy_test_db(old_name, verbosity=0)
+        finally:
+            teardown_test_environment()
+
+    def run_live(self, names, options):
+        if options['seed_data']:
+            if User.objects.filter(username__startswith=loadtest.USERNAME_PREFIX).exists():
+                raise CommandError('This database already holds load test users; run without --seed-data')
+            loadtest.seed(options['scale'], options['seed'])
+        fixture = loadtest.Fixture()
+        try:
+            missing = fixture.missing()
+            if missing:
+                raise CommandError(f"The database has no {', '.join(missing)}; seed it first (--seed-data or seed_littlelemon)")
+            # Throttling is up to the server: 429 responses are counted per endpoint, not hidden
+            return loadtest.run(lambda: loadtest.HttpTransport(options['url']), fixture, names, options['iterations'],
+                                options['concurrency'], options['seed'])
+        finally:
+            fixture.close()
+
+    def print_report(self, report):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{report['target']}: {report['requests']} requests in {report['seconds']}s, {report['rps']} req/s"
+        ))
+        self.stdout.write(f"  {'endpoint':<34}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}{'queries':>9}{'errors':>8}")
+        for endpoint, stats in report['endpoints'].items():
+            queries = '-' if stats['queries'] is None else stats['queries']
+            errors = stats['errors'] + stats['throttled']
+            self.stdout.write(f"  {endpoint:<34}{stats['count']:>7}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+                              f"{stats['p99_ms']:>10}{stats['rps']:>9}{queries:>9}{errors:>8}")
+        self.stdout.write(f"  {'scenario':<34}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for name, stats in report['scenarios'].items():
+            self.stdout.write(f"  {name:<34}{stats['count']:>7}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+
+    def print_comparison(self, rows):
+        regressions = 0
+        self.stdout.write(self.style.MIGRATE_HEADING('Against the baseline'))
+        for endpoint, metric, before, after, regressed in rows:
+            if not regressed:
+                continue
+            regressions += 1
+            self.stdout.write(self.style.ERROR(f'  {endpoint:<34}{metric:<9}{before:>10} -> {after}'))
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS('  No regressions'))
+        return regressions
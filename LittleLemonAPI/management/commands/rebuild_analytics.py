@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from LittleLemonAPI import analytics
+from LittleLemonAPI.models import DailyCategorySales, DailyItemSales, DailySales
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily sales rollups from every order and order line'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        analytics.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {DailySales.objects.count()} daily, {DailyItemSales.objects.count()} item '
+            f'and {DailyCategorySales.objects.count()} category rollup rows'
+        ))
@@ -0,0 +1,65 @@
+import multiprocessing
+import os
+import signal
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from LittleLemonAPI import tasks
+from LittleLemonAPI.models import Task
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background tasks (LittleLemonAPI/tasks.py) until stopped with Ctrl-C or SIGTERM'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Worker threads per process')
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes, each with --threads threads')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between polls of an empty queue')
+        parser.add_argument('--burst', action='store_true', help='Exit once no task is due, e.g. from cron')
+        parser.add_argument('--retry-failed', action='store_true', help='Queue the tasks that ran out of attempts again first')
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1 or options['processes'] < 1:
+            raise CommandError('--threads and --processes must be at least 1')
+        if options['retry_failed']:
+            retried = Task.objects.filter(status=Task.FAILED).update(status=Task.QUEUED, attempts=0, run_after=timezone.now())
+            self.stdout.write(f'Queued {retried} failed task(s) again')
+
+        if options['processes'] == 1:
+            self.work(options)
+            return
+        # Children open their own connections; none may be inherited from this process
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        children = [context.Process(target=self.work, args=(options,)) for _ in range(options['processes'])]
+        for child in children:
+            child.start()
+
+        def forward(signum, frame):
+            # Each child finishes its running tasks and exits; this process waits for them below
+            for child in children:
+                if child.is_alive():
+                    os.kill(child.pid, signum)
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, forward)
+        for child in children:
+            child.join()
+
+    def work(self, options):
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stop.set())  # Finish the running tasks, then exit
+
+        verbose = options['verbosity'] > 1
+
+        def report(task, error):
+            if error:
+                retry = 'gave up' if task.attempts >= task.max_attempts else f'will retry (attempt {task.attempts}/{task.max_attempts})'
+                self.stderr.write(f'{task.name} #{task.pk} failed, {retry}:\n{error}')
+            elif verbose:
+                self.stdout.write(f'{task.name} #{task.pk} done')
+
+        tasks.run_workers(options['threads'], options['poll_interval'], options['burst'], report, stop)
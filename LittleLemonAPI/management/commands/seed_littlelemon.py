@@ -0,0 +1,43 @@
+import time
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from LittleLemonAPI import synthetic
+
+
+class Command(BaseCommand):
+    help = 'Fills the database with realistic synthetic users, menu, carts and order history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=100_000, help='Orders to generate (about 2.5 lines each)')
+        parser.add_argument('--customers', type=int, help='Customers (default: one per 20 orders)')
+        parser.add_argument('--crew', type=int, help='Delivery crew members (default: one per 200 customers)')
+        parser.add_argument('--managers', type=int, default=3)
+        parser.add_argument('--menu-items', type=int, default=200)
+        parser.add_argument('--days', type=int, default=365, help='Length of the order history')
+        parser.add_argument('--end', type=date.fromisoformat, help='Last day of the history, YYYY-MM-DD (default: today)')
+        parser.add_argument('--seed', type=int, default=0, help='Same seed and options, same data')
+        parser.add_argument('--chunk-size', type=int, default=50_000, help='Orders written per transaction')
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=synthetic.USERNAME_PREFIX).exists():
+            raise CommandError(f'The database already holds generated data (users named {synthetic.USERNAME_PREFIX}*)')
+        if options['orders'] < 0 or options['days'] < 1 or options['menu_items'] < 1:
+            raise CommandError('--orders must not be negative; --days and --menu-items must be positive')
+
+        generator = synthetic.Generator(
+            orders=options['orders'], customers=options['customers'], crew=options['crew'],
+            managers=options['managers'], menu_items=options['menu_items'], days=options['days'],
+            end=options['end'], seed=options['seed'], chunk_size=options['chunk_size'],
+        )
+        start = time.perf_counter()
+
+        def progress(orders, lines):
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f'  {orders} orders, {lines} lines ({lines / elapsed:,.0f} lines/s)')
+
+        counts = generator.run(progress=progress if options['verbosity'] > 0 else None)
+        summary = ', '.join(f"{count} {name.replace('_', ' ')}" for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Generated {summary} in {time.perf_counter() - start:.1f}s'))
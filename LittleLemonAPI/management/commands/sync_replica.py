@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from LittleLemonAPI.sqlite import copy_database
+
+
+class Command(BaseCommand):
+    help = ('Copies the primary SQLite database over a replica file, once or every few seconds: a local '
+            'stand-in for replication, with --every as the replication lag')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='replica', help='Alias of the replica in DATABASES (default: replica)')
+        parser.add_argument('--every', type=float, help='Keep copying, waiting this many seconds between copies')
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if alias == DEFAULT_DB_ALIAS or alias not in connections:
+            raise CommandError(f"'{alias}' is not a replica alias in DATABASES")
+        primary, replica = connections[DEFAULT_DB_ALIAS].settings_dict, connections[alias].settings_dict
+        if primary['ENGINE'] != replica['ENGINE'] or connections[alias].vendor != 'sqlite':
+            raise CommandError('sync_replica only copies between SQLite databases; use real replication elsewhere')
+
+        while True:
+            start = time.perf_counter()
+            copy_database(str(primary['NAME']), str(replica['NAME']))
+            if options['verbosity'] > 0:
+                self.stdout.write(f"Copied {primary['NAME']} to {replica['NAME']} in {(time.perf_counter() - start) * 1000:.0f} ms")
+            if options['every'] is None:
+                return
+            time.sleep(options['every'])
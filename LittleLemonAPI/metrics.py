@@ -0,0 +1,244 @@
+import functools
+import itertools
+import threading
+from collections import defaultdict
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+
+DEFAULTS = {
+    'ENABLED': True,
+    'BUFFER_SIZE': 8192,  # Requests kept between two scrapes; older ones are counted as dropped
+    'BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),  # Latency, in seconds
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_current = ContextVar('request_metrics', default=None)
+
+
+def options():
+    return {**DEFAULTS, **getattr(settings, 'METRICS', {})}
+
+
+class Sample:
+    """What one request spent in the database and in serializers, filled in while it runs."""
+    __slots__ = ('queries', 'db_seconds', 'serializer_seconds', 'serializing')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.serializing = False
+
+    def time_query(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += perf_counter() - start
+            self.queries += 1
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    Execute wrapper every database connection gets when it opens (see signals.py). It charges
+    the query to the request being measured, found through a context variable, which also
+    reaches the threads that sync_to_async() runs ORM calls in under ASGI.
+    """
+    sample = _current.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    return sample.time_query(execute, sql, params, many, context)
+
+
+def install_query_timer(connection):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+def timed_serialization(method):
+    """
+    Adds the time spent in `method` to the current request's serializer time. Only the outermost
+    call is timed, so nested serializers are not counted twice; outside a request it is a no-op.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        sample = _current.get()
+        if sample is None or sample.serializing:
+            return method(self, *args, **kwargs)
+        sample.serializing = True
+        start = perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            sample.serializer_seconds += perf_counter() - start
+            sample.serializing = False
+    return wrapper
+
+
+class MetricsRegistry:
+    """
+    Per-view request metrics, recorded into a fixed-size ring buffer without locks.
+
+    A request takes the next slot number from an itertools.count (atomic under the GIL) and
+    stores one tuple there, so recording never waits on other threads. Scrapes fold the samples
+    written since the previous scrape into cumulative Prometheus counters and histograms; if
+    more requests than BUFFER_SIZE arrive between two scrapes, the overwritten ones are counted
+    in littlelemon_metrics_dropped_samples_total instead of silently skewing the totals.
+    """
+
+    def __init__(self, size=None, buckets=None):
+        config = options()
+        self.size = size or config['BUFFER_SIZE']
+        self.buckets = tuple(buckets or config['BUCKETS'])
+        self._slots = [None] * self.size
+        self._counter = itertools.count()
+        self._scrape_lock = threading.Lock()  # Scrapes only; recording never takes it
+        self._folded = 0  # Sequence number of the first sample not folded into the totals yet
+        self._dropped = 0
+        self._series = defaultdict(self._new_series)
+        self._requests = defaultdict(int)
+
+    def _new_series(self):
+        return {'buckets': [0] * len(self.buckets), 'count': 0, 'seconds': 0.0, 'queries': 0,
+                'db_seconds': 0.0, 'serializer_seconds': 0.0, 'response_bytes': 0}
+
+    def record(self, view, method, status, seconds, queries, db_seconds, serializer_seconds, response_bytes):
+        sequence = next(self._counter)
+        self._slots[sequence % self.size] = (sequence, view, method, status, seconds, queries,
+                                             db_seconds, serializer_seconds, response_bytes)
+
+    def collect(self):
+        """Folds new samples into the totals; returns the request counts and per-view series."""
+        with self._scrape_lock:
+            fresh = sorted(entry for entry in list(self._slots) if entry is not None and entry[0] >= self._folded)
+            if fresh:
+                self._dropped += fresh[-1][0] + 1 - self._folded - len(fresh)
+                self._folded = fresh[-1][0] + 1
+            for _, view, method, status, seconds, queries, db_seconds, serializer_seconds, response_bytes in fresh:
+                self._requests[view, method, status] += 1
+                series = self._series[view, method]
+                for index, bound in enumerate(self.buckets):
+                    if seconds <= bound:
+                        series['buckets'][index] += 1
+                        break
+                series['count'] += 1
+                series['seconds'] += seconds
+                series['queries'] += queries
+                series['db_seconds'] += db_seconds
+                series['serializer_seconds'] += serializer_seconds
+                series['response_bytes'] += response_bytes
+            return dict(self._requests), {key: {**value, 'buckets': list(value['buckets'])}
+                                          for key, value in self._series.items()}
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format."""
+        requests, series = self.collect()
+        lines = []
+
+        def metric(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        metric('littlelemon_requests_total', 'counter', 'Requests by view, method and status code.')
+        for (view, method, status), count in sorted(requests.items()):
+            lines.append(f'littlelemon_requests_total{{{labels(view=view, method=method, status=status)}}} {count}')
+
+        metric('littlelemon_request_duration_seconds', 'histogram', 'Time spent handling requests, by view.')
+        for (view, method), values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values['buckets']):
+                cumulative += count
+                lines.append(f'littlelemon_request_duration_seconds_bucket{{{labels(view=view, method=method, le=bound)}}} {cumulative}')
+            lines.append(f'littlelemon_request_duration_seconds_bucket{{{labels(view=view, method=method, le="+Inf")}}} {values["count"]}')
+            lines.append(f'littlelemon_request_duration_seconds_sum{{{labels(view=view, method=method)}}} {values["seconds"]!r}')
+            lines.append(f'littlelemon_request_duration_seconds_count{{{labels(view=view, method=method)}}} {values["count"]}')
+
+        counters = [
+            ('littlelemon_db_queries_total', 'queries', 'Database queries run while handling requests.'),
+            ('littlelemon_db_query_seconds_total', 'db_seconds', 'Time spent in database queries.'),
+            ('littlelemon_serializer_seconds_total', 'serializer_seconds', 'Time spent in serializers.'),
+            ('littlelemon_response_bytes_total', 'response_bytes', 'Response body bytes (streamed responses count as 0).'),
+        ]
+        for name, field, help_text in counters:
+            metric(name, 'counter', help_text)
+            for (view, method), values in sorted(series.items()):
+                value = values[field]
+                lines.append(f'{name}{{{labels(view=view, method=method)}}} {value!r}')
+
+        metric('littlelemon_metrics_dropped_samples_total', 'counter', 'Requests overwritten in the ring buffer before a scrape.')
+        lines.append(f'littlelemon_metrics_dropped_samples_total {self._dropped}')
+        return '\n'.join(lines) + '\n'
+
+
+def labels(**values):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{name}="{escape(value)}"' for name, value in values.items())
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetricsMiddleware:
+    """
+    Records latency, query count and time, serializer time and response size for every request.
+
+    Views are labelled by URL route (`api/orders/<int:pk>/`), so the number of series stays
+    bounded however many objects are requested. The work per request is constant and per query
+    it is two clock reads, which the `metrics` benchmark measures.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = options()['ENABLED']
+        # Under ASGI the chain stays async, so async views are not pushed into a thread by this middleware
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        sample = Sample()
+        token = _current.set(sample)
+        start = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, sample, perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        sample = Sample()
+        token = _current.set(sample)
+        start = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, sample, perf_counter() - start)
+        return response
+
+    @staticmethod
+    def record(request, response, sample, seconds):
+        match = request.resolver_match
+        view = f'/{match.route}' if match else 'unmatched'
+        # Streamed bodies are produced after this returns; their size and queries are not known here
+        size = 0 if response.streaming else len(response.content)
+        registry.record(view, request.method, response.status_code, seconds, sample.queries,
+                        sample.db_seconds, sample.serializer_seconds, size)
@@ -0,0 +1,63 @@
+# Price ordering index, plus a full-text search index for menu items on SQLite (FTS5)
+# kept in sync with menu items and categories by triggers.
+
+from django.db import migrations, models
+
+
+FORWARDS = [
+    # Title and category title of each menu item, keyed by the menu item id (rowid)
+    """CREATE VIRTUAL TABLE "LittleLemonAPI_menuitem_fts" USING fts5(title, category, tokenize = 'unicode61 remove_diacritics 2')""",
+    """INSERT INTO "LittleLemonAPI_menuitem_fts" (rowid, title, category)
+       SELECT m.id, m.title, COALESCE(c.title, '') FROM "LittleLemonAPI_menuitem" m
+       LEFT JOIN "LittleLemonAPI_category" c ON c.id = m.category_id""",
+    """CREATE TRIGGER "LittleLemonAPI_menuitem_fts_insert" AFTER INSERT ON "LittleLemonAPI_menuitem" BEGIN
+         INSERT INTO "LittleLemonAPI_menuitem_fts" (rowid, title, category)
+         VALUES (new.id, new.title, COALESCE((SELECT title FROM "LittleLemonAPI_category" WHERE id = new.category_id), ''));
+       END""",
+    """CREATE TRIGGER "LittleLemonAPI_menuitem_fts_update" AFTER UPDATE OF title, category_id ON "LittleLemonAPI_menuitem" BEGIN
+         DELETE FROM "LittleLemonAPI_menuitem_fts" WHERE rowid = old.id;
+         INSERT INTO "LittleLemonAPI_menuitem_fts" (rowid, title, category)
+         VALUES (new.id, new.title, COALESCE((SELECT title FROM "LittleLemonAPI_category" WHERE id = new.category_id), ''));
+       END""",
+    """CREATE TRIGGER "LittleLemonAPI_menuitem_fts_delete" AFTER DELETE ON "LittleLemonAPI_menuitem" BEGIN
+         DELETE FROM "LittleLemonAPI_menuitem_fts" WHERE rowid = old.id;
+       END""",
+    """CREATE TRIGGER "LittleLemonAPI_category_fts_update" AFTER UPDATE OF title ON "LittleLemonAPI_category" BEGIN
+         DELETE FROM "LittleLemonAPI_menuitem_fts" WHERE rowid IN (SELECT id FROM "LittleLemonAPI_menuitem" WHERE category_id = new.id);
+         INSERT INTO "LittleLemonAPI_menuitem_fts" (rowid, title, category)
+         SELECT id, title, new.title FROM "LittleLemonAPI_menuitem" WHERE category_id = new.id;
+       END""",
+]
+
+BACKWARDS = [
+    'DROP TRIGGER IF EXISTS "LittleLemonAPI_category_fts_update"',
+    'DROP TRIGGER IF EXISTS "LittleLemonAPI_menuitem_fts_delete"',
+    'DROP TRIGGER IF EXISTS "LittleLemonAPI_menuitem_fts_update"',
+    'DROP TRIGGER IF EXISTS "LittleLemonAPI_menuitem_fts_insert"',
+    'DROP TABLE IF EXISTS "LittleLemonAPI_menuitem_fts"',
+]
+
+
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        # Other backends search with plain lookups, see filters.MenuItemFilter
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0016_access_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='menuitem',
+            index=models.Index(fields=['price', 'id'], name='menuitem_price_id_idx'),
+        ),
+        migrations.RunPython(run_on_sqlite(FORWARDS), run_on_sqlite(BACKWARDS)),
+    ]
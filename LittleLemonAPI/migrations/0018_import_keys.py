@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+from LittleLemonAPI.search import without_search_triggers
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0017_menuitem_search_index'),
+    ]
+
+    # Both tables are rebuilt on SQLite, which the menu search triggers would break
+    operations = without_search_triggers(
+        migrations.AddField(
+            model_name='menuitem',
+            name='slug',
+            field=models.SlugField(blank=True, max_length=255, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='category',
+            name='slug',
+            field=models.SlugField(unique=True),
+        ),
+    )
@@ -1,20 +1,146 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import connections, models, router, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
 
 class Category(models.Model):
-    slug = models.SlugField()
+    slug = models.SlugField(unique=True)
     title = models.CharField(max_length=255)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.title
 
 
+class MenuItemQuerySet(models.QuerySet):
+    def featured_is(self, featured):
+        # Django renders featured=True as a bare `WHERE featured`, which SQLite cannot match to
+        # the featured column of an index; a one-value IN is planned as an equality lookup.
+        return self.filter(featured__in=[featured])
+
+
 class MenuItem(models.Model):
     title = models.CharField(max_length=250)
+    slug = models.SlugField(max_length=255, unique=True, null=True, blank=True)  # Key for bulk imports; optional
     price = models.DecimalField(max_digits=6, decimal_places=2)
     featured = models.BooleanField(db_index=True)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True)  
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = MenuItemQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Menu browsing: filter by category and featured, ordered by price
+            models.Index(fields=['category', 'featured', 'price'], name='menuitem_cat_feat_price_idx'),
+            # Whole-menu price ordering and (price, id) cursor pages
+            models.Index(fields=['price', 'id'], name='menuitem_price_id_idx'),
+        ]
+
+
+
+class CartManager(models.Manager):
+    def add(self, user, menuitem, quantity):
+        """
+        Adds `quantity` of `menuitem` to the user's cart in one atomic statement.
+
+        A new line is inserted, or the existing one has its quantity incremented and its
+        prices recomputed from the current menu price by the database itself, so
+        concurrent adds neither lose updates nor trip the (menuitem, user) constraint.
+        """
+        connection = connections[router.db_for_write(self.model)]
+        if connection.vendor in ('sqlite', 'postgresql') and connection.features.can_return_rows_from_bulk_insert:
+            return self._upsert(connection, user, menuitem, quantity)
 
+        # Backends without INSERT ... ON CONFLICT: lock the row and increment with F()
+        with transaction.atomic(using=connection.alias):
+            cart, created = self.select_for_update().get_or_create(
+                user=user, menuitem=menuitem,
+                defaults={'quantity': quantity, 'unit_price': menuitem.price, 'price': menuitem.price * quantity},
+            )
+            if not created:
+                self.filter(pk=cart.pk).update(
+                    quantity=F('quantity') + quantity,
+                    unit_price=menuitem.price,
+                    price=menuitem.price * (F('quantity') + quantity),
+                )
+                cart.refresh_from_db()
+        return cart
+
+    def apply_batch(self, user, operations, menuitems):
+        """
+        Applies validated add/set/remove operations to the user's cart in one transaction.
+
+        `menuitems` maps every referenced menu item id to its MenuItem. Existing lines are read
+        with one query, the operations are replayed in order in memory, and the outcome is
+        written with one bulk upsert plus one delete. Returns one result per operation.
+        """
+        with transaction.atomic():
+            existing = set()
+            quantities = {}
+            for menuitem_id, quantity in self.select_for_update().filter(user=user, menuitem_id__in=menuitems).values_list('menuitem_id', 'quantity'):
+                existing.add(menuitem_id)
+                quantities[menuitem_id] = quantity
+
+            results = []
+            for operation in operations:
+                menuitem_id = operation['menuitem']
+                before = quantities.get(menuitem_id, 0)
+                if operation['op'] == 'add':
+                    after = before + operation['quantity']
+                elif operation['op'] == 'set':
+                    after = operation['quantity']
+                else:
+                    after = 0
+                quantities[menuitem_id] = after
+
+                if after == 0:
+                    result = 'removed' if before else 'not_in_cart'
+                else:
+                    result = 'updated' if before else 'added'
+                results.append({'op': operation['op'], 'menuitem': menuitem_id, 'quantity': after, 'result': result})
+
+            lines = [
+                self.model(user=user, menuitem=menuitems[menuitem_id], quantity=quantity,
+                           unit_price=menuitems[menuitem_id].price, price=menuitems[menuitem_id].price * quantity)
+                for menuitem_id, quantity in quantities.items() if quantity > 0
+            ]
+            if lines:
+                self.bulk_create(lines, update_conflicts=True, unique_fields=['menuitem', 'user'],
+                                 update_fields=['quantity', 'unit_price', 'price'])
+            removed = [menuitem_id for menuitem_id, quantity in quantities.items() if quantity == 0 and menuitem_id in existing]
+            if removed:
+                self.filter(user=user, menuitem_id__in=removed).delete()
+        return results
+
+    def _upsert(self, connection, user, menuitem, quantity):
+        opts = self.model._meta
+        qn = connection.ops.quote_name
+        table = qn(opts.db_table)
+        columns = {name: qn(opts.get_field(name).column) for name in ('id', 'user', 'menuitem', 'quantity', 'unit_price', 'price')}
+        sql = (
+            f"INSERT INTO {table} ({columns['user']}, {columns['menuitem']}, {columns['quantity']}, {columns['unit_price']}, {columns['price']}) "
+            f"VALUES (%s, %s, %s, %s, %s) "
+            f"ON CONFLICT ({columns['menuitem']}, {columns['user']}) DO UPDATE SET "
+            f"{columns['quantity']} = {table}.{columns['quantity']} + EXCLUDED.{columns['quantity']}, "
+            f"{columns['unit_price']} = EXCLUDED.{columns['unit_price']}, "
+            f"{columns['price']} = EXCLUDED.{columns['unit_price']} * ({table}.{columns['quantity']} + EXCLUDED.{columns['quantity']}) "
+            f"RETURNING {columns['id']}, {columns['quantity']}, {columns['unit_price']}, {columns['price']}"
+        )
+        params = [user.pk, menuitem.pk, quantity, connection.ops.adapt_decimalfield_value(menuitem.price, 6, 2),
+                  connection.ops.adapt_decimalfield_value(menuitem.price * quantity, 6, 2)]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            pk, new_quantity, unit_price, price = cursor.fetchone()
+
+        # SQLite hands the arithmetic back as floats; normalise to the field's precision
+        field = opts.get_field('price')
+        cents = Decimal(1).scaleb(-field.decimal_places)
+        return self.model(
+            id=pk, user=user, menuitem=menuitem, quantity=new_quantity,
+            unit_price=field.to_python(unit_price).quantize(cents), price=field.to_python(price).quantize(cents),
+        )
 
 
 class Cart(models.Model):
@@ -24,6 +150,8 @@ class Cart(models.Model):
     unit_price = models.DecimalField(max_digits=6, decimal_places=2)
     price = models.DecimalField(max_digits=6, decimal_places=2)
 
+    objects = CartManager()
+
     class Meta:
         unique_together = ('menuitem', 'user')
 
@@ -33,7 +161,16 @@ class Order(models.Model):
     delivery_crew = models.ForeignKey(User, on_delete=models.SET_NULL, related_name="delivery_crew", null=True)
     status = models.BooleanField(db_index=True, default=0)
     total = models.DecimalField(max_digits=6, decimal_places=2)
-    date = models.DateField(db_index=True)
+    date = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Newest-first order listings (and their (date, id) cursor pages) for each role
+            models.Index(fields=['-date', '-id'], name='order_date_id_idx'),
+            models.Index(fields=['user', '-date', '-id'], name='order_user_date_idx'),
+            models.Index(fields=['delivery_crew', '-date', '-id'], name='order_crew_date_idx'),
+        ]
 
 
 class OrderItem(models.Model):
@@ -44,4 +181,61 @@ class OrderItem(models.Model):
     price = models.DecimalField(max_digits=6, decimal_places=2)
 
     class Meta:
-        unique_together = ('order', 'menuitem')
\ No newline at end of file
+        unique_together = ('order', 'menuitem')
+
+# Sales rollups maintained by analytics.py; they can always be rebuilt with `manage.py rebuild_analytics`.
+# Migration 0020 fills them from the orders that existed before them. Counters are signed so deleting
+# an order that was written outside checkout can never fail.
+class DailySales(models.Model):
+    date = models.DateField(unique=True)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    order_count = models.IntegerField(default=0)
+
+
+class DailyItemSales(models.Model):
+    date = models.DateField()
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)  # Category at the time of sale
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('date', 'menuitem')
+
+
+class DailyCategorySales(models.Model):
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    order_count = models.IntegerField(default=0)  # Orders with at least one item of the category
+
+    class Meta:
+        unique_together = ('date', 'category')
+
+
+# Background work queued by tasks.py and run by `manage.py run_worker`. A task's row is deleted when it
+# succeeds; the ones left are waiting, running or out of attempts.
+class Task(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField()
+    locked_until = models.DateTimeField(null=True, blank=True)  # A running task whose worker died is retried after this
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Workers claim the oldest due task
+            models.Index(fields=['status', 'run_after'], name='task_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
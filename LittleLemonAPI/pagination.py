@@ -0,0 +1,166 @@
+import base64
+import json
+
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .aio import alist
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only cursor pagination over a composite, unique ordering such as ('-date', '-id').
+
+    The cursor holds the ordering values of the last row on the page, so the next page is a
+    plain `WHERE (date, id) < (...)` range scan: no COUNT(*) and no OFFSET, and deep pages
+    cost the same as the first one. Clients opt in per request with `?pagination=cursor`
+    (or by sending back a `cursor`); everything else keeps the default page-number pagination.
+    """
+    cursor_query_param = 'cursor'
+    opt_in_query_param = 'pagination'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering=('-id',)):
+        self.ordering = tuple(ordering)
+        self.page_size = api_settings.PAGE_SIZE or 5
+
+    @classmethod
+    def is_requested(cls, request):
+        params = request.query_params
+        return cls.cursor_query_param in params or params.get(cls.opt_in_query_param) == 'cursor'
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(request.query_params[self.page_size_query_param], strict=True, cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.page_of(list(self.window(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.page_of(await alist(self.window(queryset, request)))
+
+    def window(self, queryset, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.requested_page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded:
+            queryset = queryset.filter(self.after(self.decode_cursor(encoded, queryset.model)))
+
+        # Fetch one extra row to learn whether there is a next page without counting
+        return queryset[:self.requested_page_size + 1]
+
+    def page_of(self, results):
+        self.has_next = len(results) > self.requested_page_size
+        results = results[:self.requested_page_size]
+        self.next_position = self.position_of(results[-1]) if self.has_next else None
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(self.next_position))
+        return replace_query_param(url, self.opt_in_query_param, 'cursor')
+
+    def fields(self):
+        return [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+
+    def position_of(self, obj):
+        # Pages hold model instances, or values() dicts for compiled serializers
+        if isinstance(obj, dict):
+            return [obj[attname] for attname, _ in self.fields()]
+        return [getattr(obj, attname) for attname, _ in self.fields()]
+
+    def after(self, position):
+        # (a, b) > (x, y) expands to a > x OR (a = x AND b > y), honouring each field's direction.
+        # The redundant a >= x bound up front lets the planner walk the index as one range
+        # in order, instead of OR-ing two index searches and sorting the result.
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self.fields(), position):
+            lookup = 'lt' if descending else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        (first, descending), value = self.fields()[0], position[0]
+        return Q(**{f"{first}__{'lte' if descending else 'gte'}": value}) & condition
+
+    def encode_cursor(self, position):
+        raw = json.dumps([str(value) for value in position]).encode()
+        return base64.urlsafe_b64encode(raw).decode()
+
+    def decode_cursor(self, encoded, model):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            fields = [model._meta.get_field(name) for name, _ in self.fields()]
+            if len(values) != len(fields):
+                raise ValueError
+            return [field.to_python(value) for field, value in zip(fields, values)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+
+class KeysetPaginationViewMixin:
+    """Swaps a generic view's paginator for KeysetPagination when the request opts in."""
+    cursor_ordering = ('id',)
+
+    def get_cursor_ordering(self):
+        return self.cursor_ordering
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator') and KeysetPagination.is_requested(self.request):
+            self._paginator = KeysetPagination(ordering=self.get_cursor_ordering())
+        return super().paginator
+
+
+
+async def apaginate_queryset(paginator, queryset, request, view=None):
+    """
+    paginator.paginate_queryset() on the async ORM, for KeysetPagination and DRF's
+    PageNumberPagination. Afterwards paginator.get_paginated_response() works as usual.
+    """
+    if isinstance(paginator, KeysetPagination):
+        return await paginator.apaginate_queryset(queryset, request, view)
+    if not isinstance(paginator, PageNumberPagination):
+        raise TypeError(f'{type(paginator).__name__} has no async pagination')
+
+    # PageNumberPagination.paginate_queryset() step by step, with the count and the page awaited
+    paginator.request = request
+    page_size = paginator.get_page_size(request)
+    if not page_size:
+        return None
+    pages = paginator.django_paginator_class(queryset, page_size)
+    pages.count = await queryset.acount()  # Fills the cached property, so the page and the links never count again
+    page_number = paginator.get_page_number(request, pages)
+    try:
+        paginator.page = pages.page(page_number)
+    except InvalidPage as exc:
+        raise NotFound(paginator.invalid_page_message.format(page_number=page_number, message=str(exc)))
+    paginator.page.object_list = await alist(paginator.page.object_list)
+    if pages.num_pages > 1 and paginator.template is not None:
+        paginator.display_page_controls = True
+    return list(paginator.page)
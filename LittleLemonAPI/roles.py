@@ -0,0 +1,124 @@
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from rest_framework.permissions import SAFE_METHODS, BasePermission
+
+from .aio import cache_call
+
+
+MANAGERS = 'Managers'
+DELIVERY_CREW = 'Delivery Crew'
+
+GENERATION_KEY = 'roles:generation'
+
+
+def _cache_key(user_id):
+    # The generation lets group renames and deletes invalidate every user at once
+    generation = cache.get_or_set(GENERATION_KEY, 1, timeout=None)
+    return f'roles:{generation}:{user_id}'
+
+
+def get_roles(user):
+    """
+    Returns the names of the groups `user` belongs to.
+
+    Loaded with one query the first time, then kept on the user object for the rest of the
+    request and in the default cache across requests until the user's groups change. The
+    invalidation in signals.py only reaches other workers through that cache, so it must be
+    shared by all of them (a file, Redis or Memcached cache, not local memory).
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    roles = getattr(user, '_roles', None)
+    if roles is None:
+        key = _cache_key(user.pk)
+        roles = cache.get(key)
+        if roles is None:
+            roles = frozenset(user.groups.values_list('name', flat=True))
+            cache.set(key, roles, getattr(settings, 'ROLE_CACHE_TIMEOUT', 300))
+        user._roles = roles
+    return roles
+
+
+async def aget_roles(user):
+    """
+    get_roles() for the async views, with the group query on the async ORM. Afterwards the
+    sync helpers below (is_manager(), the permission classes) answer from `user._roles`.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    roles = getattr(user, '_roles', None)
+    if roles is None:
+        backend = caches[DEFAULT_CACHE_ALIAS]
+        key = await cache_call(backend, _cache_key, user.pk)
+        roles = await cache_call(backend, cache.get, key)
+        if roles is None:
+            roles = frozenset([name async for name in user.groups.values_list('name', flat=True)])
+            await cache_call(backend, cache.set, key, roles, getattr(settings, 'ROLE_CACHE_TIMEOUT', 300))
+        user._roles = roles
+    return roles
+
+
+def has_role(user, role):
+    return role in get_roles(user)
+
+
+def is_manager(user):
+    # Superusers act as managers everywhere
+    return user.is_authenticated and (user.is_superuser or has_role(user, MANAGERS))
+
+
+def is_delivery_crew(user):
+    return has_role(user, DELIVERY_CREW)
+
+
+def forget_roles(user_ids):
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
+
+
+def invalidate_all_roles():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 2, timeout=None)
+
+
+class IsManager(BasePermission):
+    """
+    Allows managers and superusers.
+
+    Views can keep their own wording for a refusal with
+    `permission_denied_messages = {'GET': '...', ...}`.
+    """
+    message = 'You do not have permission to perform this action.'
+
+    def has_permission(self, request, view):
+        return self.check(request, view, is_manager(request.user))
+
+    def check(self, request, view, allowed):
+        if not allowed:
+            messages = getattr(view, 'permission_denied_messages', {})
+            self.message = messages.get(request.method, self.message)
+        return allowed
+
+
+class IsManagerOrReadOnly(IsManager):
+    """Safe methods for everyone, writes for managers and superusers."""
+
+    def has_permission(self, request, view):
+        return request.method in SAFE_METHODS or super().has_permission(request, view)
+
+
+class HasRoleForMethod(IsManager):
+    """
+    Per-method role requirements, declared on the view as
+    `role_requirements = {'PATCH': (MANAGERS, DELIVERY_CREW), ...}`.
+    Methods without an entry are allowed; managers satisfy MANAGERS even as superusers.
+    """
+
+    def has_permission(self, request, view):
+        required = getattr(view, 'role_requirements', {}).get(request.method)
+        if required is None:
+            return True
+        user = request.user
+        allowed = any(is_manager(user) if role == MANAGERS else has_role(user, role) for role in required)
+        return self.check(request, view, allowed)
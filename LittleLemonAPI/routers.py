@@ -0,0 +1,133 @@
+"""
+Read/write splitting across the databases in READ_REPLICAS['ALIASES'].
+
+ReadReplicaMiddleware picks a replica for each GET, HEAD or OPTIONS request and
+ReadReplicaRouter sends that request's reads to it. Writes, reads in unsafe requests and
+everything outside a request (management commands, migrations, shell) use the primary, and so
+do reads of the models in PRIMARY_APPS and PRIMARY_MODELS.
+
+Replicas lag behind the primary, so a client that just changed its cart or placed an order
+could read the old state back. After any unsafe request the client's reads are pinned to the
+primary for PIN_SECONDS. Clients are identified by their Authorization header or session
+cookie, which is known before authentication runs. Pins live in the cache given by
+CACHE_ALIAS, which must be shared by every worker: a pin kept in one worker's memory would
+send the client's next read, served by another worker, to a stale replica. The middleware
+refuses to start with replicas and an in-process pin cache.
+"""
+import hashlib
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+from .aio import IN_PROCESS_CACHES, cache_call
+
+
+DEFAULTS = {
+    'ALIASES': [],
+    'PIN_SECONDS': 5,
+    'CACHE_ALIAS': 'default',
+}
+
+# Always read from the primary. Credentials, because a token created by a login POST is not pinned
+# (that request carries no Authorization header), so the client's next request would look it up on a
+# replica that has not seen it yet. The catalog, because responses are cached under the catalog
+# version kept with the primary's writes: rendered from a lagging replica, old rows would be cached
+# under the new version. Most catalog requests are served from that cache anyway.
+PRIMARY_APPS = {'auth', 'authtoken', 'contenttypes', 'sessions'}
+PRIMARY_MODELS = {'LittleLemonAPI.Category', 'LittleLemonAPI.MenuItem'}
+
+# The database that reads of the current request go to; None means the primary
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def options():
+    return {**DEFAULTS, **getattr(settings, 'READ_REPLICAS', {})}
+
+
+def read_alias():
+    """The alias the current request reads from, or None for the primary."""
+    return _read_alias.get()
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_APPS or model._meta.label in PRIMARY_MODELS:
+            return DEFAULT_DB_ALIAS
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # Replicas hold the same rows as the primary
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema from the primary
+        return db == DEFAULT_DB_ALIAS
+
+
+def client_key(request):
+    # Hashed, so the cache never holds credentials
+    credentials = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credentials:
+        return None
+    return 'db-pin:' + hashlib.sha256(credentials.encode()).hexdigest()
+
+
+class ReadReplicaMiddleware:
+    """Chooses the database that each request reads from, and pins clients after their writes."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = options()
+        self.replicas = list(config['ALIASES'])
+        self.pin_seconds = config['PIN_SECONDS']
+        self.cache = caches[config['CACHE_ALIAS']]
+        if self.replicas and isinstance(self.cache, IN_PROCESS_CACHES):
+            raise ImproperlyConfigured(
+                f"READ_REPLICAS['CACHE_ALIAS'] {config['CACHE_ALIAS']!r} is private to each process; read-your-writes "
+                'pins need a cache every worker shares (file, database, Redis or Memcached)')
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.replicas:
+            return self.get_response(request)
+
+        key = client_key(request)
+        safe = request.method in SAFE_METHODS
+        pinned = key is not None and safe and self.cache.get(key)
+        token = _read_alias.set(random.choice(self.replicas) if safe and not pinned else None)
+        try:
+            return self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+            if key is not None and not safe:
+                self.cache.set(key, True, self.pin_seconds)
+
+    async def __acall__(self, request):
+        if not self.replicas:
+            return await self.get_response(request)
+
+        key = client_key(request)
+        safe = request.method in SAFE_METHODS
+        pinned = key is not None and safe and await cache_call(self.cache, self.cache.get, key)
+        token = _read_alias.set(random.choice(self.replicas) if safe and not pinned else None)
+        try:
+            return await self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+            if key is not None and not safe:
+                await cache_call(self.cache, self.cache.set, key, True, self.pin_seconds)
@@ -0,0 +1,56 @@
+"""
+Triggers that keep the SQLite FTS5 menu search table (created in migration 0017) in sync.
+
+SQLite cannot ALTER most column definitions, so Django rebuilds a table to change it, and a
+rebuild of the menu item or category table fails while these triggers reference it. Migrations
+that alter either table wrap their operations with `without_search_triggers(...)`.
+"""
+from django.db import migrations
+
+
+SEARCH_TABLE = 'LittleLemonAPI_menuitem_fts'
+
+TRIGGERS = {
+    'LittleLemonAPI_menuitem_fts_insert': """
+        CREATE TRIGGER "LittleLemonAPI_menuitem_fts_insert" AFTER INSERT ON "LittleLemonAPI_menuitem" BEGIN
+          INSERT INTO "LittleLemonAPI_menuitem_fts" (rowid, title, category)
+          VALUES (new.id, new.title, COALESCE((SELECT title FROM "LittleLemonAPI_category" WHERE id = new.category_id), ''));
+        END""",
+    'LittleLemonAPI_menuitem_fts_update': """
+        CREATE TRIGGER "LittleLemonAPI_menuitem_fts_update" AFTER UPDATE OF title, category_id ON "LittleLemonAPI_menuitem" BEGIN
+          DELETE FROM "LittleLemonAPI_menuitem_fts" WHERE rowid = old.id;
+          INSERT INTO "LittleLemonAPI_menuitem_fts" (rowid, title, category)
+          VALUES (new.id, new.title, COALESCE((SELECT title FROM "LittleLemonAPI_category" WHERE id = new.category_id), ''));
+        END""",
+    'LittleLemonAPI_menuitem_fts_delete': """
+        CREATE TRIGGER "LittleLemonAPI_menuitem_fts_delete" AFTER DELETE ON "LittleLemonAPI_menuitem" BEGIN
+          DELETE FROM "LittleLemonAPI_menuitem_fts" WHERE rowid = old.id;
+        END""",
+    'LittleLemonAPI_category_fts_update': """
+        CREATE TRIGGER "LittleLemonAPI_category_fts_update" AFTER UPDATE OF title ON "LittleLemonAPI_category" BEGIN
+          DELETE FROM "LittleLemonAPI_menuitem_fts" WHERE rowid IN (SELECT id FROM "LittleLemonAPI_menuitem" WHERE category_id = new.id);
+          INSERT INTO "LittleLemonAPI_menuitem_fts" (rowid, title, category)
+          SELECT id, title, new.title FROM "LittleLemonAPI_menuitem" WHERE category_id = new.id;
+        END""",
+}
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for name in TRIGGERS:
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS "{name}"')
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in TRIGGERS.values():
+            schema_editor.execute(sql)
+
+
+def without_search_triggers(*operations):
+    """Migration operations with the search triggers dropped around them, in both directions."""
+    return [
+        migrations.RunPython(drop_triggers, create_triggers),
+        *operations,
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -1,19 +1,43 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 from .models import MenuItem, Category, Cart, Order, OrderItem
+from .metrics import timed_serialization
 
-class CategorySerializer(serializers.ModelSerializer):
+
+class EagerLoadingMixin:
+    # Related data a serializer reads, so views can load it up front instead of once per object
+    select_related_fields = ()
+    prefetch_related_fields = ()
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        if cls.select_related_fields:
+            queryset = queryset.select_related(*cls.select_related_fields)
+        if cls.prefetch_related_fields:
+            queryset = queryset.prefetch_related(*cls.prefetch_related_fields)
+        return queryset
+
+
+class TimedSerializerMixin:
+    # Counts rendering time towards the request's serializer time (metrics.py)
+    @timed_serialization
+    def to_representation(self, instance):
+        return super().to_representation(instance)
+
+
+class CategorySerializer(TimedSerializerMixin, EagerLoadingMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'slug', 'title']
 
 
-class MenuItemSerializer(serializers.ModelSerializer):
+class MenuItemSerializer(TimedSerializerMixin, EagerLoadingMixin, serializers.ModelSerializer):
     class Meta:
         model = MenuItem
         fields = ['id', 'title', 'price', 'featured']
 
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(TimedSerializerMixin, EagerLoadingMixin, serializers.ModelSerializer):
     class Meta:
         model = Cart
         fields = ['user', 'menuitem', 'quantity', 'unit_price', 'price']
@@ -24,30 +48,27 @@ class CartSerializer(serializers.ModelSerializer):
         menuitem = validated_data['menuitem']
         quantity = validated_data['quantity']
 
-        # Check if cart item already exists
-        existing_cart_item = Cart.objects.filter(user=user, menuitem=menuitem).first()
+        # Insert the line or add to an existing one in a single atomic upsert
+        return Cart.objects.add(user, menuitem, quantity)
 
-        if existing_cart_item:
-            # If it exists, update the quantity and prices
-            existing_cart_item.quantity += quantity
-            existing_cart_item.unit_price = menuitem.price
-            existing_cart_item.price = existing_cart_item.unit_price * existing_cart_item.quantity
-            existing_cart_item.save()
-            return existing_cart_item
-        else:
-            # If not, create new entry
-            unit_price = menuitem.price
-            total_price = unit_price * quantity
 
-            validated_data['user'] = user
-            validated_data['unit_price'] = unit_price
-            validated_data['price'] = total_price
+# One entry of a batch cart request: {"op": "add" | "set" | "remove", "menuitem": id, "quantity": n}
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['add', 'set', 'remove'])
+    menuitem = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0, max_value=32767, required=False)
 
-            return super().create(validated_data)
+    def validate(self, attrs):
+        if attrs['op'] != 'remove' and 'quantity' not in attrs:
+            raise serializers.ValidationError({'quantity': 'This field is required.'})
+        if attrs['op'] == 'add' and attrs['quantity'] < 1:
+            raise serializers.ValidationError({'quantity': 'Ensure this value is greater than or equal to 1.'})
+        return attrs
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(TimedSerializerMixin, EagerLoadingMixin, serializers.ModelSerializer):
     menuitem = MenuItemSerializer(read_only=True)
+    select_related_fields = ('menuitem',)
 
     class Meta:
         model = OrderItem
@@ -55,9 +76,65 @@ class OrderItemSerializer(serializers.ModelSerializer):
 
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(TimedSerializerMixin, EagerLoadingMixin, serializers.ModelSerializer):
     orderitem_set = OrderItemSerializer(many=True, read_only=True)
 
     class Meta:
         model = Order
-        fields = ['id', 'user', 'delivery_crew', 'status', 'total', 'date', 'orderitem_set']
\ No newline at end of file
+        fields = ['id', 'user', 'delivery_crew', 'status', 'total', 'date', 'orderitem_set']
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        # Order lines come from one prefetch query that already joins their menu items
+        order_items = OrderItemSerializer.setup_eager_loading(OrderItem.objects.all())
+        return queryset.prefetch_related(Prefetch('orderitem_set', queryset=order_items))
+
+
+
+# Rows of a bulk menu import (imports.py); menu items name their category by slug
+class CategoryImportSerializer(serializers.Serializer):
+    slug = serializers.SlugField(max_length=50)
+    title = serializers.CharField(max_length=255)
+
+
+class MenuItemImportSerializer(serializers.Serializer):
+    slug = serializers.SlugField(max_length=255)
+    title = serializers.CharField(max_length=250)
+    price = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=0)
+    featured = serializers.BooleanField(default=False)
+    category = serializers.SlugField(required=False, allow_null=True)
+
+
+
+# Query parameters of the sales analytics endpoint
+class SalesReportQuerySerializer(serializers.Serializer):
+    group_by = serializers.ChoiceField(choices=['day', 'week', 'category'], default='day')
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    top = serializers.IntegerField(min_value=1, max_value=20, default=3)
+
+
+# Query parameters of the order export endpoint
+class OrderExportQuerySerializer(serializers.Serializer):
+    output = serializers.ChoiceField(choices=['ndjson', 'csv'], default='ndjson')
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    status = serializers.BooleanField(required=False, allow_null=True, default=None)
+
+
+class TopItemSerializer(serializers.Serializer):
+    menuitem = serializers.IntegerField()
+    title = serializers.CharField()
+    quantity = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+# One bucket of the sales report; only the key matching group_by is present
+class SalesReportRowSerializer(serializers.Serializer):
+    day = serializers.DateField(required=False)
+    week = serializers.DateField(required=False)
+    category = serializers.IntegerField(required=False)
+    title = serializers.CharField(required=False)
+    revenue = serializers.DecimalField(max_digits=12, decimal_places=2)
+    orders = serializers.IntegerField()
+    top_items = TopItemSerializer(many=True)
@@ -0,0 +1,73 @@
+from django.contrib.auth.models import Group, User
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from . import analytics, metrics, roles, sqlite
+from .authentication import forget_tokens
+from .catalog import catalog_cache
+from .models import Category, MenuItem, Order
+
+
+# Every database connection reports its queries to the request metrics
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    metrics.install_query_timer(connection)
+
+
+# SQLite connections get the production pragmas (WAL, busy timeout, cache sizes) before their first query
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    sqlite.configure_connection(connection)
+
+
+# Any catalog change, from the API views or the admin, invalidates every cached catalog response.
+# The bump waits for the commit: a reader racing the transaction would otherwise cache the old rows
+# under the new version.
+@receiver([post_save, post_delete], sender=MenuItem)
+@receiver([post_save, post_delete], sender=Category)
+def bump_catalog_version(sender, **kwargs):
+    transaction.on_commit(catalog_cache.bump)
+
+
+# Cached roles are dropped whenever group membership changes, from either side of the relation
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_roles_on_membership_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        # user.groups.add(...): the instance is the user
+        instance.__dict__.pop('_roles', None)
+        roles.forget_roles([instance.pk])
+    elif pk_set:
+        # group.user_set.add(...): pk_set holds the affected users
+        roles.forget_roles(pk_set)
+    else:
+        # group.user_set.clear() does not say who was affected
+        roles.invalidate_all_roles()
+
+
+# Roles are group names, so renaming or deleting a group invalidates everyone
+@receiver([post_save, post_delete], sender=Group)
+def invalidate_roles_on_group_change(sender, **kwargs):
+    roles.invalidate_all_roles()
+
+
+# Cached token identities go away with the token (logout) or whenever the user changes
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    forget_tokens([instance.key])
+
+
+@receiver([post_save, post_delete], sender=User)
+def forget_user_tokens(sender, instance, **kwargs):
+    forget_tokens(Token.objects.filter(user_id=instance.pk).values_list('key', flat=True))
+
+
+# Deleted orders leave the sales rollups while their lines can still be read
+@receiver(pre_delete, sender=Order)
+def remove_order_from_rollups(sender, instance, **kwargs):
+    analytics.forget_order(instance)
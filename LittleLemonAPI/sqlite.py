@@ -0,0 +1,52 @@
+"""
+SQLite production profile: WAL mode, switched on once per deploy with `manage.py enable_wal`,
+the pragmas in settings.SQLITE_PRAGMAS, set on every new connection (signals.py), and BEGIN
+IMMEDIATE transactions and persistent connections in DATABASES.
+
+With the default rollback journal, a writer locks readers out and concurrent checkouts queue on
+the single write lock. A deferred transaction (Django's default BEGIN) takes that lock only at
+its first write; when another connection holds it, SQLite cannot wait without risking a
+deadlock and fails at once with "database is locked", whatever the busy timeout. WAL lets
+readers run alongside the writer, and BEGIN IMMEDIATE takes the write lock up front, where the
+busy timeout does apply, so writers wait their turn instead of failing.
+"""
+import sqlite3
+
+from django.conf import settings
+
+
+def configure_connection(connection):
+    """Applies settings.SQLITE_PRAGMAS to a new SQLite connection; other backends are left alone."""
+    if connection.vendor != 'sqlite':
+        return
+    # The DB-API connection directly: these are not queries of the request that opened the connection
+    for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+        connection.connection.execute(f'PRAGMA {name} = {value}')
+
+
+def enable_wal(connection):
+    """
+    Switches the database of `connection` to WAL mode and returns the journal mode now in use.
+    The mode is written into the database file and sticks, so this is a deploy step rather than a
+    per-connection pragma: opening the database never rewrites its header.
+    """
+    connection.ensure_connection()
+    return connection.connection.execute('PRAGMA journal_mode = WAL').fetchone()[0]
+
+
+def pragma(connection, name):
+    """The current value of a pragma on `connection`, e.g. pragma(connection, 'journal_mode') -> 'wal'."""
+    connection.ensure_connection()
+    return connection.connection.execute(f'PRAGMA {name}').fetchone()[0]
+
+
+def copy_database(source, target, pages=1024):
+    """
+    Copies the SQLite file `source` over `target` with SQLite's online backup, a consistent
+    snapshot even while other processes write to `source`. Readers of `target` see either the
+    old or the new copy; the copy waits for them between steps of `pages` pages.
+    """
+    with sqlite3.connect(source) as source_db, sqlite3.connect(target) as target_db:
+        source_db.backup(target_db, pages=pages)
+    source_db.close()
+    target_db.close()
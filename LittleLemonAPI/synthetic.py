@@ -0,0 +1,272 @@
+"""
+Synthetic restaurant data at production scale, for `python manage.py seed_littlelemon`.
+
+Everything is drawn from one random.Random(seed), so the same seed and options always produce
+the same rows (dates count back from `end`). The shapes follow a real restaurant rather than
+uniform noise: a few customers order far more often than most, a few dishes account for most
+sales, most orders hold one to three lines, Fridays and weekends are the busy days and volume
+grows over the period, and each delivery crew member works five fixed days a week.
+"""
+import bisect
+import itertools
+import random
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import Group, User
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import analytics
+from .catalog import catalog_cache
+from .models import Cart, Category, MenuItem, Order, OrderItem
+from .roles import DELIVERY_CREW, MANAGERS
+
+
+USERNAME_PREFIX = 'seed-'
+
+# slug, title, price range in whole currency units
+CATEGORIES = [
+    ('starters', 'Starters', (4, 12)),
+    ('salads', 'Salads', (7, 15)),
+    ('mains', 'Mains', (12, 32)),
+    ('pasta', 'Pasta', (10, 22)),
+    ('grill', 'Grill', (15, 38)),
+    ('sides', 'Sides', (3, 8)),
+    ('desserts', 'Desserts', (5, 11)),
+    ('drinks', 'Drinks', (2, 9)),
+]
+DISH_WORDS = [
+    'grilled', 'lemon', 'chicken', 'lamb', 'souvlaki', 'greek', 'feta', 'olive', 'bruschetta', 'honey',
+    'yogurt', 'roasted', 'garlic', 'fish', 'mushroom', 'risotto', 'orange', 'baklava', 'pita', 'hummus',
+    'falafel', 'tomato', 'octopus', 'halloumi', 'spinach', 'pie', 'moussaka', 'shrimp', 'saganaki', 'tzatziki',
+]
+
+WEEKDAY_WEIGHTS = (0.8, 0.85, 0.9, 1.0, 1.3, 1.45, 1.2)  # Monday first
+GROWTH = 0.5  # The last day of the period is this much busier than the first, weekday aside
+LINES_PER_ORDER = ((1, 2, 3, 4, 5, 6, 7, 8), (30, 28, 18, 10, 6, 4, 2, 2))
+LINE_QUANTITY = ((1, 2, 3, 4), (75, 18, 5, 2))
+DISH_POPULARITY = 1.1  # Zipf exponent of dish popularity: the top dish outsells the tenth about 12 to 1
+CUSTOMER_ACTIVITY = 1.2  # Pareto shape of how often customers order; lower is more skewed
+
+
+def cumulative(weights):
+    return list(itertools.accumulate(weights))
+
+
+def money(cents):
+    return '%d.%02d' % divmod(cents, 100)
+
+
+def insert_rows(model, fields, rows):
+    """
+    Inserts tuples of `fields` values with one prepared INSERT and executemany(). At millions of
+    rows, building a model instance per row and compiling SQL per batch in bulk_create() costs
+    more than the inserts themselves; values must already be in their database form.
+    """
+    opts = model._meta
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(opts.get_field(name).column) for name in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    with connection.cursor() as cursor:
+        cursor.executemany(f'INSERT INTO {quote(opts.db_table)} ({columns}) VALUES ({placeholders})', rows)
+
+
+@contextmanager
+def bulk_load_pragmas():
+    """
+    SQLite settings for a one-off bulk load, restored afterwards: no fsync per commit (a crash
+    mid-load loses the load, not earlier data, since the journal still protects each
+    transaction), a 256 MiB page cache and in-memory temporary tables. Skipped inside an outer
+    transaction, where SQLite refuses to change them and there is a single commit anyway.
+    """
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        yield
+        return
+    pragmas = {'synchronous': 'OFF', 'cache_size': '-262144', 'temp_store': 'MEMORY'}
+    with connection.cursor() as cursor:
+        saved = {}
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}')
+            saved[name] = cursor.fetchone()[0]
+            cursor.execute(f'PRAGMA {name} = {value}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for name, value in saved.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+
+
+class Generator:
+    """Generates a whole dataset; `run()` writes it and returns the row counts."""
+
+    def __init__(self, orders, customers=None, crew=None, managers=3, menu_items=200, days=365,
+                 end=None, open_carts=None, seed=0, chunk_size=50_000):
+        self.orders = orders
+        self.customers = customers or max(100, orders // 20)
+        self.crew = crew or max(2, self.customers // 200)
+        self.managers = managers
+        self.menu_items = menu_items
+        self.days = days
+        self.end = end or date.today()
+        self.open_carts = self.customers // 20 if open_carts is None else open_carts
+        self.chunk_size = chunk_size
+        self.rng = random.Random(seed)
+
+    def run(self, progress=None):
+        counts = {}
+        with bulk_load_pragmas():
+            with transaction.atomic():
+                customers, crew_by_weekday = self.create_users()
+                items = self.create_menu()
+            counts['users'] = self.customers + self.crew + self.managers
+            counts['menu_items'] = len(items)
+            counts['orders'], counts['order_items'] = self.create_orders(customers, crew_by_weekday, items, progress)
+            with transaction.atomic():
+                counts['cart_items'] = self.create_carts(customers, items)
+                analytics.rebuild()
+        catalog_cache.bump()  # bulk_create sends no signals
+        return counts
+
+    def create_users(self):
+        rng = self.rng
+
+        def users(role, count):
+            # An unusable password, as set_password(None) would give, without hashing per user
+            return User.objects.bulk_create(
+                [User(username=f'{USERNAME_PREFIX}{role}-{i}', password='!', email=f'{role}{i}@example.com') for i in range(count)],
+                batch_size=5000,
+            )
+        customers = [user.pk for user in users('customer', self.customers)]
+        crew = users('crew', self.crew)
+        managers = users('manager', self.managers)
+
+        memberships = User.groups.through
+        managers_group, _ = Group.objects.get_or_create(name=MANAGERS)
+        crew_group, _ = Group.objects.get_or_create(name=DELIVERY_CREW)
+        memberships.objects.bulk_create([memberships(user=user, group=managers_group) for user in managers]
+                                        + [memberships(user=user, group=crew_group) for user in crew])
+
+        crew_by_weekday = [[] for _ in range(7)]
+        for member in crew:
+            for weekday in rng.sample(range(7), 5):
+                crew_by_weekday[weekday].append(member.pk)
+        for weekday, members in enumerate(crew_by_weekday):
+            if not members:  # Tiny crews: somebody always works
+                members.append(crew[weekday % len(crew)].pk)
+        return customers, crew_by_weekday
+
+    def create_menu(self):
+        rng = self.rng
+        categories = Category.objects.bulk_create([
+            Category(slug=f'{USERNAME_PREFIX}{slug}', title=title) for slug, title, _ in CATEGORIES
+        ])
+        menu = []
+        for i in range(self.menu_items):
+            category = rng.randrange(len(CATEGORIES))
+            low, high = CATEGORIES[category][2]
+            menu.append(MenuItem(
+                title=' '.join(rng.sample(DISH_WORDS, 2)).title() + f' {CATEGORIES[category][1][:-1]} {i}',
+                slug=f'{USERNAME_PREFIX}dish-{i}',
+                price=Decimal(rng.randrange(low * 100, high * 100, 50)) / 100,
+                featured=rng.random() < 0.1,
+                category=categories[category],
+            ))
+        MenuItem.objects.bulk_create(menu, batch_size=5000)
+        return [(item.pk, item.price) for item in menu]
+
+    def order_days(self):
+        # How many orders each day of the period gets, oldest first
+        start = self.end - timedelta(days=self.days - 1)
+        days = [start + timedelta(days=offset) for offset in range(self.days)]
+        weights = [WEEKDAY_WEIGHTS[day.weekday()] * (1 + GROWTH * offset / max(1, self.days - 1))
+                   for offset, day in enumerate(days)]
+        counts = [0] * self.days
+        for index in self.rng.choices(range(self.days), cum_weights=cumulative(weights), k=self.orders):
+            counts[index] += 1
+        return days, counts
+
+    def create_orders(self, customers, crew_by_weekday, items, progress=None):
+        rng = self.rng
+        customer_weights = cumulative(rng.paretovariate(CUSTOMER_ACTIVITY) for _ in customers)
+        ranks = list(range(1, len(items) + 1))
+        rng.shuffle(ranks)
+        item_weights = cumulative(rank ** -DISH_POPULARITY for rank in ranks)
+        dishes = [(pk, int(price * 100)) for pk, price in items]  # Prices in cents: integer sums are exact and fast
+        lines_choices, lines_weights = LINES_PER_ORDER[0], cumulative(LINES_PER_ORDER[1])
+        quantity_choices, quantity_weights = LINE_QUANTITY[0], cumulative(LINE_QUANTITY[1])
+        random_, bisect_ = rng.random, bisect.bisect
+
+        def pick(population, weights):
+            # random.choices() for a single draw, without building a list per call
+            return population[bisect_(weights, random_() * weights[-1])]
+
+        # Order ids are assigned here, so lines can point at their order without reading ids back
+        next_id = (Order.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+        updated_at = connection.ops.adapt_datetimefield_value(timezone.now())
+        days, per_day = self.order_days()
+        recent = self.end - timedelta(days=1)
+        orders, lines = [], []
+        orders_written = lines_written = 0
+
+        def flush():
+            nonlocal orders_written, lines_written
+            with transaction.atomic():
+                insert_rows(Order, ('id', 'user', 'delivery_crew', 'status', 'total', 'date', 'updated_at'), orders)
+                insert_rows(OrderItem, ('order', 'menuitem', 'quantity', 'unit_price', 'price'), lines)
+            orders_written += len(orders)
+            lines_written += len(lines)
+            orders.clear()
+            lines.clear()
+            if progress:
+                progress(orders_written, lines_written)
+
+        for day, count in zip(days, per_day):
+            working = crew_by_weekday[day.weekday()]
+            settled = day < recent  # Older orders are assigned and delivered; the last day's are still in flight
+            day = day.isoformat()
+            for _ in range(count):
+                basket = {}
+                for _ in range(pick(lines_choices, lines_weights)):
+                    menuitem_id, cents = pick(dishes, item_weights)
+                    # The same dish drawn twice is one line with a larger quantity, as the cart would make it
+                    basket[menuitem_id] = (cents, basket.get(menuitem_id, (0, 0))[1] + pick(quantity_choices, quantity_weights))
+                total = 0
+                for menuitem_id, (cents, quantity) in basket.items():
+                    lines.append((next_id, menuitem_id, quantity, money(cents), money(cents * quantity)))
+                    total += cents * quantity
+                assigned = random_() < (0.97 if settled else 0.5)
+                orders.append((
+                    next_id,
+                    pick(customers, customer_weights),
+                    working[int(random_() * len(working))] if assigned else None,
+                    assigned and random_() < (0.98 if settled else 0.3),
+                    money(total),
+                    day,
+                    updated_at,
+                ))
+                next_id += 1
+                if len(orders) >= self.chunk_size:
+                    flush()
+        if orders:
+            flush()
+        # Explicit ids leave sequences behind on backends that have them (a no-op on SQLite)
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Order]):
+                cursor.execute(sql)
+        return orders_written, lines_written
+
+    def create_carts(self, customers, items):
+        rng = self.rng
+        carts = []
+        for user_id in rng.sample(customers, min(self.open_carts, len(customers))):
+            for menuitem_id, unit_price in rng.sample(items, min(len(items), rng.randint(1, 4))):
+                quantity = rng.randint(1, 2)
+                carts.append(Cart(user_id=user_id, menuitem_id=menuitem_id, quantity=quantity,
+                                  unit_price=unit_price, price=unit_price * quantity))
+        Cart.objects.bulk_create(carts, batch_size=5000)
+        return len(carts)
@@ -0,0 +1,201 @@
+"""
+Background tasks stored in the database and run by `python manage.py run_worker`.
+
+enqueue() writes the task in the caller's transaction: workers see it once that transaction
+commits and never if it rolls back, as with transaction.on_commit(), but the task survives a
+crash right after the commit. Checkout queues its follow-up work this way and returns as soon
+as the order is written.
+
+A worker claims the oldest due task, runs it, and deletes its row in the same transaction as
+the task's own database writes, so a task that succeeded is never run again. A failed task is
+retried with exponential backoff until it has used `max_attempts`, then left in the table as
+failed for `run_worker --retry-failed` to pick up. A task whose worker died is claimed again
+once its lease runs out. Deleting a task's row cancels it, even while it runs: its work is
+rolled back when the row is found gone.
+"""
+import random
+import threading
+import traceback
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from . import analytics, events
+from .models import Category, MenuItem, Order, Task
+from .roles import DELIVERY_CREW
+
+
+DEFAULTS = {
+    'MAX_ATTEMPTS': 5,
+    'BACKOFF_SECONDS': 2,  # Before the first retry; doubled for each further one
+    'MAX_BACKOFF_SECONDS': 600,
+    'LEASE_SECONDS': 300,  # How long a task may run before another worker assumes its worker died
+}
+
+REGISTRY = {}
+
+
+class Cancelled(Exception):
+    """The task's row was deleted while it ran."""
+
+
+def options():
+    return {**DEFAULTS, **getattr(settings, 'TASKS', {})}
+
+
+def task(name, max_attempts=None):
+    """Registers the decorated function as the task `name`; its arguments must be JSON-serializable keywords."""
+    def decorator(func):
+        REGISTRY[name] = (func, max_attempts)
+        return func
+    return decorator
+
+
+def enqueue(name, delay=0, **kwargs):
+    """Queues the task `name` to run with `kwargs`, at the earliest `delay` seconds from now."""
+    if name not in REGISTRY:
+        raise LookupError(f'Unknown task {name!r}')
+    max_attempts = REGISTRY[name][1] or options()['MAX_ATTEMPTS']
+    return Task.objects.create(name=name, kwargs=kwargs, max_attempts=max_attempts,
+                               run_after=timezone.now() + timedelta(seconds=delay))
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying a task that failed `attempts` times, with jitter so retries spread out."""
+    config = options()
+    delay = min(config['MAX_BACKOFF_SECONDS'], config['BACKOFF_SECONDS'] * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1)
+
+
+def claim():
+    """Marks the oldest due task as running and returns it, or returns None when nothing is due."""
+    now = timezone.now()
+    due = Q(status=Task.QUEUED, run_after__lte=now) | Q(status=Task.RUNNING, locked_until__lt=now)
+    with transaction.atomic():  # BEGIN IMMEDIATE on SQLite, so two workers never pick the same row
+        candidates = Task.objects.filter(due).order_by('run_after', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        task = candidates.first()
+        if task is None:
+            return None
+        locked_until = now + timedelta(seconds=options()['LEASE_SECONDS'])
+        if not Task.objects.filter(due, pk=task.pk).update(status=Task.RUNNING, attempts=F('attempts') + 1,
+                                                           locked_until=locked_until):
+            return None
+    task.status, task.attempts, task.locked_until = Task.RUNNING, task.attempts + 1, locked_until
+    return task
+
+
+def execute(task):
+    """Runs a claimed task; returns None on success or the formatted exception."""
+    try:
+        with transaction.atomic():
+            func, _ = REGISTRY[task.name]
+            func(**task.kwargs)
+            if not Task.objects.filter(pk=task.pk).delete()[0]:
+                raise Cancelled  # Rolls back its work
+        return None
+    except Cancelled:
+        return None
+    except Exception:
+        error = traceback.format_exc()
+
+    if task.attempts >= task.max_attempts:
+        Task.objects.filter(pk=task.pk).update(status=Task.FAILED, locked_until=None, last_error=error)
+    else:
+        Task.objects.filter(pk=task.pk).update(status=Task.QUEUED, locked_until=None, last_error=error,
+                                               run_after=timezone.now() + timedelta(seconds=backoff(task.attempts)))
+    return error
+
+
+def run_pending(limit=None):
+    """Runs due tasks in this thread until none is left (or `limit` ran); returns how many ran."""
+    count = 0
+    while limit is None or count < limit:
+        task = claim()
+        if task is None:
+            break
+        execute(task)
+        count += 1
+    return count
+
+
+def work(stop, poll_interval=1.0, burst=False, report=None):
+    """
+    One worker thread: runs tasks until `stop` (a threading.Event) is set, or with `burst` until
+    nothing is due. Between empty polls it waits `poll_interval` seconds. `report(task, error)` is
+    called after each task.
+    """
+    try:
+        while not stop.is_set():
+            task = claim()
+            if task is None:
+                if burst:
+                    return
+                stop.wait(poll_interval)
+                continue
+            error = execute(task)
+            if report:
+                report(task, error)
+    finally:
+        connection.close()  # Each thread has its own connection
+
+
+def run_workers(threads=4, poll_interval=1.0, burst=False, report=None, stop=None):
+    """Runs `threads` worker threads until `stop` is set (or, with `burst`, the queue is drained)."""
+    stop = stop or threading.Event()
+    workers = [threading.Thread(target=work, args=(stop, poll_interval, burst, report), name=f'task-worker-{i}')
+               for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+# Follow-up work for a new order, queued by OrderListView.post
+
+@task('record-order-sales')
+def record_order_sales(day, total, lines):
+    # The order's figures travel with the task: if the order is deleted first, the pre_delete signal has
+    # already subtracted them from the rollups and adding them here evens out. Menu items and categories
+    # deleted in the meantime took their rollup rows with them, so their lines are dropped (items) or
+    # counted without a category, as DailyItemSales does, instead of failing the foreign key checks.
+    menuitems = set(MenuItem.objects.filter(pk__in={line[0] for line in lines}).values_list('pk', flat=True))
+    categories = set(Category.objects.filter(pk__in={line[1] for line in lines}).values_list('pk', flat=True))
+    analytics.record_sales(date.fromisoformat(day), Decimal(total),
+                           [(menuitem_id, category_id if category_id in categories else None, quantity, Decimal(price))
+                            for menuitem_id, category_id, quantity, price in lines if menuitem_id in menuitems])
+
+
+@task('assign-delivery-crew')
+def assign_delivery_crew(order_id):
+    """Gives an unassigned order to the delivery crew member with the fewest undelivered orders."""
+    order = Order.objects.select_for_update().filter(pk=order_id, delivery_crew__isnull=True).first()
+    if order is None:
+        return  # Gone, or assigned by a manager in the meantime
+    crew = (
+        User.objects.filter(groups__name=DELIVERY_CREW, is_active=True)
+        .annotate(open_orders=Count('delivery_crew', filter=Q(delivery_crew__status=False)))
+        .order_by('open_orders', 'pk')
+        .first()
+    )
+    if crew is None:
+        return
+    before = events.order_state(order)
+    order.delivery_crew = crew
+    order.save(update_fields=['delivery_crew', 'updated_at'])
+    events.publish_order_changes(order, before)
+
+
+def enqueue_order_followups(order, order_items):
+    """Queues the work that follows a checkout; call it inside the checkout transaction."""
+    enqueue('record-order-sales', day=order.date.isoformat(), total=str(order.total),
+            lines=[[menuitem_id, category_id, quantity, str(price)]
+                   for menuitem_id, category_id, quantity, price in analytics.order_lines(order_items)])
+    if getattr(settings, 'AUTO_ASSIGN_DELIVERY_CREW', False):
+        enqueue('assign-delivery-crew', order_id=order.pk)
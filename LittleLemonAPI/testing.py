@@ -0,0 +1,60 @@
+"""
+Test runner (settings.TEST_RUNNER) that points the caches and stores shared between workers
+at a temporary directory for the length of the run, so `manage.py test` never reads or wipes
+the state of a development server running from the same checkout, and runs the test database
+in WAL mode like a deployed one.
+
+isolated_state() gives the same isolation to the commands that run the app against a throwaway
+database (loadtest, benchmark): cached roles, tokens, catalog versions and throttle counters of
+their seeded users never reach the caches of a server on the real database.
+"""
+import tempfile
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from .sqlite import enable_wal
+
+
+def isolated_settings(directory):
+    """The settings to override, with every file they name inside `directory`."""
+    return {
+        'CACHES': {
+            alias: {**config, 'LOCATION': directory / 'cache' / alias} if config['BACKEND'].endswith('FileBasedCache') else config
+            for alias, config in settings.CACHES.items()
+        },
+        'THROTTLE_STORE': {
+            'BACKEND': 'LittleLemonAPI.throttles.SQLiteThrottleStore',
+            'OPTIONS': {'path': directory / 'throttle.sqlite3'},
+        },
+    }
+
+
+@contextmanager
+def isolated_state():
+    """Points the shared caches and the throttle store at a temporary directory for the block."""
+    with tempfile.TemporaryDirectory() as directory, override_settings(**isolated_settings(Path(directory))):
+        yield
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.isolation = ExitStack()
+        self.isolation.enter_context(isolated_state())
+
+    def setup_databases(self, **kwargs):
+        old_config = super().setup_databases(**kwargs)
+        # In WAL mode, as a deployed database is after `manage.py enable_wal`
+        for connection in connections.all():
+            if connection.vendor == 'sqlite':
+                enable_wal(connection)
+        return old_config
+
+    def teardown_test_environment(self, **kwargs):
+        self.isolation.close()
+        super().teardown_test_environment(**kwargs)
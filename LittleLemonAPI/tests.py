@@ -1,3 +1,2110 @@
-from django.test import TestCase
+import asyncio
+import csv
+import functools
+import io
+import json
+import math
+import re
+import sqlite3
+import tempfile
+import threading
+from collections import Counter
+from contextlib import ExitStack, closing
+from datetime import date, timedelta
+from decimal import Decimal
+from importlib import import_module
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.cache import CacheHandler, cache, caches
+from django.core.management import CommandError, call_command
+from django.core.signals import request_started
+from django.db import connection, connections, transaction
+from django.db.migrations.loader import MigrationLoader
+from django.db.models import F, Sum
+from django.core.exceptions import ImproperlyConfigured
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import resolve
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import analytics, events, exports, loadtest, metrics, roles, routers, sqlite, synthetic, tasks
+from .aio import IN_PROCESS_CACHES
+from .authentication import CachedTokenAuthentication, token_cache_key
+from .views import OrderExportView
+from .catalog import CatalogCache, async_cache_catalog_response, cache_catalog_response, catalog_cache
+from .models import Category, DailyItemSales, DailySales, MenuItem, Cart, Order, OrderItem, Task
+from .pagination import KeysetPagination
+from .throttles import SlidingWindowThrottle, SQLiteThrottleStore, TenCallsPerMinute, parse_rate, throttle_store
+from .compiled import compile_serializer
+from .serializers import CartSerializer, MenuItemSerializer, OrderSerializer
+
+
+
+def clear_caches():
+    # Cached catalog, roles and tokens, plus throttle history, which lives in its own shared store
+    cache.clear()
+    throttle_store().clear()
+
+
+def shared_state():
+    # What the caches and the throttle store set up by the test runner hold
+    files = {path: path.read_bytes()
+             for config in settings.CACHES.values() if 'LOCATION' in config
+             for path in Path(config['LOCATION']).rglob('*') if path.is_file()}
+    with closing(sqlite3.connect(settings.THROTTLE_STORE['OPTIONS']['path'])) as db:
+        return files, db.execute('SELECT * FROM throttle ORDER BY 1, 2').fetchall()
+
+
+def command_on_test_database(module):
+    # Runs a command that would create its own test database and test environment on the current ones
+    stack = ExitStack()
+    stack.enter_context(mock.patch(f'{module}.setup_test_environment'))
+    stack.enter_context(mock.patch(f'{module}.teardown_test_environment'))
+    stack.enter_context(mock.patch(f'{module}.enable_wal'))
+    stack.enter_context(mock.patch.object(connection.creation, 'create_test_db'))
+    stack.enter_context(mock.patch.object(connection.creation, 'destroy_test_db'))
+    return stack
+
+
+class SlidingWindowThrottleTests(SimpleTestCase):
+    class Throttle(TenCallsPerMinute):
+        now = 6000.0  # Start of a one-minute window
+
+        def timer(self):
+            return self.now
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.store = {'BACKEND': 'LittleLemonAPI.throttles.SQLiteThrottleStore',
+                      'OPTIONS': {'path': f'{self.directory.name}/throttle.sqlite3'}}
+        self.request = Request(APIRequestFactory().get('/'))
+        self.request.user = User(pk=1, username='customer')
+
+    def allowed(self, at, times=1):
+        throttle = self.Throttle()
+        throttle.now = at
+        results = []
+        for _ in range(times):
+            results.append(throttle.allow_request(self.request, None))
+        return results, throttle
+
+    def test_rates_are_parsed_strictly(self):
+        self.assertEqual(parse_rate('10/minute'), (10, 60))
+        self.assertEqual(parse_rate('100/15min'), (100, 900))
+        self.assertEqual(parse_rate('5/s'), (5, 1))
+        with self.assertRaises(ImproperlyConfigured):
+            parse_rate('10/minuite')
+
+    def test_sliding_window(self):
+        for backend in (self.store, {'BACKEND': 'LittleLemonAPI.throttles.CacheThrottleStore', 'OPTIONS': {'alias': 'tokens'}}):
+            with self.subTest(backend=backend['BACKEND']), override_settings(THROTTLE_STORE=backend):
+                throttle_store().clear()
+                results, throttle = self.allowed(6000.0, times=12)
+                self.assertEqual(results, [True] * 10 + [False] * 2)
+                self.assertAlmostEqual(throttle.wait(), 60 + 6, places=3)  # Next window, until 10 * (1 - f) + 1 <= 10
+
+                # Halfway through the next window half of the previous one still counts: 5 more requests fit
+                results, throttle = self.allowed(6090.0, times=7)
+                self.assertEqual(results, [True] * 5 + [False] * 2)
+                self.assertAlmostEqual(throttle.wait(), 6, places=3)
+
+                # Refused requests were not counted: two windows later everything is available again
+                self.assertEqual(self.allowed(6180.0, times=10)[0], [True] * 10)
+
+    def test_workers_share_the_sqlite_store(self):
+        # Two store instances stand for two worker processes opening the same file
+        first, second = SQLiteThrottleStore(self.store['OPTIONS']['path']), SQLiteThrottleStore(self.store['OPTIONS']['path'])
+        self.assertEqual(first.incr('k', 5, ttl=60), (1, 0))
+        self.assertEqual(second.incr('k', 5, ttl=60), (2, 0))
+        self.assertEqual(first.incr('k', 6, ttl=60), (1, 2))
+        second.decr('k', 6)
+        self.assertEqual(second.incr('k', 6, ttl=60), (1, 2))
+
+    def test_test_runs_leave_the_project_store_alone(self):
+        # clear_caches() wipes the store, which must not be the one a development server uses
+        self.assertNotEqual(Path(throttle_store().path).parent, settings.BASE_DIR)
+
+    def test_default_classes_use_the_shared_store(self):
+        from rest_framework.settings import api_settings
+        self.assertTrue(all(issubclass(cls, SlidingWindowThrottle) for cls in api_settings.DEFAULT_THROTTLE_CLASSES))
+
+
+class ThrottledEndpointTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='customer', password='pass'))
+
+    def test_eleventh_call_is_refused_with_retry_after(self):
+        statuses = [self.client.get('/api/categories/').status_code for _ in range(10)]
+        self.assertNotIn(429, statuses)
+        response = self.client.get('/api/categories/')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create_user(username='customer', password='pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(slug='mains', title='Mains')
+
+    def fill_cart(self, lines):
+        items = MenuItem.objects.bulk_create([
+            MenuItem(title=f'Item {i}', price='2.50', featured=False, category=self.category)
+            for i in range(lines)
+        ])
+        Cart.objects.bulk_create([
+            Cart(user=self.user, menuitem=item, quantity=2, unit_price=item.price, price='5.00')
+            for item in items
+        ])
+
+    def checkout(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/orders/')
+        self.assertEqual(response.status_code, 201)
+        return len(ctx.captured_queries)
+
+    def test_checkout_creates_order_and_clears_cart(self):
+        self.fill_cart(3)
+        self.checkout()
+
+        order = Order.objects.get(user=self.user)
+        self.assertEqual(str(order.total), '15.00')
+        self.assertEqual(OrderItem.objects.filter(order=order).count(), 3)
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+
+    def test_empty_cart_is_rejected(self):
+        response = self.client.post('/api/orders/')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_checkout_query_count_is_constant(self):
+        # Order lines are inserted in one statement per backend batch (SQLite caps bound parameters), so the
+        # only growth allowed is one extra INSERT per full batch. The sales rollups are a background task.
+        batch_size = connection.ops.bulk_batch_size(['order', 'menuitem', 'quantity', 'unit_price', 'price'], [None] * 1000)
+        baseline = None
+        for lines in (1, 10, 50, 200):
+            Cart.objects.all().delete()
+            self.fill_cart(lines)
+            queries = self.checkout() - math.ceil(lines / batch_size)
+            if baseline is None:
+                baseline = queries
+            self.assertEqual(queries, baseline, f'{lines} cart lines')
+
+
+class OrderListQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', password='pass')
+        cls.crew = User.objects.create_user(username='crew', password='pass')
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        Group.objects.create(name='Managers').user_set.add(cls.manager)
+        Group.objects.create(name='Delivery Crew').user_set.add(cls.crew)
+        cls.items = MenuItem.objects.bulk_create([
+            MenuItem(title=f'Item {i}', price='4.00', featured=False) for i in range(3)
+        ])
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+
+    def seed_orders(self, count):
+        # Every order belongs to the customer and is assigned to the crew member, so all three branches see `count` orders
+        orders = Order.objects.bulk_create([
+            Order(user=self.customer, delivery_crew=self.crew, total='8.00', date=date(2025, 1, 1))
+            for _ in range(count)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, menuitem=item, quantity=1, unit_price='4.00', price='4.00')
+            for order in orders for item in self.items[:2]
+        ])
+
+    def test_query_count_does_not_grow_with_orders(self):
+        # Cold role lookup, the conditional GET aggregate, the order query and one prefetch for lines joined to their menu items
+        expected = {'manager': 4, 'crew': 4, 'customer': 4}
+        seeded = 0
+        for total in (100, 1000, 10000):
+            self.seed_orders(total - seeded)
+            seeded = total
+            for role, queries in expected.items():
+                with self.subTest(orders=total, role=role):
+                    clear_caches()
+                    self.client.force_authenticate(User.objects.get(pk=getattr(self, role).pk))
+                    with self.assertNumQueries(queries):
+                        response = self.client.get('/api/orders/')
+                    self.assertEqual(len(response.data), total)
+                    self.assertEqual(len(response.data[0]['orderitem_set']), 2)
+
+
+class OrderDetailTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        cls.other = User.objects.create_user(username='other', password='pass')
+        cls.crew = User.objects.create_user(username='crew', password='pass')
+        cls.manager = User.objects.create_user(username='manager', password='pass')
+        cls.crew.groups.add(Group.objects.create(name=roles.DELIVERY_CREW))
+        cls.manager.groups.add(Group.objects.create(name=roles.MANAGERS))
+        category = Category.objects.create(slug='mains', title='Mains')
+        items = MenuItem.objects.bulk_create([
+            MenuItem(title=f'Item {i}', price=Decimal(i) + Decimal('0.5'), featured=i % 2 == 0, category=category)
+            for i in range(60)
+        ])
+        cls.order = Order.objects.create(user=cls.customer, delivery_crew=cls.crew, total='123.40', date=date(2024, 5, 1))
+        OrderItem.objects.bulk_create([
+            OrderItem(order=cls.order, menuitem=item, quantity=i % 3 + 1, unit_price=item.price, price=item.price * (i % 3 + 1))
+            for i, item in enumerate(items)
+        ])
+        cls.empty = Order.objects.create(user=cls.customer, total=0, date=date(2024, 5, 2))
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+
+    def get(self, user, order):
+        self.client.force_authenticate(User.objects.get(pk=user.pk))
+        return self.client.get(f'/api/orders/{order.pk}/')
+
+    def test_matches_order_serializer_output(self):
+        for order in (self.order, self.empty):
+            with self.subTest(order=order.pk):
+                expected = JSONRenderer().render(OrderSerializer(OrderSerializer.setup_eager_loading(Order.objects.all()).get(pk=order.pk)).data)
+                self.assertEqual(self.get(self.customer, order).content, expected)
+
+    def test_owner_read_is_one_query(self):
+        self.client.force_authenticate(User.objects.get(pk=self.customer.pk))
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/orders/{self.order.pk}/')
+        self.assertEqual(len(response.json()['orderitem_set']), 60)
+
+    def test_access_rules(self):
+        self.assertEqual(self.get(self.crew, self.order).status_code, 200)
+        self.assertEqual(self.get(self.manager, self.order).status_code, 200)
+        self.assertEqual(self.get(self.other, self.order).status_code, 403)
+        self.assertEqual(self.get(self.crew, self.empty).status_code, 403)  # Not assigned to them
+        self.client.logout()
+        self.assertEqual(self.client.get(f'/api/orders/{self.order.pk}/').status_code, 401)
+
+    def test_missing_order(self):
+        self.assertEqual(self.get(self.manager, Order(pk=9999)).status_code, 404)
+
+    def test_updates_are_routed_to_the_detail_view(self):
+        self.client.force_authenticate(User.objects.get(pk=self.crew.pk))
+        response = self.client.patch(f'/api/orders/{self.order.pk}/', {'status': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.order.refresh_from_db()
+        self.assertTrue(self.order.status)
+
+        self.client.force_authenticate(User.objects.get(pk=self.customer.pk))
+        self.assertEqual(self.client.delete(f'/api/orders/{self.order.pk}/').status_code, 403)
+        self.client.force_authenticate(User.objects.get(pk=self.manager.pk))
+        self.assertEqual(self.client.delete(f'/api/orders/{self.empty.pk}/').status_code, 200)
+        self.assertFalse(Order.objects.filter(pk=self.empty.pk).exists())
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        # Several orders share a date so the id tie-breaker matters
+        Order.objects.bulk_create([
+            Order(user=cls.customer, total='1.00', date=date(2025, 1, 1 + i // 4)) for i in range(12)
+        ])
+        MenuItem.objects.bulk_create([
+            MenuItem(title=f'Item {i}', price=f'{i % 3 + 1}.00', featured=False) for i in range(11)
+        ])
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def walk(self, url):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            self.assertNotIn('count', body)
+            seen.extend(body['results'])
+            url = body['next']
+        return seen
+
+    def test_orders_are_paged_newest_first_without_gaps(self):
+        orders = self.walk('/api/orders/?pagination=cursor&page_size=5')
+        expected = list(Order.objects.order_by('-date', '-id').values_list('id', flat=True))
+        self.assertEqual([order['id'] for order in orders], expected)
+
+    def test_orders_are_unpaginated_without_opt_in(self):
+        response = self.client.get('/api/orders/')
+        self.assertEqual(len(response.data), 12)
+
+    def test_menu_items_page_by_price_then_id(self):
+        items = self.walk('/api/menu-items/?pagination=cursor&ordering=price&page_size=4')
+        expected = list(MenuItem.objects.order_by('price', 'id').values_list('id', flat=True))
+        self.assertEqual([item['id'] for item in items], expected)
+
+    def test_deep_page_is_a_range_scan(self):
+        # The next page is fetched by filtering past the cursor, never by counting or offsetting
+        url = self.client.get('/api/orders/?pagination=cursor&page_size=5').json()['next']
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        order_query = next(q['sql'] for q in ctx.captured_queries if 'FROM "LittleLemonAPI_order"' in q['sql'] and 'ORDER BY' in q['sql'])
+        self.assertNotIn('OFFSET', order_query)
+        self.assertNotIn('COUNT', order_query)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/orders/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='customer', password='pass')
+        cls.category = Category.objects.create(slug='mains', title='Mains')
+        MenuItem.objects.create(title='Pasta', price='9.00', featured=True, category=cls.category)
+
+    def setUp(self):
+        clear_caches()
+        catalog_cache.clear_local()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_warm_requests_skip_the_database(self):
+        for url in ('/api/categories/', '/api/menu-items/', f'/api/menu-items/{MenuItem.objects.get().pk}/'):
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                with self.assertNumQueries(0):
+                    second = self.client.get(url)
+                self.assertEqual(first.status_code, 200)
+                self.assertEqual(second.content, first.content)
+
+    def test_saves_and_deletes_bump_the_version(self):
+        self.client.get('/api/categories/')
+        version = catalog_cache.version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(slug='desserts', title='Desserts')
+            # Readers keep the old version until the change is committed
+            self.assertEqual(catalog_cache.version(), version)
+        self.assertGreater(catalog_cache.version(), version)
+        titles = [category['title'] for category in self.client.get('/api/categories/').json()]
+        self.assertEqual(titles, ['Mains', 'Desserts'])
+
+        version = catalog_cache.version()
+        with self.captureOnCommitCallbacks(execute=True):
+            MenuItem.objects.get().delete()
+        self.assertGreater(catalog_cache.version(), version)
+        self.assertEqual(self.client.get('/api/menu-items/').json()['results'], [])
+
+    def test_rows_rendered_before_a_bump_are_not_cached_under_the_new_version(self):
+        request = Request(APIRequestFactory().get('/api/categories/'))
+        request.accepted_renderer = JSONRenderer()
+
+        def handler(view, request):
+            if catalog_cache.last_modified() is None:
+                # A write commits, and its on_commit bump runs, after the old rows were read
+                catalog_cache.bump()
+                return Response(['old rows'])
+            return Response(['new rows'])
+
+        async def async_handler(view, request):
+            return handler(view, request)
+
+        for wrapped in (cache_catalog_response(handler),
+                        lambda view, request: asyncio.run(async_cache_catalog_response(async_handler)(view, request))):
+            with self.subTest(wrapped=wrapped):
+                clear_caches()
+                catalog_cache.clear_local()
+                self.assertEqual(wrapped(None, request).content, b'["old rows"]')
+                self.assertEqual(wrapped(None, request).content, b'["new rows"]')
+
+    @override_settings(CATALOG_CACHE={'MAX_BYTES': 10})
+    def test_local_entries_are_evicted_least_recently_used_first(self):
+        cache_layer = CatalogCache()
+        cache_layer.set('a', b'aaaa')
+        cache_layer.set('b', b'bbbb')
+        cache_layer.get('a')
+        cache_layer.set('c', b'cccc')
+        self.assertEqual(list(cache_layer._entries), ['a', 'c'])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tempfile.mkdtemp()}})
+    def test_file_based_backend_shares_entries_across_processes(self):
+        catalog_cache.set('key', b'[]')
+        other_process = CatalogCache()
+        self.assertEqual(other_process.get('key'), b'[]')
+
+
+class MenuItemFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='customer', password='pass')
+        mains = Category.objects.create(slug='mains', title='Mains')
+        desserts = Category.objects.create(slug='desserts', title='Sweet Desserts')
+        MenuItem.objects.bulk_create([
+            MenuItem(title='Grilled Chicken', price='14.00', featured=True, category=mains),
+            MenuItem(title='Chicken Pasta', price='11.50', featured=False, category=mains),
+            MenuItem(title='Lemon Tart', price='6.00', featured=True, category=desserts),
+            MenuItem(title='Crème Brûlée', price='7.25', featured=False, category=desserts),
+            MenuItem(title='Bread "Basket"', price='3.00', featured=False, category=None),
+        ])
+        cls.mains = mains
+
+    def setUp(self):
+        clear_caches()
+        catalog_cache.clear_local()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def titles(self, query):
+        response = self.client.get(f'/api/menu-items/?page_size=50&{query}')
+        self.assertEqual(response.status_code, 200)
+        return [item['title'] for item in response.json()['results']]
+
+    def test_filters_combine(self):
+        self.assertEqual(self.titles('category=mains'), ['Grilled Chicken', 'Chicken Pasta'])
+        self.assertEqual(self.titles('featured=true&ordering=price'), ['Lemon Tart', 'Grilled Chicken'])
+        self.assertEqual(self.titles('price_min=6&price_max=12&ordering=-price'), ['Chicken Pasta', 'Crème Brûlée', 'Lemon Tart'])
+        self.assertEqual(self.titles('category=desserts&featured=false'), ['Crème Brûlée'])
+
+    def test_search_matches_titles_categories_and_prefixes(self):
+        self.assertEqual(self.titles('search=chicken&ordering=title'), ['Chicken Pasta', 'Grilled Chicken'])
+        self.assertEqual(self.titles('search=sweet'), ['Lemon Tart', 'Crème Brûlée'])
+        self.assertEqual(self.titles('search=chick pas'), ['Chicken Pasta'])
+        self.assertEqual(self.titles('search=creme'), ['Crème Brûlée'])
+        self.assertEqual(self.titles('search=basket"'), ['Bread "Basket"'])  # Quotes are not FTS syntax
+        self.assertEqual(self.titles('search=AND OR NOT*'), [])
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 index is SQLite only')
+    def test_search_index_follows_catalog_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = MenuItem.objects.create(title='Fish Tacos', price='9.00', featured=False, category=self.mains)
+        self.assertEqual(self.titles('search=tacos'), ['Fish Tacos'])
+        with self.captureOnCommitCallbacks(execute=True):
+            item.title = 'Fish Burrito'
+            item.save()
+            self.mains.title = 'Entrees'
+            self.mains.save()
+        self.assertEqual(self.titles('search=tacos'), [])
+        self.assertEqual(self.titles('search=burrito entrees'), ['Fish Burrito'])
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+        self.assertEqual(self.titles('search=burrito'), [])
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 index is SQLite only')
+    def test_search_uses_the_index_instead_of_like(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.titles('search=chicken')
+        sql = ' '.join(q['sql'] for q in ctx.captured_queries)
+        self.assertIn('MATCH', sql)
+        self.assertNotIn('LIKE', sql)
+
+    def test_unknown_ordering_falls_back_to_id(self):
+        titles = self.titles('ordering=inventory')
+        self.assertEqual(titles, list(MenuItem.objects.order_by('id').values_list('title', flat=True)))
+
+
+class CompiledSerializerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        cls.manager = User.objects.create_user(username='manager', password='pass')
+        cls.manager.groups.add(Group.objects.create(name=roles.MANAGERS))
+        category = Category.objects.create(slug='mains', title='Mains')
+        prices = [Decimal(price) for price in ('0.10', '1.00', '9.99', '1234.50', '0.00')]
+        cls.items = MenuItem.objects.bulk_create([
+            MenuItem(title=f'Plat {i} — crème "spécial"', price=prices[i % 5], featured=i % 2 == 0, category=category if i % 3 else None)
+            for i in range(12)
+        ])
+        Cart.objects.bulk_create([
+            Cart(user=cls.customer, menuitem=item, quantity=i + 1, unit_price=item.price, price=item.price * (i + 1))
+            for i, item in enumerate(cls.items[:4])
+        ])
+        for i in range(7):
+            order = Order.objects.create(user=cls.customer, delivery_crew=cls.manager if i % 2 else None,
+                                         status=i % 3 == 0, total=f'{i}.5', date=date(2024, 1, 1) + timedelta(days=i))
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, menuitem=item, quantity=2, unit_price=item.price, price=item.price * 2)
+                for item in cls.items[i:i * 2]  # The first order has no lines
+            ])
+
+    def setUp(self):
+        clear_caches()
+        catalog_cache.clear_local()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.get(pk=self.manager.pk))
+
+    def assertSameBytes(self, serializer_class, queryset):
+        compiled = compile_serializer(serializer_class)
+        expected = JSONRenderer().render(serializer_class(serializer_class.setup_eager_loading(queryset), many=True).data)
+        self.assertEqual(JSONRenderer().render(compiled.serialize(compiled.rows(queryset))), expected)
+
+    def test_compiled_output_is_byte_identical(self):
+        self.assertSameBytes(MenuItemSerializer, MenuItem.objects.order_by('id'))
+        self.assertSameBytes(CartSerializer, Cart.objects.filter(user=self.customer))
+        self.assertSameBytes(OrderSerializer, Order.objects.order_by('-date'))
+        self.assertSameBytes(OrderSerializer, Order.objects.none())
+
+    def test_compiled_once_per_class(self):
+        self.assertIs(compile_serializer(OrderSerializer), compile_serializer(OrderSerializer))
+
+    def test_endpoints_render_the_same_in_fast_mode(self):
+        urls = ['/api/menu-items/?page_size=50', '/api/menu-items/?pagination=cursor&ordering=price&page_size=4',
+                '/api/orders/', '/api/orders/?pagination=cursor&page_size=3']
+        for url in urls:
+            with self.subTest(url=url):
+                responses = []
+                for fast in (False, True):
+                    clear_caches()
+                    catalog_cache.clear_local()
+                    with override_settings(FAST_SERIALIZERS=fast):
+                        responses.append(self.client.get(url).content)
+                self.assertEqual(responses[0], responses[1])
+
+        self.client.force_authenticate(User.objects.get(pk=self.customer.pk))
+        with override_settings(FAST_SERIALIZERS=True):
+            fast = self.client.get('/api/cart/menu-items/').content
+        self.assertEqual(fast, self.client.get('/api/cart/menu-items/').content)
+
+    @override_settings(FAST_SERIALIZERS=True)
+    def test_fast_order_list_query_count(self):
+        self.client.get('/api/orders/')  # Warm the role cache
+        with self.assertNumQueries(3):  # ETag aggregate, orders, all their lines
+            self.client.get('/api/orders/')
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', password='pass')
+        Group.objects.create(name='Managers').user_set.add(cls.manager)
+        cls.category = Category.objects.create(slug='mains', title='Mains')
+        MenuItem.objects.create(title='Pasta', price='9.00', featured=True, category=cls.category)
+        cls.order = Order.objects.create(user=cls.manager, total='9.00', date=date(2025, 1, 1))
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def test_catalog_polls_return_304_without_queries(self):
+        for url in ('/api/menu-items/', '/api/categories/'):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+
+    def test_catalog_etag_changes_when_the_catalog_does(self):
+        etag = self.client.get('/api/menu-items/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            MenuItem.objects.create(title='Soup', price='5.00', featured=False)
+        response = self.client.get('/api/menu-items/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_order_poll_returns_304_with_one_lightweight_query(self):
+        etag = self.client.get('/api/orders/')['ETag']
+        # Roles are already cached, so a single COUNT/MAX aggregate is all it costs; nothing is serialized
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/orders/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        order_queries = [q['sql'] for q in ctx.captured_queries if 'LittleLemonAPI_order' in q['sql']]
+        self.assertEqual(len(order_queries), 1)
+        self.assertIn('MAX', order_queries[0])
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_order_changes_invalidate_the_etag(self):
+        etag = self.client.get('/api/orders/')['ETag']
+        self.order.status = True
+        self.order.save()
+        self.assertEqual(self.client.get('/api/orders/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get('/api/orders/')['ETag']
+        self.order.delete()
+        self.assertEqual(self.client.get('/api/orders/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_menu_changes_invalidate_the_order_etag(self):
+        # The order list embeds each line's menu item
+        item = MenuItem.objects.get()
+        OrderItem.objects.create(order=self.order, menuitem=item, quantity=1, unit_price='9.00', price='9.00')
+        etag = self.client.get('/api/orders/')['ETag']
+        item.title = 'Penne'
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+        response = self.client.get('/api/orders/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['orderitem_set'][0]['menuitem']['title'], 'Penne')
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get('/api/orders/')['Last-Modified']
+        response = self.client.get('/api/orders/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+
+class RoleResolutionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.managers = Group.objects.create(name='Managers')
+        cls.crew_group = Group.objects.create(name='Delivery Crew')
+        cls.manager = User.objects.create_user(username='manager', password='pass')
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        cls.managers.user_set.add(cls.manager)
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+
+    def test_warm_role_checks_cost_no_queries(self):
+        self.client.force_authenticate(self.manager)
+        self.client.get('/api/groups/delivery-crew/users/')
+        # Only the crew group and its users are queried; the caller's roles come from the cache
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/groups/delivery-crew/users/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_roles_are_loaded_once_then_served_from_cache(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(roles.is_manager(self.manager))
+            self.assertFalse(roles.is_delivery_crew(self.manager))
+        # A fresh user object, as on the next request, is served from the cache
+        fresh = User.objects.get(pk=self.manager.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(roles.is_manager(fresh))
+
+    def test_membership_changes_invalidate_the_cache(self):
+        self.assertFalse(roles.is_delivery_crew(User.objects.get(pk=self.customer.pk)))
+        self.crew_group.user_set.add(self.customer)
+        self.assertTrue(roles.is_delivery_crew(User.objects.get(pk=self.customer.pk)))
+
+        user = User.objects.get(pk=self.customer.pk)
+        user.groups.remove(self.crew_group)
+        self.assertFalse(roles.is_delivery_crew(user))
+        self.assertFalse(roles.is_delivery_crew(User.objects.get(pk=self.customer.pk)))
+
+    def test_invalidation_reaches_other_workers(self):
+        # Another worker process has its own cache handler on the same shared backend
+        self.assertNotIsInstance(caches['default'], IN_PROCESS_CACHES)
+        other_worker = CacheHandler()['default']
+        with mock.patch.object(roles, 'cache', other_worker):
+            self.assertTrue(roles.is_manager(User.objects.get(pk=self.manager.pk)))
+        self.managers.user_set.remove(self.manager)
+        with mock.patch.object(roles, 'cache', other_worker):
+            self.assertFalse(roles.is_manager(User.objects.get(pk=self.manager.pk)))
+
+    def test_customers_are_refused_with_the_view_message(self):
+        self.client.force_authenticate(self.customer)
+        response = self.client.post('/api/groups/manager/users', {'user_id': self.customer.pk})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()['detail'], 'You do not have permission to add users.')
+
+    def test_managers_can_remove_managers(self):
+        self.client.force_authenticate(self.manager)
+        other = User.objects.create_user(username='other', password='pass')
+        self.managers.user_set.add(other)
+        response = self.client.delete(f'/api/groups/manager/users/{other.pk}')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(roles.has_role(User.objects.get(pk=other.pk), 'Managers'))
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='customer', password='pass')
+        Category.objects.create(slug='mains', title='Mains')
+
+    def setUp(self):
+        clear_caches()
+        caches['tokens'].clear()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_warm_requests_skip_the_token_lookup(self):
+        self.client.get('/api/categories/')
+        self.client.get('/api/categories/')
+        # Both the category list and the token identity are cached now
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/categories/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_the_cache_holds_no_credentials(self):
+        # The tokens cache is on disk: it keeps the user id and flags, not the token or the user's password hash
+        self.client.get('/api/cart/menu-items/')
+        self.assertEqual(caches['tokens'].get(token_cache_key(self.token.key)), (self.user.pk, True, False, False))
+
+        # The user built from the cached identity loads its other fields when they are used
+        user, token = CachedTokenAuthentication().authenticate_credentials(self.token.key)
+        self.assertEqual((user.pk, user.is_active, user.is_superuser, token.key, token.user),
+                         (self.user.pk, True, False, self.token.key, user))
+        self.assertEqual(user.username, 'customer')
+
+    def test_logout_invalidates_the_cached_token(self):
+        self.client.get('/api/categories/')
+        self.assertEqual(self.client.post('/api/token/logout/').status_code, 204)
+        self.assertEqual(self.client.get('/api/cart/menu-items/').status_code, 401)
+
+    def test_logout_revokes_the_token_on_other_workers(self):
+        self.assertNotIsInstance(caches['tokens'], IN_PROCESS_CACHES)
+        other_worker = CacheHandler()['tokens']
+        with mock.patch('LittleLemonAPI.authentication.token_cache', return_value=other_worker):
+            self.assertEqual(self.client.get('/api/cart/menu-items/').status_code, 200)
+        self.assertEqual(self.client.post('/api/token/logout/').status_code, 204)
+        with mock.patch('LittleLemonAPI.authentication.token_cache', return_value=other_worker):
+            self.assertEqual(self.client.get('/api/cart/menu-items/').status_code, 401)
+
+    def test_deleted_tokens_and_inactive_users_are_refused(self):
+        self.client.get('/api/cart/menu-items/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/cart/menu-items/').status_code, 401)
+
+        self.user.is_active = True
+        self.user.save()
+        self.assertEqual(self.client.get('/api/cart/menu-items/').status_code, 200)
+        self.token.delete()
+        self.assertEqual(self.client.get('/api/cart/menu-items/').status_code, 401)
+
+
+class CartUpsertTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='customer', password='pass')
+        cls.item = MenuItem.objects.create(title='Soup', price='1.10', featured=False)
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_adding_twice_increments_the_line(self):
+        self.client.post('/api/cart/menu-items/', {'menuitem': self.item.pk, 'quantity': 1})
+        response = self.client.post('/api/cart/menu-items/', {'menuitem': self.item.pk, 'quantity': 2})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['quantity'], 3)
+        self.assertEqual(response.json()['price'], '3.30')
+
+        cart = Cart.objects.get()
+        self.assertEqual((cart.quantity, str(cart.unit_price), str(cart.price)), (3, '1.10', '3.30'))
+
+    def test_add_is_a_single_write(self):
+        Cart.objects.add(self.user, self.item, 1)
+        with self.assertNumQueries(1):
+            Cart.objects.add(self.user, self.item, 1)
+
+    def test_price_follows_the_current_menu_price(self):
+        Cart.objects.add(self.user, self.item, 1)
+        self.item.price = Decimal('2.00')
+        self.item.save()
+        cart = Cart.objects.add(self.user, self.item, 1)
+        self.assertEqual(str(cart.price), '4.00')
+
+
+class CartConcurrencyTests(TransactionTestCase):
+    """
+    Hammers one cart line from many threads. Runs against whichever database backend is
+    configured, so pointing DATABASES at a local PostgreSQL exercises the same path there.
+    """
+    threads = 8
+    adds_per_thread = 25
+
+    def test_concurrent_adds_lose_no_updates(self):
+        user = User.objects.create_user(username='customer', password='pass')
+        item = MenuItem.objects.create(title='Soup', price='0.50', featured=False)
+        errors = []
+
+        def add_repeatedly():
+            try:
+                for _ in range(self.adds_per_thread):
+                    Cart.objects.add(user, item, 1)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=add_repeatedly) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        cart = Cart.objects.get(user=user, menuitem=item)
+        expected = self.threads * self.adds_per_thread
+        self.assertEqual(cart.quantity, expected)
+        self.assertEqual(cart.price, Decimal('0.50') * expected)
+
+
+class CartBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='kiosk', password='pass')
+        cls.items = MenuItem.objects.bulk_create([
+            MenuItem(title=f'Item {i}', price='2.00', featured=False) for i in range(12)
+        ])
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_batch_applies_operations_in_order(self):
+        first, second, third = self.items[:3]
+        Cart.objects.add(self.user, third, 1)
+        response = self.client.post('/api/cart/menu-items/', [
+            {'op': 'add', 'menuitem': first.pk, 'quantity': 2},
+            {'op': 'add', 'menuitem': first.pk, 'quantity': 1},
+            {'op': 'set', 'menuitem': second.pk, 'quantity': 4},
+            {'op': 'remove', 'menuitem': third.pk},
+            {'op': 'remove', 'menuitem': third.pk},
+        ], format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['result'] for r in response.json()['results']], ['added', 'updated', 'added', 'removed', 'not_in_cart'])
+        lines = dict(Cart.objects.filter(user=self.user).values_list('menuitem_id', 'quantity'))
+        self.assertEqual(lines, {first.pk: 3, second.pk: 4})
+        self.assertEqual(str(Cart.objects.get(menuitem=second).price), '8.00')
+
+    def test_twelve_items_cost_a_fixed_number_of_queries(self):
+        operations = [{'op': 'add', 'menuitem': item.pk, 'quantity': 1} for item in self.items]
+        # Menu lookup, cart read, one bulk upsert, plus the transaction's savepoint pair
+        with self.assertNumQueries(5):
+            response = self.client.post('/api/cart/menu-items/', operations, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Cart.objects.filter(user=self.user).count(), 12)
+
+    def test_invalid_operations_reject_the_whole_batch(self):
+        response = self.client.post('/api/cart/menu-items/', [
+            {'op': 'add', 'menuitem': self.items[0].pk, 'quantity': 1},
+            {'op': 'add', 'menuitem': 999999, 'quantity': 1},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertEqual(errors[0], {})
+        self.assertIn('menuitem', errors[1])
+        self.assertFalse(Cart.objects.exists())
+
+        response = self.client.post('/api/cart/menu-items/', [{'op': 'set', 'menuitem': self.items[0].pk}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('quantity', response.json()['errors'][0])
+
+
+class OrderExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        cls.manager = User.objects.create_user(username='manager', password='pass')
+        cls.manager.groups.add(Group.objects.create(name=roles.MANAGERS))
+        items = MenuItem.objects.bulk_create([MenuItem(title=f'Item, "{i}"', price='3.25', featured=False) for i in range(5)])
+        for i in range(10):
+            order = Order.objects.create(user=cls.customer, status=i % 2 == 0, total='6.50', date=date(2024, 1, 10 - i))
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, menuitem=item, quantity=2, unit_price='3.25', price='6.50') for item in items[:i % 4]
+            ])
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.get(pk=self.manager.pk))
+
+    def export(self, query=''):
+        response = self.client.get(f'/api/orders/export/?{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_matches_order_serializer_in_date_order(self):
+        lines = self.export().splitlines()
+        expected = OrderSerializer(OrderSerializer.setup_eager_loading(Order.objects.order_by('date', 'id')), many=True).data
+        self.assertEqual([json.loads(line) for line in lines], json.loads(JSONRenderer().render(expected)))
+
+    def test_filters(self):
+        orders = [json.loads(line) for line in self.export('start=2024-01-03&end=2024-01-06&status=true').splitlines()]
+        self.assertEqual([order['date'] for order in orders], ['2024-01-04', '2024-01-06'])
+        self.assertEqual(len(self.export('status=0').splitlines()), 5)
+        self.assertEqual(self.client.get('/api/orders/export/?start=yesterday').status_code, 400)
+
+    def test_csv_has_one_row_per_line(self):
+        rows = list(csv.reader(io.StringIO(self.export('output=csv'))))
+        self.assertEqual(rows[0][:3], ['order_id', 'date', 'user'])
+        lines, empty_orders = OrderItem.objects.count(), Order.objects.filter(orderitem__isnull=True).count()
+        self.assertEqual(len(rows) - 1, lines + empty_orders)
+        self.assertIn('Item, "0"', [row[7] for row in rows])
+
+    def test_chunks_bound_the_queries(self):
+        with mock.patch.object(OrderExportView, 'chunk_size', 3):
+            response = self.client.get('/api/orders/export/')
+            with CaptureQueriesContext(connection) as ctx:
+                b''.join(response.streaming_content)
+        self.assertEqual(len(ctx.captured_queries), 1 + math.ceil(10 / 3))  # One order cursor, one line query per chunk
+
+    def test_managers_only(self):
+        self.client.force_authenticate(User.objects.get(pk=self.customer.pk))
+        self.assertEqual(self.client.get('/api/orders/export/').status_code, 403)
+
+    def test_asgi_streams_the_same_export(self):
+        # An async iterator: Django would read a sync one whole into memory before sending it
+        token = Token.objects.create(user=self.manager)
+        response = async_to_sync(AsyncClient().get)('/api/orders/export/', headers={'Authorization': f'Token {token.key}'})
+        self.assertTrue(response.is_async)
+
+        async def read():
+            return b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual(async_to_sync(read)(), self.export())
+
+    def test_async_lines_are_pulled_in_batches(self):
+        pulled = []
+
+        def lines():
+            for number in range(5):
+                pulled.append(number)
+                yield f'{number}\n'
+
+        async def read():
+            chunks = []
+            async for chunk in exports.aiter_lines(lines(), batch_size=2):
+                chunks.append((chunk, len(pulled)))
+            return chunks
+        self.assertEqual(async_to_sync(read)(), [('0\n1\n', 2), ('2\n3\n', 4), ('4\n', 5)])
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('export_orders', '--format', 'ndjson', '--status', '1', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 5)
+        with tempfile.NamedTemporaryFile(suffix='.csv') as target:
+            call_command('export_orders', '--format', 'csv', '--end', '2024-01-01', '-o', target.name)
+            with open(target.name, newline='') as exported:
+                self.assertEqual(len(list(csv.reader(exported))), 2)  # Header, and the one line of the Jan 1 order
+
+
+class MenuImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', password='pass')
+        cls.manager.groups.add(Group.objects.create(name=roles.MANAGERS))
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        Category.objects.create(slug='mains', title='Mains')
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.get(pk=self.manager.pk))
+
+    def menu(self, items, start=0):
+        return {
+            'categories': [{'slug': 'desserts', 'title': 'Desserts'}, {'slug': 'mains', 'title': 'Main Courses'}],
+            'menu_items': [
+                {'slug': f'dish-{i}', 'title': f'Dish {i}', 'price': f'{i % 20 + 1}.25',
+                 'featured': i % 2 == 0, 'category': 'desserts' if i % 2 else 'mains'}
+                for i in range(start, start + items)
+            ],
+        }
+
+    def post(self, body, query=''):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/menu-items/import/{query}', body, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_imports_then_updates_by_slug(self):
+        report = self.post(self.menu(20))
+        self.assertEqual(report['categories'], {'created': 1, 'updated': 1})
+        self.assertEqual(report['menu_items'], {'created': 20, 'updated': 0})
+        self.assertEqual(Category.objects.get(slug='mains').title, 'Main Courses')
+
+        body = self.menu(10, start=15)
+        body['menu_items'][0]['price'] = '99.00'
+        report = self.post(body)
+        self.assertEqual(report['menu_items'], {'created': 5, 'updated': 5})
+        self.assertEqual(MenuItem.objects.count(), 25)
+        self.assertEqual(MenuItem.objects.get(slug='dish-15').price, Decimal('99.00'))
+        self.assertEqual(MenuItem.objects.get(slug='dish-3').category.slug, 'desserts')
+
+    def test_row_errors_are_reported_and_valid_rows_kept(self):
+        body = self.menu(3)
+        body['menu_items'] += [
+            {'slug': 'dish-0', 'title': 'Again', 'price': '1.00'},
+            {'slug': 'soup', 'title': 'Soup', 'price': 'cheap'},
+            {'slug': 'stew', 'title': 'Stew', 'price': '5.00', 'category': 'nope'},
+        ]
+        report = self.post(body)
+        self.assertEqual([(error['section'], error['row']) for error in report['errors']],
+                         [('menu_items', 4), ('menu_items', 5), ('menu_items', 6)])
+        self.assertIn('price', report['errors'][1]['errors'])
+        self.assertIn('category', report['errors'][2]['errors'])
+        self.assertEqual(report['menu_items']['created'], 3)
+
+    def test_single_catalog_bump(self):
+        with mock.patch.object(catalog_cache, 'bump') as bump:
+            self.post(self.menu(50))
+        bump.assert_called_once()
+
+    def test_queries_grow_only_per_chunk(self):
+        # Each chunk costs one lookup of existing slugs and one upsert, whatever the number of rows in it
+        batch_size = connection.ops.bulk_batch_size(MenuItem._meta.concrete_fields, [None] * 1000)
+        baseline = None
+        for items, start in ((5, 0), (400, 100), (1000, 1000)):
+            with CaptureQueriesContext(connection) as ctx:
+                self.post(self.menu(items, start))
+            queries = len([q for q in ctx.captured_queries if 'LittleLemonAPI' in q['sql']]) - 2 * math.ceil(items / min(batch_size, 500))
+            if baseline is None:
+                baseline = queries
+            self.assertEqual(queries, baseline, f'{items} rows')
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 index is SQLite only')
+    def test_imported_items_are_searchable(self):
+        self.post(self.menu(3))
+        self.post({'menu_items': [{'slug': 'dish-1', 'title': 'Baklava', 'price': '4.00', 'category': 'desserts'}]})
+        response = self.client.get('/api/menu-items/?search=baklava')
+        self.assertEqual([item['title'] for item in response.json()['results']], ['Baklava'])
+        self.assertEqual(self.client.get('/api/menu-items/?search=dish 1').json()['results'], [])
+
+    def test_csv_upload_and_dry_run(self):
+        categories = io.BytesIO(b'slug,title\ndrinks,Drinks\n')
+        categories.name = 'categories.csv'
+        items = io.BytesIO(b'slug,title,price,featured,category\nlemonade,Lemonade,3.50,,drinks\ntea,Tea,2.00,true,\n')
+        items.name = 'menu_items.csv'
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/menu-items/import/?dry_run=1', {'categories': categories, 'menu_items': items}, format='multipart')
+        self.assertEqual(response.json()['menu_items'], {'created': 2, 'updated': 0})
+        self.assertFalse(MenuItem.objects.exists())
+
+        categories.seek(0)
+        items.seek(0)
+        self.client.post('/api/menu-items/import/', {'categories': categories, 'menu_items': items}, format='multipart')
+        self.assertEqual(MenuItem.objects.get(slug='lemonade').category.slug, 'drinks')
+        self.assertTrue(MenuItem.objects.get(slug='tea').featured)
+
+    def test_managers_only(self):
+        self.client.force_authenticate(User.objects.get(pk=self.customer.pk))
+        self.assertEqual(self.client.post('/api/menu-items/import/', self.menu(1), format='json').status_code, 403)
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as source:
+            json.dump(self.menu(4), source)
+        out = io.StringIO()
+        call_command('import_menu', source.name, stdout=out)
+        self.assertIn('menu_items: 4 created', out.getvalue())
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as items:
+            items.write('slug,title,price\ndish-0,Dish Zero,1.00\nbad,Bad,x\n')
+        with self.assertRaises(CommandError):
+            call_command('import_menu', '--menu-items', items.name, stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(MenuItem.objects.get(slug='dish-0').title, 'Dish Zero')
+
+
+class SalesAnalyticsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', password='pass')
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        Group.objects.create(name='Managers').user_set.add(cls.manager)
+        cls.mains = Category.objects.create(slug='mains', title='Mains')
+        cls.drinks = Category.objects.create(slug='drinks', title='Drinks')
+        cls.pasta = MenuItem.objects.create(title='Pasta', price='10.00', featured=True, category=cls.mains)
+        cls.lemonade = MenuItem.objects.create(title='Lemonade', price='3.00', featured=False, category=cls.drinks)
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+
+    def place_order(self, lines):
+        self.client.force_authenticate(self.customer)
+        self.client.post('/api/cart/menu-items/', [
+            {'op': 'add', 'menuitem': item.pk, 'quantity': quantity} for item, quantity in lines
+        ], format='json')
+        order_id = self.client.post('/api/orders/').json()['order_id']
+        tasks.run_pending()  # The rollups are updated by a background task
+        return Order.objects.get(pk=order_id)
+
+    def report(self, **params):
+        self.client.force_authenticate(self.manager)
+        response = self.client.get('/api/analytics/sales/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_checkout_and_delete_update_the_rollups(self):
+        self.place_order([(self.pasta, 2), (self.lemonade, 1)])
+        order = self.place_order([(self.lemonade, 3)])
+
+        day = self.report()[0]
+        self.assertEqual((day['revenue'], day['orders']), ('32.00', 2))
+        self.assertEqual([(item['title'], item['quantity']) for item in day['top_items']], [('Lemonade', 4), ('Pasta', 2)])
+
+        categories = {row['title']: (row['revenue'], row['orders']) for row in self.report(group_by='category')}
+        self.assertEqual(categories, {'Mains': ('20.00', 1), 'Drinks': ('12.00', 2)})
+
+        order.delete()
+        day = self.report()[0]
+        self.assertEqual((day['revenue'], day['orders']), ('23.00', 1))
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.place_order([(self.pasta, 1), (self.lemonade, 2)])
+        self.place_order([(self.pasta, 4)])
+        incremental = [self.report(group_by=group_by) for group_by in ('day', 'week', 'category')]
+
+        call_command('rebuild_analytics', stdout=io.StringIO())
+        self.assertEqual([self.report(group_by=group_by) for group_by in ('day', 'week', 'category')], incremental)
+
+    def test_rebuild_drops_the_pending_rollup_tasks(self):
+        self.place_order([(self.pasta, 1)])
+        self.client.post('/api/cart/menu-items/', {'menuitem': self.lemonade.pk, 'quantity': 2}, format='json')
+        self.client.post('/api/orders/')  # Its record-order-sales task is still queued
+        running = tasks.claim()  # And one already claimed by a worker
+
+        analytics.rebuild()
+        self.assertFalse(Task.objects.exists())
+        self.assertIsNone(tasks.execute(running))  # Cancelled, nothing added
+        tasks.run_pending()
+        day = self.report()[0]
+        self.assertEqual((day['revenue'], day['orders']), ('16.00', 2))
+
+    def test_order_edits_move_the_order_in_the_rollups(self):
+        order = self.place_order([(self.pasta, 1)])
+        self.client.force_authenticate(self.manager)
+        response = self.client.patch(f'/api/orders/{order.pk}/', {'total': '8.00', 'date': '2024-01-02'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(day['day'], day['revenue'], day['orders']) for day in self.report()],
+                         [('2024-01-02', '8.00', 1), (order.date.isoformat(), '0.00', 0)])
+        self.assertEqual(self.report(group_by='category')[0]['revenue'], '10.00')  # Lines are unchanged
+
+    def test_migration_counts_existing_orders(self):
+        # Orders written before the rollup tables existed, as on a database migrated from 0014
+        order = Order.objects.create(user=self.customer, total='10.00', date=date(2024, 1, 1))
+        OrderItem.objects.create(order=order, menuitem=self.pasta, quantity=1, unit_price='10.00', price='10.00')
+        DailySales.objects.all().delete()
+        Task.objects.create(name='record-order-sales', kwargs={}, run_after=timezone.now())  # Counted by the backfill
+        state = MigrationLoader(connection).project_state(('LittleLemonAPI', '0020_backfill_sales_rollups'))
+        import_module('LittleLemonAPI.migrations.0020_backfill_sales_rollups').backfill(state.apps, mock.Mock(connection=connection))
+        self.assertEqual([(day['revenue'], day['orders']) for day in self.report()], [('10.00', 1)])
+        self.assertFalse(Task.objects.exists())
+
+        Order.objects.get(pk=order.pk).delete()
+        self.assertEqual([(day['revenue'], day['orders']) for day in self.report()], [('0.00', 0)])
+
+    def test_report_reads_only_rollups(self):
+        self.place_order([(self.pasta, 1)])
+        self.client.force_authenticate(self.manager)
+        self.client.get('/api/analytics/sales/')
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/analytics/sales/', {'group_by': 'week'})
+        self.assertFalse([q for q in ctx.captured_queries if 'LittleLemonAPI_order' in q['sql']])
+
+    def test_customers_are_refused(self):
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.get('/api/analytics/sales/').status_code, 403)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Asserts on SQLite query plans')
+class RequestMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        cls.manager = User.objects.create_user(username='manager', password='pass')
+        cls.manager.groups.add(Group.objects.create(name=roles.MANAGERS))
+        item = MenuItem.objects.create(title='Item', price='4.00', featured=False)
+        for _ in range(3):
+            order = Order.objects.create(user=cls.customer, total='4.00', date=date(2024, 1, 1))
+            OrderItem.objects.create(order=order, menuitem=item, quantity=1, unit_price='4.00', price='4.00')
+
+    def setUp(self):
+        clear_caches()
+        patcher = mock.patch.object(metrics, 'registry', metrics.MetricsRegistry(size=64))
+        self.registry = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+
+    def scrape(self):
+        self.client.force_authenticate(User.objects.get(pk=self.manager.pk))
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        values = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                values[name] = float(value)
+        return values
+
+    def test_records_queries_serializer_time_and_size_per_route(self):
+        self.client.force_authenticate(User.objects.get(pk=self.customer.pk))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/orders/')
+        self.assertEqual(response.status_code, 200)
+        query_count = len(queries)  # Read now: later requests reset the connection's query log
+        self.client.get('/api/orders/1000/')
+
+        values = self.scrape()
+        series = 'view="/api/orders/",method="GET"'
+        self.assertEqual(values[f'littlelemon_requests_total{{{series},status="200"}}'], 1)
+        self.assertEqual(values[f'littlelemon_request_duration_seconds_count{{{series}}}'], 1)
+        self.assertEqual(values[f'littlelemon_request_duration_seconds_bucket{{{series},le="+Inf"}}'], 1)
+        self.assertEqual(values[f'littlelemon_db_queries_total{{{series}}}'], query_count)
+        self.assertGreater(values[f'littlelemon_db_query_seconds_total{{{series}}}'], 0)
+        self.assertGreater(values[f'littlelemon_serializer_seconds_total{{{series}}}'], 0)
+        self.assertEqual(values[f'littlelemon_response_bytes_total{{{series}}}'], len(response.content))
+        # Routes, not paths, so every order id shares one series
+        self.assertEqual(values['littlelemon_requests_total{view="/api/orders/<int:pk>/",method="GET",status="404"}'], 1)
+
+    def test_counters_accumulate_across_scrapes(self):
+        self.client.force_authenticate(User.objects.get(pk=self.customer.pk))
+        self.client.get('/api/menu-items/')
+        first = self.scrape()
+        self.client.force_authenticate(User.objects.get(pk=self.customer.pk))
+        self.client.get('/api/menu-items/')
+        second = self.scrape()
+        key = 'littlelemon_requests_total{view="/api/menu-items/",method="GET",status="200"}'
+        self.assertEqual((first[key], second[key]), (1, 2))
+
+    def test_only_managers_can_scrape(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 401)
+        self.client.force_authenticate(User.objects.get(pk=self.customer.pk))
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+
+
+class MetricsRegistryTests(SimpleTestCase):
+    def test_overwritten_samples_are_counted_as_dropped(self):
+        registry = metrics.MetricsRegistry(size=4, buckets=(0.1, 1.0))
+        for seconds in (0.05, 0.5, 2.0, 0.05, 0.05, 0.5):
+            registry.record('/api/x/', 'GET', 200, seconds, 1, 0.01, 0.0, 10)
+        requests, series = registry.collect()
+        self.assertEqual(requests, {('/api/x/', 'GET', 200): 4})
+        self.assertEqual(series['/api/x/', 'GET']['buckets'], [2, 1])  # The 2.0s sample only shows in +Inf
+        self.assertIn('littlelemon_metrics_dropped_samples_total 2', registry.render())
+
+        registry.record('/api/x/', 'GET', 500, 0.05, 0, 0.0, 0.0, 0)
+        requests, series = registry.collect()
+        self.assertEqual(requests[('/api/x/', 'GET', 500)], 1)
+        self.assertEqual(series['/api/x/', 'GET']['count'], 5)
+
+    def test_label_values_are_escaped(self):
+        self.assertEqual(metrics.labels(view='a"b\\c\n'), 'view="a\\"b\\\\c\\n"')
+
+
+class LoadTestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        loadtest.seed(scale=0.01)
+
+    def setUp(self):
+        clear_caches()
+
+    def test_in_process_run_covers_every_scenario_without_errors(self):
+        with loadtest.unthrottled():
+            report = loadtest.run(loadtest.InProcessTransport, loadtest.Fixture(), iterations=2)
+        self.assertEqual(set(report['scenarios']), set(loadtest.SCENARIOS))
+        self.assertIn('POST /api/orders/', report['endpoints'])
+        self.assertIn('PATCH /api/orders/{id}/', report['endpoints'])
+        for endpoint, stats in report['endpoints'].items():
+            with self.subTest(endpoint=endpoint):
+                self.assertEqual((stats['errors'], stats['throttled']), (0, 0))
+                self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+                self.assertGreater(stats['queries'], 0)
+        json.dumps(report)
+
+    def test_in_process_command_keeps_the_shared_caches_untouched(self):
+        # The seeded users' ids exist in the real database too, so their cached roles must stay in the run
+        before = shared_state()
+        with command_on_test_database('LittleLemonAPI.management.commands.loadtest'), \
+                mock.patch('LittleLemonAPI.loadtest.seed'):  # Seeded in setUpTestData
+            call_command('loadtest', iterations=1, stdout=io.StringIO())
+        self.assertEqual(shared_state(), before)
+
+    def test_fixture_removes_the_tokens_it_created(self):
+        user = User.objects.filter(username__startswith=loadtest.USERNAME_PREFIX).first()
+        own = Token.objects.create(user=user)
+        fixture = loadtest.Fixture()
+        self.assertGreater(Token.objects.count(), 1)
+        fixture.close()
+        self.assertEqual(list(Token.objects.values_list('key', flat=True)), [own.key])
+
+    def test_compare_flags_latency_and_query_regressions(self):
+        def report(p95, queries):
+            return {'endpoints': {'GET /api/orders/': {'p50_ms': 5.0, 'p95_ms': p95, 'p99_ms': 9.0, 'queries': queries}}}
+        regressed = {(metric, flagged) for _, metric, _, _, flagged in loadtest.compare(report(20.0, 5), report(8.0, 4))}
+        self.assertEqual(regressed, {('p50_ms', False), ('p95_ms', True), ('p99_ms', False), ('queries', True)})
+        # Within the tolerance, or under the absolute floor: not a regression
+        self.assertFalse(any(row[-1] for row in loadtest.compare(report(9.0, 4), report(8.0, 4))))
+        self.assertFalse(any(row[-1] for row in loadtest.compare(report(0.9, 4), report(0.3, 4))))
+
+
+class BenchmarkCommandTests(TestCase):
+    def setUp(self):
+        clear_caches()
+
+    def test_keeps_the_shared_caches_untouched(self):
+        def benchmark(scale, repeat):
+            # What the benchmarks do around their timed calls
+            user = User.objects.create_user(username='bench')
+            Group.objects.create(name=roles.MANAGERS).user_set.add(user)
+            roles.get_roles(user)
+            catalog_cache.bump()
+            throttle_store().incr('bench', 0, 60)
+            throttle_store().clear()
+            return [('scenario', {column: 0 for column in ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'queries')})]
+
+        before = shared_state()
+        with command_on_test_database('LittleLemonAPI.management.commands.benchmark'), \
+                mock.patch.dict('LittleLemonAPI.management.commands.benchmark.REGISTRY', {'fake': (benchmark, 'Fake')}):
+            call_command('benchmark', 'fake', stdout=io.StringIO())
+        self.assertEqual(shared_state(), before)
+
+
+class SyntheticDataTests(TestCase):
+    def generate(self, seed=0):
+        generator = synthetic.Generator(orders=2000, customers=50, crew=4, menu_items=30, days=28, end=date(2025, 3, 30), seed=seed)
+        counts = generator.run()
+        orders = list(Order.objects.order_by('id').values_list('user__username', 'delivery_crew__username', 'status', 'total', 'date'))
+        lines = list(OrderItem.objects.order_by('order_id', 'menuitem__slug').values_list('menuitem__slug', 'quantity', 'price'))
+        return counts, orders, lines
+
+    def test_same_seed_same_data(self):
+        runs = []
+        for seed in (0, 0, 1):
+            with transaction.atomic():
+                runs.append(self.generate(seed))
+                transaction.set_rollback(True)
+        self.assertEqual(runs[0], runs[1])
+        self.assertNotEqual(runs[0][1], runs[2][1])
+
+    def test_rows_are_consistent_and_skewed(self):
+        counts, orders, _ = self.generate()
+        self.assertEqual(counts['orders'], 2000)
+        self.assertEqual(counts['order_items'], OrderItem.objects.count())
+        # Totals add up, crew only comes from the crew group, and the history ends at --end
+        mismatched = Order.objects.annotate(lines=Sum('orderitem__price')).exclude(total=F('lines'))
+        self.assertFalse(mismatched.exists())
+        crew = set(User.objects.filter(groups__name=roles.DELIVERY_CREW).values_list('username', flat=True))
+        self.assertTrue({order[1] for order in orders if order[1]} <= crew)
+        self.assertEqual(max(order[4] for order in orders), date(2025, 3, 30))
+        # Saturdays are busier than Mondays, and the best-selling dish far outsells the median one
+        weekdays = Counter(order[4].weekday() for order in orders)
+        self.assertGreater(weekdays[5], weekdays[0])
+        sold = sorted(OrderItem.objects.values('menuitem').annotate(units=Sum('quantity')).values_list('units', flat=True))
+        self.assertGreater(sold[-1], 4 * sold[len(sold) // 2])
+        self.assertEqual(DailySales.objects.aggregate(orders=Sum('order_count'))['orders'], 2000)
+
+
+class IndexUsageTests(TestCase):
+    """
+    EXPLAINs the query behind every list endpoint on a seeded, ANALYZEd database and checks
+    the planner picks the composite index meant for it instead of scanning or sorting.
+    """
+    orders = 20000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create([User(username=f'user{i}') for i in range(50)])
+        cls.categories = Category.objects.bulk_create([Category(slug=f'c{i}', title=f'C{i}') for i in range(10)])
+        MenuItem.objects.bulk_create([
+            MenuItem(title=f'Item {i}', price=i % 40 + 1, featured=i % 7 == 0, category=cls.categories[i % 10])
+            for i in range(2000)
+        ])
+        Order.objects.bulk_create([
+            Order(user=cls.users[i % 50], delivery_crew=cls.users[(i * 7) % 50], status=i % 3 == 0,
+                  total=10, date=date(2024, 1, 1) + timedelta(days=i % 365))
+            for i in range(cls.orders)
+        ], batch_size=2000)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {index}', plan)
+        self.assertNotIn('TEMP B-TREE', plan)  # No sort step: rows come off the index in order
+
+    def test_customer_orders(self):
+        self.assertUsesIndex(Order.objects.filter(user=self.users[3]).order_by('-date'), 'order_user_date_idx')
+
+    def test_delivery_crew_orders(self):
+        self.assertUsesIndex(Order.objects.filter(delivery_crew=self.users[3]).order_by('-date'), 'order_crew_date_idx')
+
+    def test_manager_orders_and_cursor_pages(self):
+        self.assertUsesIndex(Order.objects.order_by('-date', '-id')[:5], 'order_date_id_idx')
+        paginator = KeysetPagination(ordering=('-date', '-id'))
+        page = Order.objects.filter(paginator.after([date(2024, 6, 1), 5000])).order_by('-date', '-id')[:5]
+        self.assertUsesIndex(page, 'order_date_id_idx')
+
+    def test_menu_items_by_category(self):
+        items = MenuItem.objects.filter(category=self.categories[2]).featured_is(True).order_by('price')
+        self.assertUsesIndex(items, 'menuitem_cat_feat_price_idx')
+
+    def test_menu_items_by_price(self):
+        self.assertUsesIndex(MenuItem.objects.filter(price__gte=5, price__lte=20).order_by('price', 'id')[:5], 'menuitem_price_id_idx')
+
+    def test_cart_by_user(self):
+        self.assertIn('USING INDEX', Cart.objects.filter(user=self.users[3]).explain())
+
+
+@override_settings(ROOT_URLCONF='LittleLemon.asgi_urls')
+class AsyncReadPathTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        cls.other = User.objects.create_user(username='other', password='pass')
+        cls.manager = User.objects.create_user(username='manager', password='pass')
+        cls.manager.groups.add(Group.objects.create(name=roles.MANAGERS))
+        cls.tokens = {user.username: Token.objects.create(user=user).key for user in (cls.customer, cls.other, cls.manager)}
+        category = Category.objects.create(slug='mains', title='Mains')
+        cls.items = [MenuItem.objects.create(title=f'Lemon Dish {i}', price=f'{i + 3}.50', featured=i % 2 == 0, category=category)
+                     for i in range(8)]
+        Cart.objects.create(user=cls.customer, menuitem=cls.items[0], quantity=2, unit_price='3.50', price='7.00')
+        cls.orders = []
+        for day in range(1, 4):
+            order = Order.objects.create(user=cls.customer, total='8.00', date=date(2024, 1, day))
+            OrderItem.objects.create(order=order, menuitem=cls.items[1], quantity=2, unit_price='4.00', price='8.00')
+            cls.orders.append(order)
+
+    def setUp(self):
+        clear_caches()
+
+    def headers(self, username=None, **headers):
+        if username:
+            headers['Authorization'] = f'Token {self.tokens[username]}'
+        return headers
+
+    def get_both(self, path, username=None, **headers):
+        # The same request through the DRF view (urls.py) and the async view, each with cold caches
+        with override_settings(ROOT_URLCONF='LittleLemon.urls'):
+            sync = APIClient().get(path, headers=self.headers(username, **headers))
+        clear_caches()
+        response = async_to_sync(AsyncClient().get)(path, headers=self.headers(username, **headers))
+        return sync, response
+
+    def assertSameResponse(self, path, username=None, status=200, **headers):
+        sync, response = self.get_both(path, username, **headers)
+        self.assertEqual(sync.status_code, status, sync.content)
+        self.assertEqual(response.status_code, status)
+        self.assertEqual(response.content, sync.content)
+        for header in ('Content-Type', 'ETag', 'Last-Modified', 'Vary', 'Allow', 'WWW-Authenticate', 'Retry-After'):
+            # Clearing the caches between the two requests restarts the catalog version
+            normalize = functools.partial(re.sub, r'catalog-\d+', 'catalog-N')
+            self.assertEqual(normalize(response.get(header) or ''), normalize(sync.get(header) or ''), header)
+        return response
+
+    def test_routes_resolve_to_coroutine_views(self):
+        for path in ('/api/menu-items/', '/api/menu-items/1/', '/api/categories/', '/api/cart/menu-items/',
+                     '/api/orders/', '/api/orders/1/'):
+            self.assertTrue(asyncio.iscoroutinefunction(resolve(path).func), path)
+        self.assertFalse(asyncio.iscoroutinefunction(resolve('/api/orders/export/').func))
+
+    @loadtest.unthrottled()
+    def test_catalog_reads_match_sync_views(self):
+        pk = self.items[2].pk
+        for path in ('/api/menu-items/', '/api/menu-items/?page=2', '/api/menu-items/?page=9',
+                     '/api/menu-items/?ordering=-price&featured=true', '/api/menu-items/?search=lemon&category=mains',
+                     '/api/menu-items/?pagination=cursor&ordering=title', '/api/menu-items/?price_min=abc',
+                     f'/api/menu-items/{pk}/', '/api/menu-items/9999/', '/api/categories/'):
+            with self.subTest(path=path):
+                sync, response = self.get_both(path)
+                self.assertEqual(response.status_code, sync.status_code)
+                self.assertEqual(response.content, sync.content)
+
+        with override_settings(FAST_SERIALIZERS=True):
+            self.assertSameResponse('/api/menu-items/?page=2')
+
+    @loadtest.unthrottled()
+    def test_cart_and_order_reads_match_sync_views(self):
+        pk = self.orders[0].pk
+        self.assertSameResponse('/api/cart/menu-items/', 'customer')
+        self.assertSameResponse('/api/orders/', 'customer')
+        self.assertSameResponse('/api/orders/', 'manager')
+        self.assertSameResponse('/api/orders/', 'other')
+        self.assertSameResponse('/api/orders/?pagination=cursor&page_size=2', 'customer')
+        self.assertSameResponse(f'/api/orders/{pk}/', 'customer')
+        self.assertSameResponse(f'/api/orders/{pk}/', 'manager')
+        self.assertSameResponse(f'/api/orders/{pk}/', 'other', status=403)
+        self.assertSameResponse('/api/orders/9999/', 'customer', status=404)
+        with override_settings(FAST_SERIALIZERS=True):
+            self.assertSameResponse('/api/orders/', 'customer')
+            self.assertSameResponse('/api/cart/menu-items/', 'customer')
+
+    @loadtest.unthrottled()
+    def test_authentication_errors_match_sync_views(self):
+        response = self.assertSameResponse('/api/orders/', status=401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+        self.assertSameResponse('/api/cart/menu-items/', status=401, Authorization='Token not-a-token')
+        self.assertSameResponse('/api/menu-items/', status=401, Authorization='Token two words')
+
+        User.objects.filter(pk=self.other.pk).update(is_active=False)
+        self.assertSameResponse('/api/orders/', status=401, Authorization=f"Token {self.tokens['other']}")
+
+    @loadtest.unthrottled()
+    def test_warm_reads_query_nothing_and_conditional_get(self):
+        client = AsyncClient()
+        async_to_sync(client.get)('/api/menu-items/', headers=self.headers('customer'))
+        with CaptureQueriesContext(connection) as queries:
+            response = async_to_sync(client.get)('/api/menu-items/', headers=self.headers('customer'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 0)  # Token, roles and the rendered page all come from caches
+
+        not_modified = async_to_sync(client.get)('/api/menu-items/', headers={'If-None-Match': response['ETag']})
+        self.assertEqual(not_modified.status_code, 304)
+
+        orders = async_to_sync(client.get)('/api/orders/', headers=self.headers('customer'))
+        again = async_to_sync(client.get)('/api/orders/', headers=self.headers('customer', **{'If-None-Match': orders['ETag']}))
+        self.assertEqual(again.status_code, 304)
+
+    def test_throttles_apply(self):
+        client = AsyncClient()
+        statuses = [async_to_sync(client.get)('/api/menu-items/').status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])  # The anonymous rate is 2/minute
+
+        response = async_to_sync(client.get)('/api/menu-items/')
+        self.assertIn('Retry-After', response)
+        self.assertEqual(json.loads(response.content)['detail'][:24], 'Request was throttled. E')
+
+    @loadtest.unthrottled()
+    def test_writes_and_browsable_api_go_to_drf_views(self):
+        client = AsyncClient()
+        response = async_to_sync(client.post)('/api/cart/menu-items/', {'menuitem': self.items[3].pk, 'quantity': 1},
+                                              content_type='application/json', headers=self.headers('customer'))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Cart.objects.filter(user=self.customer).count(), 2)
+
+        denied = async_to_sync(client.post)('/api/menu-items/', {'title': 'New', 'price': '1.00'},
+                                            content_type='application/json', headers=self.headers('customer'))
+        self.assertEqual(denied.status_code, 403)
+
+        html = async_to_sync(client.get)('/api/menu-items/', headers={'Accept': 'text/html'})
+        self.assertEqual(html.status_code, 200)
+        self.assertTrue(html['Content-Type'].startswith('text/html'))
+
+    @loadtest.unthrottled()
+    def test_metrics_count_async_requests(self):
+        patcher = mock.patch.object(metrics, 'registry', metrics.MetricsRegistry(size=64))
+        registry = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        async_to_sync(AsyncClient().get)('/api/orders/', headers=self.headers('customer'))
+        text = registry.render()
+        self.assertIn('littlelemon_requests_total{view="/api/orders/",method="GET",status="200"} 1', text)
+        self.assertNotIn('littlelemon_db_queries_total{view="/api/orders/",method="GET"} 0', text)
+
+
+class ASGIApplicationTests(TransactionTestCase):
+    def call(self, application, path):
+        requests = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+        async def receive():
+            if requests:
+                return requests.pop()
+            await asyncio.Future()  # Still connected until the handler stops listening
+
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+                 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+                 'headers': [(b'host', b'testserver')], 'client': ('127.0.0.1', 50000), 'server': ('testserver', 80)}
+        return scope, receive, send, messages
+
+    @override_settings(ASGI_SYNC_THREADS=2)
+    @loadtest.unthrottled()
+    def test_requests_share_a_fixed_set_of_sync_threads(self):
+        from LittleLemon.asgi import LittleLemonASGIHandler
+
+        clear_caches()
+        application = LittleLemonASGIHandler()
+        threads = set()
+
+        def record_thread(**kwargs):
+            threads.add(threading.get_ident())
+        request_started.connect(record_thread)
+        self.addCleanup(request_started.disconnect, record_thread)
+
+        calls = [self.call(application, '/api/menu-items/') for _ in range(10)]
+
+        async def serve():
+            await asyncio.gather(*(application(scope, receive, send) for scope, receive, send, _ in calls))
+        async_to_sync(serve)()
+
+        for *_, messages in calls:
+            self.assertEqual(messages[0]['status'], 200)
+            self.assertEqual(json.loads(messages[1]['body']), {'count': 0, 'next': None, 'previous': None, 'results': []})
+        self.assertLessEqual(len(threads), 2)
+
+    @override_settings(ASGI_SYNC_THREADS=2)
+    @loadtest.unthrottled()
+    def test_requests_avoid_a_busy_sync_thread(self):
+        from LittleLemon.asgi import LittleLemonASGIHandler
+
+        clear_caches()
+        application = LittleLemonASGIHandler()
+        # A slow request (an export, a checkout waiting on the write lock) holds the first thread
+        release = threading.Event()
+        busy = application.sync_threads[0].submit(release.wait, 10)
+        self.addCleanup(release.set)
+        threads = set()
+
+        def record_thread(**kwargs):
+            threads.add(threading.current_thread().name)
+        request_started.connect(record_thread)
+        self.addCleanup(request_started.disconnect, record_thread)
+
+        calls = [self.call(application, '/api/menu-items/') for _ in range(6)]
+
+        async def serve():
+            requests = asyncio.gather(*(application(scope, receive, send) for scope, receive, send, _ in calls))
+            await asyncio.wait_for(requests, 5)
+        asyncio.run(serve())  # Not async_to_sync(), whose calling thread would take the sync calls instead
+
+        self.assertFalse(busy.done())
+        self.assertEqual([messages[0]['status'] for *_, messages in calls], [200] * 6)
+        self.assertEqual({name.rsplit('_', 1)[0] for name in threads}, {'asgi-sync-1'})
+
+
+@override_settings(ROOT_URLCONF='LittleLemon.asgi_urls',
+                   ORDER_EVENTS={'BACKEND': 'LittleLemonAPI.events.LocalBroker'})
+class OrderEventsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        cls.other = User.objects.create_user(username='other', password='pass')
+        cls.crew = User.objects.create_user(username='crew', password='pass')
+        cls.crew.groups.add(Group.objects.create(name=roles.DELIVERY_CREW))
+        cls.manager = User.objects.create_user(username='manager', password='pass')
+        cls.manager.groups.add(Group.objects.create(name=roles.MANAGERS))
+        cls.tokens = {user.username: Token.objects.create(user=user).key
+                      for user in (cls.customer, cls.other, cls.crew, cls.manager)}
+        category = Category.objects.create(slug='mains', title='Mains')
+        cls.item = MenuItem.objects.create(title='Lemon Chicken', price='9.50', featured=False, category=category)
+        cls.order = Order.objects.create(user=cls.customer, total='9.50', date=date(2024, 1, 1))
+
+    def setUp(self):
+        clear_caches()
+
+    def client_for(self, username):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.tokens[username]}')
+        return client
+
+    def listen(self, usernames, action, timeout=0.5):
+        """
+        Opens an event stream for each of `usernames`, runs `action` (a sync callable using the DRF
+        views) and returns the response and the messages each stream received.
+        """
+        def act():
+            with override_settings(ROOT_URLCONF='LittleLemon.urls'), self.captureOnCommitCallbacks(execute=True):
+                action()
+
+        async def run():
+            streams = {}
+            for username in usernames:
+                response = await AsyncClient().get('/api/orders/events/', headers={
+                    'Authorization': f'Token {self.tokens[username]}', 'Accept': 'text/event-stream'})
+                chunks = aiter(response.streaming_content)
+                self.assertEqual(await anext(chunks), b'retry: 3000\n\n')  # Subscribed from here on
+                streams[username] = (response, chunks)
+            await sync_to_async(act)()
+
+            received = {}
+            for username, (response, chunks) in streams.items():
+                messages = []
+                try:
+                    while True:
+                        messages.append(await asyncio.wait_for(anext(chunks), timeout))
+                except TimeoutError:
+                    pass
+                await chunks.aclose()
+                received[username] = (response, messages)
+            return received
+        return async_to_sync(run)()
+
+    def events(self, messages):
+        parsed = []
+        for message in messages:
+            fields = dict(line.split(': ', 1) for line in message.decode().strip().split('\n'))
+            parsed.append((fields['event'], json.loads(fields['data'])))
+        return parsed
+
+    @loadtest.unthrottled()
+    def test_crew_assignment_and_status_change_reach_the_customer_and_crew(self):
+        def assign_and_deliver():
+            response = self.client_for('manager').put(f'/api/orders/{self.order.pk}/',
+                                                      {'Delivery Crew': self.crew.pk, 'user': self.customer.pk,
+                                                       'total': '9.50', 'date': '2024-01-01'}, format='json')
+            self.assertEqual(response.status_code, 200, response.content)
+            response = self.client_for('crew').patch(f'/api/orders/{self.order.pk}/', {'status': 1}, format='json')
+            self.assertEqual(response.status_code, 200, response.content)
+
+        received = self.listen(['customer', 'crew', 'other', 'manager'], assign_and_deliver)
+
+        response = received['customer'][0]
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        assigned = {'order': self.order.pk, 'user': self.customer.pk, 'delivery_crew': self.crew.pk, 'status': False}
+        expected = [('crew-assigned', assigned), ('status-changed', {**assigned, 'status': True})]
+        for username in ('customer', 'crew', 'manager'):
+            self.assertEqual(self.events(received[username][1]), expected, username)
+        self.assertEqual(received['other'][1], [])
+        self.assertEqual(events.event_broker().subscriber_count(), 0)  # Closing the streams unsubscribed them
+
+    @loadtest.unthrottled()
+    def test_checkout_publishes_order_created_to_managers(self):
+        Cart.objects.create(user=self.customer, menuitem=self.item, quantity=1, unit_price='9.50', price='9.50')
+
+        def checkout():
+            response = self.client_for('customer').post('/api/orders/')
+            self.assertEqual(response.status_code, 201, response.content)
+
+        received = self.listen(['manager', 'crew'], checkout)
+        order = Order.objects.latest('id')
+        self.assertEqual(self.events(received['manager'][1]), [
+            ('order-created', {'order': order.pk, 'user': self.customer.pk, 'delivery_crew': None, 'status': False}),
+        ])
+        self.assertEqual(received['crew'][1], [])
+
+    def test_unchanged_order_publishes_nothing(self):
+        with mock.patch.object(events.LocalBroker, 'publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            events.publish_order_changes(self.order, events.order_state(self.order))
+        publish.assert_not_called()
+
+    def test_reassignment_tells_the_previous_crew_member(self):
+        before = events.order_state(self.order)
+        self.order.delivery_crew = self.crew
+        with mock.patch.object(events.LocalBroker, 'publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            events.publish_order_changes(self.order, before)
+        (name, channels, _), = [call.args for call in publish.call_args_list]
+        self.assertEqual(name, 'crew-assigned')
+        self.assertCountEqual(channels, ['managers', f'user:{self.customer.pk}', f'user:{self.crew.pk}'])
+
+        before = events.order_state(self.order)
+        self.order.delivery_crew = None
+        with mock.patch.object(events.LocalBroker, 'publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            events.publish_order_changes(self.order, before)
+        self.assertIn(f'user:{self.crew.pk}', publish.call_args.args[1])
+
+    def test_anonymous_stream_is_refused(self):
+        response = async_to_sync(AsyncClient().get)('/api/orders/events/', headers={'Accept': 'text/event-stream'})
+        self.assertEqual(response.status_code, 401)
+        self.assertTrue(response.content.startswith(b'event: error\ndata: '))
+
+    @loadtest.unthrottled()
+    def test_wsgi_does_not_stream(self):
+        with override_settings(ROOT_URLCONF='LittleLemon.urls'):
+            response = self.client_for('customer').get('/api/orders/events/')
+        self.assertEqual(response.status_code, 501)
+
+
+class SQLiteBrokerTests(SimpleTestCase):
+    def test_events_reach_subscribers_of_another_broker(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = f'{directory.name}/events.sqlite3'
+        publisher = events.SQLiteBroker(path)  # Two workers sharing the file
+        listener = events.SQLiteBroker(path, poll_interval=0.01)
+
+        async def run():
+            subscription = listener.subscribe(['user:1'])
+            try:
+                await asyncio.sleep(0.05)  # Let the poller start from the current end of the table
+                await sync_to_async(publisher.publish, thread_sensitive=False)('status-changed', ['user:2'], {'order': 1})
+                await sync_to_async(publisher.publish, thread_sensitive=False)('status-changed', ['user:1'], {'order': 2})
+                event = await subscription.get(timeout=2)
+            finally:
+                subscription.close()
+            return event
+        event = async_to_sync(run)()
+        self.assertEqual((event.name, event.data), ('status-changed', {'order': 2}))
+        self.assertEqual(event.encode(), f'id: {event.id}\nevent: status-changed\ndata: {{"order": 2}}\n\n')
+
+
+class SQLiteProfileTests(TransactionTestCase):
+    def test_connections_get_the_configured_pragmas(self):
+        connection.close()  # The next query opens a new connection
+        self.assertEqual(sqlite.pragma(connection, 'journal_mode'), 'wal')
+        self.assertEqual(sqlite.pragma(connection, 'synchronous'), 1)  # NORMAL
+        self.assertEqual(sqlite.pragma(connection, 'busy_timeout'), 5000)
+        self.assertEqual(sqlite.pragma(connection, 'cache_size'), -64000)
+
+    def test_connections_leave_the_database_file_alone(self):
+        # Opening a database must not switch its journal mode: that rewrites the file header
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = f'{directory.name}/db.sqlite3'
+        with closing(sqlite3.connect(path)) as db:
+            db.execute('CREATE TABLE dish (title TEXT)')
+        other = connections['default'].__class__({**connection.settings_dict, 'NAME': path}, alias='other')
+        self.addCleanup(other.close)
+        self.assertEqual(sqlite.pragma(other, 'journal_mode'), 'delete')
+        self.assertEqual(sqlite.pragma(other, 'busy_timeout'), 5000)
+
+        call_command('enable_wal', stdout=io.StringIO())  # The deploy step, here on the test database
+        self.assertEqual(sqlite.enable_wal(other), 'wal')
+        other.close()
+        with closing(sqlite3.connect(path)) as db:
+            self.assertEqual(db.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+
+    def test_write_transactions_take_the_lock_at_begin(self):
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                Category.objects.create(slug='mains', title='Mains')
+        self.assertEqual(queries.captured_queries[0]['sql'], 'BEGIN IMMEDIATE')
+
+    def test_concurrent_writers_wait_instead_of_failing(self):
+        errors = []
+
+        def checkout(i):
+            try:
+                for j in range(10):
+                    with transaction.atomic():
+                        Category.objects.filter(slug__startswith='writer').count()  # Read first, as checkout does
+                        Category.objects.create(slug=f'writer-{i}-{j}', title='Writer')
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+        threads = [threading.Thread(target=checkout, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(Category.objects.filter(slug__startswith='writer').count(), 40)
+
+
+@override_settings(READ_REPLICAS={'ALIASES': ['replica'], 'PIN_SECONDS': 5, 'CACHE_ALIAS': 'default'})
+class ReadReplicaTests(TransactionTestCase):
+    # The test runner makes 'replica' a second connection to the test database
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        clear_caches()
+        self.customer = User.objects.create_user(username='customer', password='pass')
+        self.token = Token.objects.create(user=self.customer).key
+        category = Category.objects.create(slug='mains', title='Mains')
+        self.item = MenuItem.objects.create(title='Lemon Chicken', price='9.50', featured=False, category=category)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def queries(self, method, path, data=None):
+        # How many queries the request sent to the primary and to the replica
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = getattr(self.client, method)(path, data, format='json')
+        self.assertLess(response.status_code, 300, response.content)
+        return len(primary.captured_queries), len(replica.captured_queries)
+
+    def tables(self, queries):
+        return {table for query in queries for table in ('authtoken_token', 'LittleLemonAPI_cart', 'LittleLemonAPI_menuitem')
+                if f'"{table}"' in query['sql']}
+
+    def primary_tables(self, path):
+        with CaptureQueriesContext(connections['default']) as primary:
+            self.assertEqual(self.client.get(path).status_code, 200)
+        return self.tables(primary.captured_queries)
+
+    @loadtest.unthrottled()
+    def test_safe_requests_read_from_a_replica(self):
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.assertEqual(self.primary_tables('/api/cart/menu-items/'), {'authtoken_token'})
+        self.assertIn('LittleLemonAPI_cart', self.tables(replica.captured_queries))
+
+    @loadtest.unthrottled()
+    def test_credentials_and_catalog_read_from_the_primary(self):
+        # A token from the login POST is not pinned; the replica may not have it yet
+        client = APIClient()
+        token = client.post('/api/token/login/', {'username': 'customer', 'password': 'pass'}).json()['auth_token']
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = client.get('/api/cart/menu-items/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('authtoken_token', self.tables(replica.captured_queries))
+
+        # Catalog responses are cached under the primary's catalog version, so they are rendered from it
+        primary, replica = self.queries('get', '/api/menu-items/')
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    @loadtest.unthrottled()
+    def test_writes_pin_the_client_to_the_primary(self):
+        primary, replica = self.queries('post', '/api/cart/menu-items/', {'menuitem': self.item.pk, 'quantity': 1})
+        self.assertEqual(replica, 0)
+
+        # The cart is read back from the primary, which already has the new line
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get('/api/cart/menu-items/')
+        self.assertEqual(len(replica.captured_queries), 0)
+        self.assertEqual([line['menuitem'] for line in response.json()], [self.item.pk])
+
+        # Other clients are not pinned, and neither is this one once the pin expires
+        other = User.objects.create_user(username='other', password='pass')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=other).key}')
+        self.assertNotIn('LittleLemonAPI_cart', self.primary_tables('/api/cart/menu-items/'))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        clear_caches()  # Drops the pin
+        self.assertNotIn('LittleLemonAPI_cart', self.primary_tables('/api/cart/menu-items/'))
+
+    def test_reads_outside_requests_use_the_primary(self):
+        self.assertEqual(MenuItem.objects.all().db, 'default')
+        self.assertIsNone(routers.read_alias())
+
+    def test_pins_need_a_cache_every_worker_shares(self):
+        local = {**settings.CACHES, 'local': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(CACHES=local, READ_REPLICAS={'ALIASES': ['replica'], 'CACHE_ALIAS': 'local'}):
+            with self.assertRaises(ImproperlyConfigured):
+                routers.ReadReplicaMiddleware(lambda request: None)
+        routers.ReadReplicaMiddleware(lambda request: None)  # The file-based default cache is shared
+
+
+class SyncReplicaTests(SimpleTestCase):
+    def test_copies_the_database_file(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        primary, replica = f'{directory.name}/primary.sqlite3', f'{directory.name}/replica.sqlite3'
+        with closing(sqlite3.connect(primary)) as db:
+            db.execute('PRAGMA journal_mode = WAL')
+            db.execute('CREATE TABLE dish (title TEXT)')
+            db.execute("INSERT INTO dish VALUES ('Lemon Chicken')")
+            db.commit()
+            sqlite.copy_database(primary, replica)
+            db.execute("INSERT INTO dish VALUES ('Greek Salad')")  # After the copy: not replicated yet
+            db.commit()
+        with closing(sqlite3.connect(replica)) as db:
+            self.assertEqual(db.execute('SELECT title FROM dish').fetchall(), [('Lemon Chicken',)])
+
+    def test_refuses_the_primary(self):
+        with self.assertRaises(CommandError):
+            call_command('sync_replica', database='default')
+
+
+class TaskQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        crew = Group.objects.create(name=roles.DELIVERY_CREW)
+        cls.busy_crew = User.objects.create_user(username='busy', password='pass')
+        cls.idle_crew = User.objects.create_user(username='idle', password='pass')
+        crew.user_set.add(cls.busy_crew, cls.idle_crew)
+        Order.objects.create(user=cls.customer, delivery_crew=cls.busy_crew, total='1.00', date=date(2024, 1, 1))
+        category = Category.objects.create(slug='mains', title='Mains')
+        cls.item = MenuItem.objects.create(title='Lemon Chicken', price='9.50', featured=False, category=category)
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def checkout(self):
+        Cart.objects.create(user=self.customer, menuitem=self.item, quantity=2, unit_price='9.50', price='19.00')
+        response = self.client.post('/api/orders/')
+        self.assertEqual(response.status_code, 201)
+        return Order.objects.get(pk=response.json()['order_id'])
+
+    @loadtest.unthrottled()
+    def test_checkout_leaves_the_rollups_to_a_task(self):
+        order = self.checkout()
+        self.assertEqual(list(Task.objects.values_list('name', 'status')), [('record-order-sales', 'queued')])
+        self.assertFalse(DailySales.objects.exists())
+
+        self.assertEqual(tasks.run_pending(), 1)
+        self.assertEqual(DailySales.objects.get(date=order.date).revenue, Decimal('19.00'))
+        self.assertFalse(Task.objects.exists())  # Deleted with the commit of its work
+
+    @loadtest.unthrottled()
+    def test_rollups_even_out_when_the_order_is_deleted_first(self):
+        order = self.checkout()
+        order.delete()
+        tasks.run_pending()
+        self.assertEqual(DailySales.objects.get(date=order.date).revenue, 0)
+
+    @loadtest.unthrottled()
+    def test_rollups_skip_menu_items_and_categories_deleted_first(self):
+        drinks = Category.objects.create(slug='drinks', title='Drinks')
+        lemonade = MenuItem.objects.create(title='Lemonade', price='3.00', featured=False, category=drinks)
+        Cart.objects.create(user=self.customer, menuitem=lemonade, quantity=1, unit_price='3.00', price='3.00')
+        order = self.checkout()
+        # The lemonade's order line goes with it; the chicken moves out of a category that is then deleted
+        lemonade.delete()
+        self.item.category = None
+        self.item.save()
+        Category.objects.all().delete()
+
+        tasks.run_pending()
+        self.assertFalse(Task.objects.exists())
+        self.assertEqual(DailySales.objects.get(date=order.date).revenue, Decimal('22.00'))
+        self.assertEqual(list(DailyItemSales.objects.values_list('menuitem', 'category', 'quantity')),
+                         [(self.item.pk, None, 2)])
+
+    @override_settings(AUTO_ASSIGN_DELIVERY_CREW=True)
+    @loadtest.unthrottled()
+    def test_new_orders_go_to_the_least_busy_crew_member(self):
+        order = self.checkout()
+        self.assertIsNone(order.delivery_crew)
+        tasks.run_pending()
+        order.refresh_from_db()
+        self.assertEqual(order.delivery_crew, self.idle_crew)
+
+    def test_tasks_vanish_with_a_rolled_back_transaction(self):
+        with self.assertRaises(ZeroDivisionError), transaction.atomic():
+            tasks.enqueue('assign-delivery-crew', order_id=1)
+            1 / 0
+        self.assertFalse(Task.objects.exists())
+        with self.assertRaises(LookupError):
+            tasks.enqueue('no-such-task')
+
+    def test_failures_retry_with_backoff_then_give_up(self):
+        def flaky():
+            Category.objects.create(slug='written', title='Written')  # Rolled back with the failure
+            raise RuntimeError('kitchen printer offline')
+
+        with mock.patch.dict(tasks.REGISTRY, {'flaky': (flaky, 2)}):
+            task = tasks.enqueue('flaky')
+            self.assertEqual(tasks.run_pending(), 1)
+            task.refresh_from_db()
+            self.assertEqual((task.status, task.attempts), (Task.QUEUED, 1))
+            self.assertIn('kitchen printer offline', task.last_error)
+            self.assertGreater(task.run_after, timezone.now())
+            self.assertFalse(Category.objects.filter(slug='written').exists())
+            self.assertEqual(tasks.run_pending(), 0)  # Not due yet
+
+            Task.objects.update(run_after=timezone.now())
+            tasks.run_pending()
+            task.refresh_from_db()
+            self.assertEqual((task.status, task.attempts), (Task.FAILED, 2))
+
+    def test_backoff_doubles_up_to_the_cap(self):
+        with override_settings(TASKS={'BACKOFF_SECONDS': 2, 'MAX_BACKOFF_SECONDS': 10}), \
+                mock.patch('random.uniform', lambda low, high: high):
+            self.assertEqual([tasks.backoff(attempts) for attempts in (1, 2, 3, 4)], [2, 4, 8, 10])
+
+    def test_tasks_of_a_dead_worker_are_claimed_again(self):
+        task = tasks.enqueue('assign-delivery-crew', order_id=1)
+        self.assertEqual(tasks.claim().pk, task.pk)
+        self.assertIsNone(tasks.claim())  # Leased to the first worker
+        Task.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(tasks.claim().attempts, 2)
+
+
+class RunWorkerTests(TransactionTestCase):
+    def test_burst_drains_the_queue_with_several_threads(self):
+        for _ in range(20):
+            tasks.enqueue('assign-delivery-crew', order_id=0)
+        call_command('run_worker', burst=True, threads=3, stdout=io.StringIO())
+        self.assertFalse(Task.objects.exists())
+
+    def test_retry_failed(self):
+        Task.objects.create(name='assign-delivery-crew', kwargs={'order_id': 0}, status=Task.FAILED, attempts=5,
+                            run_after=timezone.now())
+        out = io.StringIO()
+        call_command('run_worker', burst=True, retry_failed=True, threads=1, stdout=out)
+        self.assertIn('Queued 1 failed task(s) again', out.getvalue())
+        self.assertFalse(Task.objects.exists())
@@ -1,5 +1,206 @@
-from rest_framework.throttling import UserRateThrottle
+import functools
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
 
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.settings import api_settings
+from rest_framework.throttling import AnonRateThrottle, SimpleRateThrottle, UserRateThrottle
 
-class TenCallsPerMinute(UserRateThrottle):
-    scope = 'ten'
\ No newline at end of file
+
+class ThrottleStore:
+    """
+    Shared request counters for SlidingWindowThrottle, one per (key, window).
+
+    Implementations must make `incr` atomic across every worker that shares the store.
+    """
+
+    def incr(self, key, window, ttl):
+        """Adds one to the counter of `window` and returns (that counter, the previous window's counter)."""
+        raise NotImplementedError
+
+    def decr(self, key, window):
+        """Takes back a request that was refused after it was counted."""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class SQLiteThrottleStore(ThrottleStore):
+    """
+    Counters in a small SQLite file that every worker on the host opens, so limits hold across
+    gunicorn workers without running another service. One upsert per request; expired windows
+    are purged now and then.
+    """
+    purge_probability = 0.001
+
+    def __init__(self, path, timeout=5):
+        self.path = str(path)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def connection(self):
+        # One connection per thread and process; a forked worker never reuses its parent's
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            local.connection.execute('PRAGMA journal_mode=WAL')
+            local.connection.execute('PRAGMA synchronous=NORMAL')
+            local.connection.execute(
+                'CREATE TABLE IF NOT EXISTS throttle ('
+                ' key TEXT NOT NULL, window INTEGER NOT NULL, count INTEGER NOT NULL, expires REAL NOT NULL,'
+                ' PRIMARY KEY (key, window)) WITHOUT ROWID'
+            )
+            local.pid = os.getpid()
+        return local.connection
+
+    def incr(self, key, window, ttl):
+        connection = self.connection()
+        now = time.time()
+        if random.random() < self.purge_probability:
+            connection.execute('DELETE FROM throttle WHERE expires < ?', (now,))
+        current, = connection.execute(
+            'INSERT INTO throttle (key, window, count, expires) VALUES (?, ?, 1, ?) '
+            'ON CONFLICT (key, window) DO UPDATE SET count = count + 1 RETURNING count',
+            (key, window, now + ttl),
+        ).fetchone()
+        previous = connection.execute('SELECT count FROM throttle WHERE key = ? AND window = ?', (key, window - 1)).fetchone()
+        return current, previous[0] if previous else 0
+
+    def decr(self, key, window):
+        self.connection().execute('UPDATE throttle SET count = count - 1 WHERE key = ? AND window = ?', (key, window))
+
+    def clear(self):
+        self.connection().execute('DELETE FROM throttle')
+
+
+class CacheThrottleStore(ThrottleStore):
+    """
+    Counters in a Django cache. Shared and atomic with the Redis or Memcached backends
+    (e.g. an alias using django.core.cache.backends.redis.RedisCache); per process with locmem.
+    """
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def incr(self, key, window, ttl):
+        counter = f'throttle:{key}:{window}'
+        self.cache.add(counter, 0, ttl)
+        current = self.cache.incr(counter)
+        return current, self.cache.get(f'throttle:{key}:{window - 1}', 0)
+
+    def decr(self, key, window):
+        try:
+            self.cache.decr(f'throttle:{key}:{window}')
+        except ValueError:  # Expired in between
+            pass
+
+    def clear(self):
+        # Clears the whole cache: give the store its own alias if other entries must survive
+        self.cache.clear()
+
+
+@functools.cache
+def throttle_store():
+    """The store configured by THROTTLE_STORE = {'BACKEND': dotted path, 'OPTIONS': {...}}."""
+    config = getattr(settings, 'THROTTLE_STORE', {'BACKEND': 'LittleLemonAPI.throttles.CacheThrottleStore'})
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+
+
+@receiver(setting_changed)
+def reset_throttle_store(setting, **kwargs):
+    if setting == 'THROTTLE_STORE':
+        throttle_store.cache_clear()
+
+
+DURATIONS = {
+    's': 1, 'sec': 1, 'second': 1,
+    'm': 60, 'min': 60, 'minute': 60,
+    'h': 3600, 'hour': 3600,
+    'd': 86400, 'day': 86400,
+}
+
+
+def parse_rate(rate):
+    """
+    '10/minute' -> (10, 60). Units are s/sec/second, m/min/minute, h/hour and d/day, optionally
+    with a count ('100/15min'). Anything else is a configuration error, not a silent guess.
+    """
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d*)\s*([a-z]+)\s*', rate or '')
+    if not match or match[3] not in DURATIONS:
+        raise ImproperlyConfigured(f'Invalid throttle rate {rate!r}; expected e.g. "10/minute" or "100/15min".')
+    return int(match[1]), int(match[2] or 1) * DURATIONS[match[3]]
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """
+    Sliding-window-counter rate limiting on the shared THROTTLE_STORE.
+
+    Instead of a list of request timestamps per client, each client has one counter per fixed
+    window; the rate over the last `duration` seconds is estimated as this window's count plus the
+    previous window's count weighted by how much of it still overlaps. That is O(1) in time and
+    space per request, and a single atomic increment in the store.
+    """
+
+    @property
+    def THROTTLE_RATES(self):
+        # Looked up per request instead of once at import, so overridden settings (tests, load runs) apply
+        return api_settings.DEFAULT_THROTTLE_RATES
+
+    def parse_rate(self, rate):
+        if rate is None:
+            return None, None
+        return parse_rate(rate)
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        self.window, offset = divmod(self.now, self.duration)
+        self.window = int(self.window)
+        self.overlap = 1 - offset / self.duration  # Share of the previous window still inside the sliding one
+
+        store = throttle_store()
+        self.current, self.previous = store.incr(self.key, self.window, ttl=2 * self.duration)
+        if self.previous * self.overlap + self.current <= self.num_requests:
+            return True
+        store.decr(self.key, self.window)  # Refused requests do not use up the allowance
+        self.current -= 1
+        return self.throttle_failure()
+
+    def wait(self):
+        # Seconds until one more request fits, as the previous window slides out of the estimate
+        room = self.num_requests - self.current - 1
+        if room >= 0:
+            return max(0.0, self.overlap - room / self.previous) * self.duration if self.previous else 0.0
+        # This window alone is full: wait for it to end and to slide far enough out in turn
+        return (self.overlap + max(0.0, 1 - (self.num_requests - 1) / self.current)) * self.duration
+
+
+class SharedAnonRateThrottle(SlidingWindowThrottle, AnonRateThrottle):
+    pass
+
+
+class SharedUserRateThrottle(SlidingWindowThrottle, UserRateThrottle):
+    pass
+
+
+class TenCallsPerMinute(SharedUserRateThrottle):
+    scope = 'ten'
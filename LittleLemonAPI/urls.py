@@ -4,6 +4,7 @@ from .views import AssignDeliveryView, ManagerGroupView,CartView, OrderDetailVie
 
 urlpatterns = [
     path('menu-items/', views.MenuItemsView.as_view()),
+    path('menu-items/import/', views.MenuImportView.as_view(), name='menu-import'),
     path('menu-items/<int:pk>/', views.SingleItemView.as_view()),
     path('create-category/', views.CreateCategory.as_view()),
     path('categories/', views.CategoryListView.as_view()),
@@ -15,7 +16,10 @@ urlpatterns = [
     path('cart/menu-items/', views.CartView.as_view(), name='cart-menu-items'),
     path('cart/menu-items/<int:item_id>/', CartView.as_view(), name='cart-item-delete'),
     path('orders/', OrderListView.as_view(), name='order-list'),  # for listing and posting orders
-    path('orders/<int:pk>/', OrderListView.as_view(), name='order-detail'),  # for updating a single order
-    path('orders/<int:pk>/', OrderDetailView.as_view(), name='order_detail'),
+    path('orders/export/', views.OrderExportView.as_view(), name='order-export'),
+    path('orders/events/', views.OrderEventsView.as_view(), name='order-events'),  # served as a stream under ASGI
+    path('orders/<int:pk>/', OrderDetailView.as_view(), name='order-detail'),  # for reading, updating and deleting a single order
+    path('analytics/sales/', views.SalesAnalyticsView.as_view(), name='sales-analytics'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
 
 ]
@@ -2,50 +2,112 @@ from datetime import date
 from django.shortcuts import render,get_object_or_404
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group, User
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import Count, Max
+from django.http import HttpResponse, StreamingHttpResponse
 from .models import Category, MenuItem, Cart, Order, OrderItem
 from rest_framework import generics
 from rest_framework.views import APIView, Response, status
-from rest_framework.permissions import IsAdminUser, AllowAny, IsAuthenticated,BasePermission
+from rest_framework.renderers import JSONRenderer
+from rest_framework.permissions import IsAdminUser, AllowAny, IsAuthenticated
 from .models import MenuItem
-from .serializers import MenuItemSerializer, CategorySerializer,CartSerializer, OrderSerializer
+from .filters import MenuItemFilter
+from .serializers import MenuItemSerializer, CategorySerializer,CartSerializer, CartOperationSerializer, OrderSerializer, OrderExportQuerySerializer, SalesReportQuerySerializer, SalesReportRowSerializer
 from rest_framework import permissions
 from django.core.paginator import Paginator, EmptyPage
 from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.filters import OrderingFilter
+from django_filters.rest_framework import DjangoFilterBackend
 from .throttles import TenCallsPerMinute  # import your throttle
+from .pagination import KeysetPagination, KeysetPaginationViewMixin
+from .catalog import cache_catalog_response, catalog_cache, catalog_validators
+from .conditional import conditional_get
+from .compiled import compile_serializer, fast_serializers_enabled
+from . import analytics, events, exports, imports, metrics, tasks
+from .roles import DELIVERY_CREW, MANAGERS, HasRoleForMethod, IsManager, IsManagerOrReadOnly, has_role, is_delivery_crew, is_manager
 
 
-# Custom permission class
-class GetPermission(BasePermission):
-    def has_permission(self, request, view):
-        # Allow GET requests to everyone
-        if request.method == 'GET':
-            return True
-        
-        # Only allow POST if the user is authenticated and either a Manager or Admin
-        user = request.user # Gets the logged in user
-        return user.is_authenticated and (user.groups.filter(name="Managers").exists() or user.is_superuser)
+# Applies the serializer's declared select_related/prefetch_related to generic view querysets
+class EagerLoadingViewMixin:
+    def get_queryset(self):
+        return self.get_serializer_class().setup_eager_loading(super().get_queryset())
 
 
 
 #view to render menu items
-class MenuItemsView(generics.ListCreateAPIView):
+class MenuItemsView(KeysetPaginationViewMixin, EagerLoadingViewMixin, generics.ListCreateAPIView):
     queryset = MenuItem.objects.all()
     serializer_class = MenuItemSerializer
-    search_fields = ['category__title']
-    ordering_fields = ['price', 'inventory']
-    permission_classes = [GetPermission]
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_class = MenuItemFilter  # ?category=<slug>&featured=&price_min=&price_max=&search=
+    ordering_fields = ['price', 'title', 'id']
+    ordering = ['id']  # Stable pages when the client does not ask for an ordering
+    permission_classes = [IsManagerOrReadOnly]  # Reads for everyone, writes for Managers or Admin
+
+    def get_cursor_ordering(self):
+        # ?pagination=cursor pages by id, or by (field, id) when the client orders by price or title
+        ordering = self.request.query_params.get('ordering', '')
+        if ordering.lstrip('-') in ('price', 'title'):
+            descending = ordering.startswith('-')
+            return (ordering, '-id' if descending else 'id')
+        return ('id',)
+
+    @conditional_get(catalog_validators)
+    @cache_catalog_response
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        if not fast_serializers_enabled():
+            return super().list(request, *args, **kwargs)
+        # FAST_SERIALIZERS: page through values() rows and render them without serializer instances
+        compiled = compile_serializer(self.get_serializer_class())
+        page = self.paginate_queryset(compiled.rows(self.filter_queryset(self.get_queryset())))
+        return self.get_paginated_response(compiled.serialize(page))
 
 
  
 # Single view to update 
-class SingleItemView(generics.RetrieveUpdateDestroyAPIView):
+class SingleItemView(EagerLoadingViewMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = MenuItem.objects.all()
     serializer_class = MenuItemSerializer
-    permission_classes = [GetPermission]
+    permission_classes = [IsManagerOrReadOnly]  # Reads for everyone, writes for Managers or Admin
+
+    @conditional_get(catalog_validators)
+    @cache_catalog_response
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
  
 
 
+# Bulk create or update of categories and menu items from JSON or CSV, matched on slugs
+class MenuImportView(APIView):
+    permission_classes = [IsAuthenticated, IsManager]
+    throttle_classes = [TenCallsPerMinute]
+    max_rows = 5000  # Per section and request; larger menus go through `manage.py import_menu`
+
+    def post(self, request):
+        # JSON: {"categories": [...], "menu_items": [...]}; multipart: CSV files named categories and menu_items
+        sections = {}
+        for section in ('categories', 'menu_items'):
+            if section in request.FILES:
+                sections[section] = imports.read_csv(request.FILES[section])
+            else:
+                rows = request.data.get(section, []) if hasattr(request.data, 'get') else None
+                if not isinstance(rows, list):
+                    return Response({"detail": f"'{section}' must be a list of rows."}, status=status.HTTP_400_BAD_REQUEST)
+                sections[section] = rows
+            if len(sections[section]) > self.max_rows:
+                return Response({"detail": f"At most {self.max_rows} {section} rows per request."}, status=status.HTTP_400_BAD_REQUEST)
+
+        dry_run = request.query_params.get('dry_run') in ('1', 'true')
+        report = imports.import_menu(**sections, dry_run=dry_run)
+        return Response(report, status=status.HTTP_200_OK)
+
+
+
 # View to create categories
 class CreateCategory(APIView):
     throttle_classes = [TenCallsPerMinute]
@@ -63,9 +125,11 @@ class CategoryListView(APIView):
     permission_classes = [AllowAny]  # Allow any user to access this view
     throttle_classes = [TenCallsPerMinute]
 
+    @conditional_get(catalog_validators)
+    @cache_catalog_response
     def get(self, request):
-        categories = Category.objects.all()  # Fetch all categories
-        if categories.exists():  # Check if there are any categories
+        categories = list(CategorySerializer.setup_eager_loading(Category.objects.all()))  # Fetch all categories
+        if categories:  # Check if there are any categories
             serializer = CategorySerializer(categories, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)  # Return serialized data with 200 status
         else:
@@ -75,14 +139,15 @@ class CategoryListView(APIView):
 
 # view to add user to Managers group
 class ManagerGroupView(APIView):
-    permission_classes = [IsAuthenticated] # Only allow authenticated users to access this view
+    permission_classes = [IsAuthenticated, IsManager] # Only Managers or Admin can manage the Managers group
     throttle_classes = [TenCallsPerMinute]
+    permission_denied_messages = {
+        'GET': "You do not have permission to view this.",
+        'POST': "You do not have permission to add users.",
+        'DELETE': "You do not have permission to remove users.",
+    }
 
     def get(self, request):
-        user = request.user  # Get the current logged-in user
-
-        if not (user.groups.filter(name="Managers").exists() or user.is_superuser): # Check if the user is either a superuser (admin) or belongs to the 'Manager' group
-            return Response({"detail": "You do not have permission to view this."}, status=status.HTTP_403_FORBIDDEN)  # If not authorized, return 403 Forbidden
         try:
             manager_group = Group.objects.get(name="Managers")  # Try to get the 'Managers' group
         except Group.DoesNotExist:
@@ -93,10 +158,6 @@ class ManagerGroupView(APIView):
 
 
     def post(self, request):
-        user = request.user  # Get the current logged-in user
-
-        if not (user.groups.filter(name="Managers").exists() or user.is_superuser):  # Only allow superusers or managers to add users to the group
-            return Response({"detail": "You do not have permission to add users."}, status=status.HTTP_403_FORBIDDEN)
         user_id = request.data.get("user_id")  # Extract the user_id from the request body
         if not user_id:
             return Response({"detail": "Missing 'user_id' in payload."}, status=status.HTTP_400_BAD_REQUEST) # If no user_id is provided, return 400 Bad Request
@@ -107,17 +168,13 @@ class ManagerGroupView(APIView):
             return Response({"detail": "User not found."}, status=status.HTTP_404_NOT_FOUND)   # If the user does not exist, return 404
         except Group.DoesNotExist:
             return Response({"detail": "Managers group does not exist."}, status=status.HTTP_404_NOT_FOUND)  # If the group does not exist, return 404
-        if target_user.groups.filter(name="Managers").exists():        # Check if the user is already in the group
+        if has_role(target_user, MANAGERS):        # Check if the user is already in the group
             return Response({"message": "User is already in the Managers group."}, status=status.HTTP_200_OK) # If so, return a message saying no action is needed
         target_user.groups.add(manager_group) # Add the user to the Managers group
         return Response({"message": "User added to Managers group."}, status=status.HTTP_201_CREATED)        # Return success message with 201 Created status
 
 
     def delete(self, request, user_id=None):
-        user = request.user  # Get the current logged-in user
-
-        if not (user.groups.filter(name="Manager").exists() or user.is_superuser): # Only allow superusers or managers to remove users from the group
-            return Response({"detail": "You do not have permission to remove users."}, status=status.HTTP_403_FORBIDDEN)
         if not user_id:
             return Response({"detail": "Missing user_id in URL."}, status=status.HTTP_400_BAD_REQUEST) # If no user_id is provided in the URL, return 400 Bad Request
         try:
@@ -127,7 +184,7 @@ class ManagerGroupView(APIView):
             return Response({"detail": "User not found."}, status=status.HTTP_404_NOT_FOUND) # If the user does not exist, return 404
         except Group.DoesNotExist:
             return Response({"detail": "Managers group does not exist."}, status=status.HTTP_404_NOT_FOUND) # If the group does not exist, return 404
-        if target_user.groups.filter(name="Managers").exists():# Check if the user is in the group
+        if has_role(target_user, MANAGERS):# Check if the user is in the group
             target_user.groups.remove(manager_group)# Remove the user from the group
             return Response({"message": "User removed from Managers group."}, status=status.HTTP_200_OK) # Return success message
         return Response({"message": "User not in Managers group."}, status=status.HTTP_404_NOT_FOUND) # If the user was not in the group, return a 404 message
@@ -142,13 +199,15 @@ class ManagerGroupView(APIView):
 
 # view to add user to delivery group by manager or admin
 class AssignDeliveryView(APIView):
+    permission_classes = [IsAuthenticated, IsManager]  # Restrict every method to Manager or Admin only
     throttle_classes = [TenCallsPerMinute]
+    permission_denied_messages = {
+        'GET': "You do not have permission to view this.",
+        'POST': "You do not have permission to add users.",
+        'DELETE': "You do not have permission to remove users.",
+    }
 
     def get(self, request):
-        # Restrict GET to Manager or Admin only
-        if not (request.user.groups.filter(name='Managers').exists() or request.user.is_superuser):
-            return Response({"detail": "You do not have permission to view this."}, status=status.HTTP_403_FORBIDDEN)
-
         try:
             delivery_group = Group.objects.get(name="Delivery Crew")  # Get the Delivery group
         except Group.DoesNotExist:
@@ -163,10 +222,6 @@ class AssignDeliveryView(APIView):
         return Response({'delivery': delivery_data})
 
     def post(self, request, user_id=None):
-        # Restrict POST to Manager or Admin only
-        if not (request.user.groups.filter(name='Managers').exists() or request.user.is_superuser):
-            return Response({"detail": "You do not have permission to add users."}, status=status.HTTP_403_FORBIDDEN)
-
         if not user_id:
             return Response({"detail": "Missing 'user_id' in URL."}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -178,17 +233,13 @@ class AssignDeliveryView(APIView):
         except Group.DoesNotExist:
             return Response({"detail": "Delivery group does not exist."}, status=status.HTTP_404_NOT_FOUND)
 
-        if user.groups.filter(name="Delivery Crew").exists():  # Check if the user is already in the Delivery Crew
+        if is_delivery_crew(user):  # Check if the user is already in the Delivery Crew
             return Response({"message": "User is already in the Delivery Crew."}, status=status.HTTP_200_OK)
 
         user.groups.add(delivery_group)  # Add the user to the Delivery Crew group
         return Response({"message": "User added to Delivery group."}, status=status.HTTP_201_CREATED)
 
     def delete(self, request, user_id=None):
-        # Restrict DELETE to Manager or Admin only
-        if not (request.user.groups.filter(name='Managers').exists() or request.user.is_superuser):
-            return Response({"detail": "You do not have permission to remove users."}, status=status.HTTP_403_FORBIDDEN)
-
         if not user_id:
             return Response({"detail": "Missing 'user_id' in URL."}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -200,7 +251,7 @@ class AssignDeliveryView(APIView):
         except Group.DoesNotExist:
             return Response({"detail": "Delivery Crew does not exist."}, status=status.HTTP_404_NOT_FOUND)
 
-        if user.groups.filter(name="Delivery Crew").exists():  # Check if user is in the Delivery Crew group
+        if is_delivery_crew(user):  # Check if user is in the Delivery Crew group
             user.groups.remove(delivery_group)  # Remove the user from the group
             return Response({"message": "User removed from Delivery Crew."}, status=status.HTTP_200_OK)
 
@@ -211,15 +262,22 @@ class AssignDeliveryView(APIView):
 class CartView(APIView):
     permission_classes = [IsAuthenticated]  # Ensure the user is authenticated
     throttle_classes = [TenCallsPerMinute]
+    max_batch_size = 100  # Operations accepted by one batch request
 
     def get(self, request):
         user = request.user  # Retrieves authentcated user from the token
-        cart_items = Cart.objects.filter(user=user)  # Fetch cart items for the authenticated user
+        cart_items = CartSerializer.setup_eager_loading(Cart.objects.filter(user=user))  # Fetch cart items for the authenticated user
+        if fast_serializers_enabled():
+            compiled = compile_serializer(CartSerializer)
+            return Response(compiled.serialize(compiled.rows(cart_items)), status=status.HTTP_200_OK)
         serialized = CartSerializer(cart_items, many=True)  # Serialize the cart items
         return Response(serialized.data, status=status.HTTP_200_OK)  # Return serialized data with 200 status
 
 
     def post(self, request):
+        if isinstance(request.data, list):  # A list body is a batch of add/set/remove operations
+            return self.post_batch(request)
+
         serializer = CartSerializer(data=request.data, context={'request': request})  # Inject user into serializer context
         if serializer.is_valid():  # Check if the data is valid
             serializer.save()
@@ -227,6 +285,33 @@ class CartView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)  # Return errors with 400 status
 
 
+    def post_batch(self, request):
+        if len(request.data) > self.max_batch_size:
+            return Response({"detail": f"A batch can hold at most {self.max_batch_size} operations."}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = CartOperationSerializer(data=request.data, many=True)
+        valid = serializer.is_valid()
+        errors = [{} for _ in request.data]  # One entry per operation, empty when it is valid
+        if not valid:
+            # DRF reports list errors either as a list or as a dict keyed by position
+            reported = serializer.errors
+            for index, error in (reported.items() if isinstance(reported, dict) else enumerate(reported)):
+                errors[index] = error
+
+        # Every referenced menu item is checked with a single query
+        operations = serializer.validated_data if valid else []
+        menuitems = MenuItem.objects.in_bulk({operation['menuitem'] for operation in operations})
+        for index, operation in enumerate(operations):
+            if operation['menuitem'] not in menuitems:
+                errors[index] = {"menuitem": [f"Invalid pk \"{operation['menuitem']}\" - object does not exist."]}
+
+        if any(errors):  # Nothing is applied unless every operation is valid
+            return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = Cart.objects.apply_batch(request.user, operations, menuitems)
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+
     def delete(self, request, item_id):
         try:
             item = Cart.objects.get(user=request.user, menuitem_id=item_id)
@@ -237,81 +322,208 @@ class CartView(APIView):
 
 
 
+# Conditional GET validators for the order list: one aggregate over the orders the user can see
+def order_list_validators(view, request, *args, **kwargs):
+    stats = view.get_orders(request.user).aggregate(count=Count('id'), modified=Max('updated_at'))
+    return order_list_stamp(request, stats)
+
+
+def order_list_stamp(request, stats):
+    # Orders embed their menu items, so a menu change (a catalog version bump) changes the validators too
+    modified = max(filter(None, (stats['modified'], catalog_cache.last_modified())), default=None)
+    stamp = stats['modified'].timestamp() if stats['modified'] else 0
+    etag = f"orders-{stats['count']}-{stamp}-catalog-{catalog_cache.version()}-{request.accepted_renderer.format}"
+    return etag, modified
+
+
+
 # Order view
 class OrderListView(APIView):
     permission_classes = [IsAuthenticated]
     throttle_classes = [TenCallsPerMinute]
 
-    def get(self, request):
-        user = request.user
+    def get_orders(self, user):
+        # Resolved once per request; the conditional GET check and the listing share it
+        if not hasattr(self, '_orders'):
+            if is_manager(user):
+                # Managers can see all orders (with or without delivery crew)
+                self._orders = Order.objects.all().order_by('-date')
 
-        if user.groups.filter(name="Managers").exists() or user.is_superuser:
-            # Managers can see all orders (with or without delivery crew)
-            orders = Order.objects.all().order_by('-date')
+            elif is_delivery_crew(user):
+                # Delivery crews can only see orders assigned to them
+                self._orders = Order.objects.filter(delivery_crew=user).order_by('-date')
 
-        elif user.groups.filter(name="Delivery Crew").exists():
-            # Delivery crews can only see orders assigned to them
-            orders = Order.objects.filter(delivery_crew=user).order_by('-date')
+            else:
+                # Customers (non-Manager and non-DeliveryCrew) can only see their own orders
+                self._orders = Order.objects.filter(user=user).order_by('-date')
+        return self._orders
 
+    @conditional_get(order_list_validators)
+    def get(self, request):
+        if fast_serializers_enabled():
+            # FAST_SERIALIZERS: values() rows for the orders, one more query for all their lines
+            compiled = compile_serializer(OrderSerializer)
+            orders, serialize = compiled.rows(self.get_orders(request.user)), compiled.serialize
         else:
-            # Customers (non-Manager and non-DeliveryCrew) can only see their own orders
-            orders = Order.objects.filter(user=user).order_by('-date')
+            orders = OrderSerializer.setup_eager_loading(self.get_orders(request.user))  # Load order lines and menu items in bulk
+
+            def serialize(objects):
+                return OrderSerializer(objects, many=True).data
+
+        # ?pagination=cursor pages through the orders newest first on (date, id) instead of returning them all
+        if KeysetPagination.is_requested(request):
+            paginator = KeysetPagination(ordering=('-date', '-id'))
+            page = paginator.paginate_queryset(orders, request, view=self)
+            return paginator.get_paginated_response(serialize(page))
 
         # Serialize the orders and return them
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(serialize(orders), status=status.HTTP_200_OK)
 
 
     def post(self, request):
         user = request.user  # Retrieves authenticated user from the token
-        cart_items = Cart.objects.filter(user=user)  # Only fetch the items belonging to the authenticated user.
-
-        if not cart_items.exists():
-            return Response({"error": "Your cart is empty."}, status=400)  # Check if the cart is empty and returns error if there are no items in the cart
-
-        total = 0  # This will accumulate the total price of the order as we iterate through the cart items.
-
-        # Create the order and set the current date
-        order = Order.objects.create(
-            user=user,
-            total=0,  # Initially set to 0; will be updated later
-            date=date.today()  # Set the date to today
-        )
-
-        for item in cart_items:
-            item_total = item.menuitem.price * item.quantity  # Calculates the total price for the item
-
-            # Create an OrderItem for each cart item, which is linked to the Order
-            OrderItem.objects.create(
-                order=order,
-                menuitem=item.menuitem,
-                quantity=item.quantity,
-                unit_price=item.menuitem.price,
-                price=item_total
-            )
 
-            total += item_total  # Update the total with the item price
+        # The whole checkout runs in one transaction so a failure never leaves a half-built order or a cleared cart behind
+        with transaction.atomic():
+            # One joined query for the cart rows and their menu items, locked until the order is written
+            cart_items = list(
+                Cart.objects.select_related('menuitem').select_for_update(of=('self',)).filter(user=user)
+            )
 
-        # Update the order's total price
-        order.total = total
-        order.save()
+            if not cart_items:
+                return Response({"error": "Your cart is empty."}, status=400)  # Check if the cart is empty and returns error if there are no items in the cart
+
+            # Price every line up front so the order is created with its final total
+            lines = []
+            total = 0
+            for item in cart_items:
+                unit_price = item.menuitem.price
+                item_total = unit_price * item.quantity  # Calculates the total price for the item
+                lines.append((item, unit_price, item_total))
+                total += item_total
+
+            order = Order.objects.create(
+                user=user,
+                total=total,
+                date=date.today()  # Set the date to today
+            )
 
-        # Clear the cart after successfully placing the order
-        cart_items.delete()
+            # Write every order line with a single bulk insert
+            order_items = OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order,
+                    menuitem=item.menuitem,
+                    quantity=item.quantity,
+                    unit_price=unit_price,
+                    price=item_total
+                )
+                for item, unit_price, item_total in lines
+            ])
+
+            # Clear the cart in the same transaction as the order
+            Cart.objects.filter(pk__in=[item.pk for item in cart_items]).delete()
+
+            # Sales rollups (and crew assignment, if enabled) are left to the task worker; the tasks commit with the order
+            tasks.enqueue_order_followups(order, order_items)
+            events.publish_order_changes(order)  # order-created, sent once the transaction commits
 
         return Response({"message": "Order placed", "order_id": order.id}, status=201)
 
 
-    def put(self, request, pk):
-        # Ensure that the user is a Manager or Admin
-        if not (request.user.groups.filter(name='Managers').exists() or request.user.is_superuser):
-            return Response({"detail": "You do not have permission to edit this order."}, status=status.HTTP_403_FORBIDDEN)
 
+# Columns of the single query behind the order detail fast path: the order, LEFT JOINed to its lines and their menu items
+ORDER_DETAIL_COLUMNS = (
+    'id', 'user_id', 'delivery_crew_id', 'status', 'total', 'date',
+    'orderitem__quantity', 'orderitem__unit_price', 'orderitem__price',
+    'orderitem__menuitem__id', 'orderitem__menuitem__title', 'orderitem__menuitem__price', 'orderitem__menuitem__featured',
+)
+
+
+def money(value):
+    # Same text as a DRF DecimalField with two decimal places renders
+    return f'{value:.2f}'
+
+
+def order_detail_data(pk):
+    """
+    Loads one order with its lines and their menu items in a single values() query and returns
+    the same structure OrderSerializer renders, without instantiating any serializer.
+    Returns None when the order does not exist.
+    """
+    return order_detail_from_rows(list(order_detail_rows(pk)))
+
+
+def order_detail_rows(pk):
+    return Order.objects.filter(pk=pk).order_by('orderitem__id').values_list(*ORDER_DETAIL_COLUMNS)
+
+
+def order_detail_from_rows(rows):
+    if not rows:
+        return None
+    order_id, user_id, delivery_crew_id, order_status, total, order_date = rows[0][:6]
+    return {
+        'id': order_id,
+        'user': user_id,
+        'delivery_crew': delivery_crew_id,
+        'status': order_status,
+        'total': money(total),
+        'date': order_date.isoformat(),
+        'orderitem_set': [
+            {
+                'menuitem': {'id': menuitem_id, 'title': title, 'price': money(price), 'featured': featured},
+                'quantity': quantity,
+                'unit_price': money(unit_price),
+                'price': money(line_price),
+            }
+            for *_, quantity, unit_price, line_price, menuitem_id, title, price, featured in rows
+            if menuitem_id is not None  # An order without lines still comes back as one row of NULLs
+        ],
+    }
+
+
+def can_view_order(user, data):
+    # The customer who placed it, the delivery crew member assigned to it, and managers can read an order
+    return (
+        data['user'] == user.pk
+        or (data['delivery_crew'] == user.pk and is_delivery_crew(user))
+        or is_manager(user)
+    )
+
+
+# Retrieves, updates or deletes a single order
+class OrderDetailView(APIView):
+    permission_classes = [IsAuthenticated, HasRoleForMethod]
+    throttle_classes = [TenCallsPerMinute]
+    # Editing orders is limited to Managers or Admin, except for Delivery Crew updating status
+    role_requirements = {
+        'PUT': (MANAGERS,),
+        'PATCH': (MANAGERS, DELIVERY_CREW),
+        'DELETE': (MANAGERS,),
+    }
+    permission_denied_messages = {
+        'PUT': "You do not have permission to edit this order.",
+        'PATCH': "You do not have permission to edit this order.",
+        'DELETE': "You do not have permission to edit this order.",
+    }
+
+    def get(self, request, pk):
+        data = order_detail_data(pk)  # One query, no serializer
+        if data is None:
+            return Response({"detail": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        if not can_view_order(request.user, data):
+            return Response({"detail": "You do not have permission to view this order."}, status=status.HTTP_403_FORBIDDEN)
+        return Response(data, status=status.HTTP_200_OK)
+
+
+    def put(self, request, pk):
         # Try to get the order from the database
         try:
-            order = Order.objects.get(pk=pk)
+            order = OrderSerializer.setup_eager_loading(Order.objects.all()).get(pk=pk)
         except Order.DoesNotExist:
             return Response({"detail": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
+        before = events.order_state(order)  # Compared after saving to tell clients what changed
+        figures = analytics.order_figures(order)  # And to move the order in the sales rollups
 
         # Get the delivery crew user ID from the request data (if any)
         delivery_crew_id = request.data.get('Delivery Crew')
@@ -321,7 +533,7 @@ class OrderListView(APIView):
             try:
                 delivery_crew = User.objects.get(pk=delivery_crew_id)
                 # Ensure the selected user is in the 'DeliveryCrew' group
-                if not delivery_crew.groups.filter(name="Delivery Crew").exists():
+                if not is_delivery_crew(delivery_crew):
                     return Response({"error": "The selected user is not in the Delivery Crew group."}, status=status.HTTP_400_BAD_REQUEST)
 
                 order.delivery_crew = delivery_crew  # Assign the delivery crew to the order
@@ -332,7 +544,10 @@ class OrderListView(APIView):
         # Update order with any other fields in the request data
         serializer = OrderSerializer(order, data=request.data)
         if serializer.is_valid():
-            serializer.save()  # Save the updated order
+            with transaction.atomic():
+                serializer.save()  # Save the updated order
+                analytics.update_order(order, figures)
+            events.publish_order_changes(order, before)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         # If serializer validation fails, return errors
@@ -343,21 +558,26 @@ class OrderListView(APIView):
         user = request.user
 
         try:
-            order = Order.objects.get(pk=pk)
+            order = OrderSerializer.setup_eager_loading(Order.objects.all()).get(pk=pk)
         except Order.DoesNotExist:
             return Response({"detail": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
+        before = events.order_state(order)
+        figures = analytics.order_figures(order)
 
         # === MANAGER / ADMIN ===
-        if user.groups.filter(name='Managers').exists() or user.is_superuser:
+        if is_manager(user):
             # Managers can update any field partially
             serializer = OrderSerializer(order, data=request.data, partial=True)
             if serializer.is_valid():
-                serializer.save()
+                with transaction.atomic():
+                    serializer.save()
+                    analytics.update_order(order, figures)
+                events.publish_order_changes(order, before)
                 return Response(serializer.data, status=status.HTTP_200_OK)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
         # === DELIVERY CREW ===
-        elif user.groups.filter(name='Delivery Crew').exists():
+        elif is_delivery_crew(user):
             # Delivery Crew can only update 'status' on their assigned orders
             if order.delivery_crew != user:
                 return Response({"detail": "This order is not assigned to you."}, status=status.HTTP_403_FORBIDDEN)
@@ -378,6 +598,7 @@ class OrderListView(APIView):
             # Update and save
             order.status = bool(status_value)
             order.save()
+            events.publish_order_changes(order, before)
             return Response({"detail": "Order status updated."}, status=status.HTTP_200_OK)
 
         # === CUSTOMERS ===
@@ -387,9 +608,6 @@ class OrderListView(APIView):
 
 
     def delete(self, request, pk):
-        if not (request.user.groups.filter(name='Managers').exists() or request.user.is_superuser): # Restrict DELETE access to Manager or Admin only
-            return Response({"detail": "You do not have permission to edit this order."}, status=status.HTTP_403_FORBIDDEN)
-
         try:
             order = Order.objects.get(pk=pk)  # Get the order to delete
             order.delete()  # Delete the order
@@ -399,37 +617,61 @@ class OrderListView(APIView):
 
 
 
+# Live order events for the current user (events.py). The stream itself is served by the ASGI application
+# (async_views.OrderEventsView); this view carries its authentication, permissions and throttling
+class OrderEventsView(APIView):
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [TenCallsPerMinute]
+    renderer_classes = [JSONRenderer, events.EventStreamRenderer]
 
+    def get(self, request):
+        # Under WSGI a stream would hold a worker thread for as long as the client stays connected
+        return Response({"detail": "Order events are only streamed by the ASGI application."},
+                        status=status.HTTP_501_NOT_IMPLEMENTED)
 
-# retrieves order
-class OrderDetailView(APIView):
-    permission_classes = [IsAuthenticated]
+
+
+# Streams every order and its lines for accounting, NDJSON by default or CSV with ?output=csv
+class OrderExportView(APIView):
+    permission_classes = [IsAuthenticated, IsManager]
     throttle_classes = [TenCallsPerMinute]
+    chunk_size = 2000  # Orders held in memory at a time, however long the export
 
-    def get(self, request, order_id):
-        try:
-            order = Order.objects.get(id=order_id)
-        except Order.DoesNotExist:
-            return Response({"error": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
-
-        if order.user != request.user:
-            return Response({"error": "You do not have permission to view this order."}, status=status.HTTP_403_FORBIDDEN)
-
-        order_items = OrderItem.objects.filter(order=order)
-        data = {
-            "order_id": order.id,
-            "total": order.total,
-            "date": order.date,
-            "items": [
-                {
-                    "menuitem": item.menuitem.title,
-                    "quantity": item.quantity,
-                    "unit_price": item.unit_price,
-                    "price": item.price,
-                }
-                for item in order_items
-            ]
-        }
-        return Response(data, status=status.HTTP_200_OK)
+    def get(self, request):
+        query = OrderExportQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = dict(query.validated_data)
+        output = params.pop('output')
+
+        orders = exports.iter_orders(exports.orders_for_export(**params), chunk_size=self.chunk_size)
+        lines = exports.export_lines(output, orders)
+        if isinstance(request._request, ASGIRequest):
+            lines = exports.aiter_lines(lines)  # Streamed as it is read, where a sync iterator would be buffered
+        response = StreamingHttpResponse(lines, content_type=exports.CONTENT_TYPES[output])
+        response['Content-Disposition'] = f'attachment; filename="orders.{output}"'
+        return response
 
 
+
+# Sales analytics for managers, served from the daily rollup tables
+class SalesAnalyticsView(APIView):
+    permission_classes = [IsAuthenticated, IsManager]
+    throttle_classes = [TenCallsPerMinute]
+
+    def get(self, request):
+        query = SalesReportQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        report = analytics.sales_report(**query.validated_data)
+        serializer = SalesReportRowSerializer(report, many=True)
+        return Response({"group_by": query.validated_data['group_by'], "results": serializer.data}, status=status.HTTP_200_OK)
+
+
+
+# Request metrics in the Prometheus text format, for a scraper holding a manager's token
+class MetricsView(APIView):
+    permission_classes = [IsAuthenticated, IsManager]
+
+    def get(self, request):
+        return HttpResponse(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)